@@ -0,0 +1,510 @@
+"""Benchmarks that run without a display.
+
+    python bench.py            # run everything
+    python bench.py codec      # just the snapshot codec
+    python bench.py inputs     # upstream input bytes, JSON every tick vs packed changes
+    python bench.py collision  # obstacle queries, linear scan vs grid
+    python bench.py bullets    # per-tick bullet update, objects vs BulletPool
+    python bench.py sim        # whole ticks per second as bullets and obstacles scale
+    python bench.py mapgen     # generate_obstacles time and success rate
+    python bench.py network    # loopback Server/Client round trip and throughput
+    python bench.py udp        # UDP events and state under simulated loss and stray packets
+
+    python bench.py --json results.json  # also write every result row as JSON
+
+Each row in the JSON file has a "benchmark" name plus that benchmark's
+parameters and measurements, so two runs can be diffed or plotted.
+Benchmarks that also check behaviour (udp) make the exit status 1 on a
+failed check.
+"""
+import contextlib
+import io
+import json
+import platform
+import random
+import sys
+import threading
+import time
+
+from bullet_pool import BulletPool
+from network import (FRAME, HANDSHAKE_ATTEMPTS, HANDSHAKE_TIMEOUT, PACKET, PACKET_EVENT, PKT_PAYLOAD,
+                     PROTOCOL_VERSION, Client, Peer, Server, SnapshotDecoder, SnapshotEncoder, UdpClient, UdpServer,
+                     encode_frame, encode_input_packet, free_port)
+from prediction import Predictor
+from sim import (WIDTH, HEIGHT, TICK_RATE, Bullet, Circle, GameState, Obstacle, Player, check_circle_rect_collision,
+                 check_collision, generate_obstacles, make_input, step)
+from spatial import SpatialGrid
+
+FRAMES = 300
+ACK_LAG = 6  # Ticks between a snapshot being sent and its ack arriving (~100 ms)
+QUERIES = 20000
+SIM_TICKS = 200
+MAPGEN_TRIALS = 200
+PINGS = 2000
+THROUGHPUT_SECONDS = 1.0
+INPUT_SECONDS = 60
+UDP_TICKS = 600
+UDP_EVENT_EVERY = 5  # Ticks between events sent by the host
+UDP_LATENCY = 0.02
+UDP_DRAIN_SECONDS = 3.0  # Longest wait for the last events after the stream stops
+
+results = []  # Every row recorded by the benchmarks run so far
+failures = []  # Checks that failed, reported by main()
+
+
+def record(benchmark, **row):
+    results.append(dict(benchmark=benchmark, **row))
+
+
+def fill_bullets(state, count, rng):
+    """Top the state up to `count` live bullets flying in random directions."""
+    while len(state.bullets) < count:
+        x, y = rng.uniform(0, WIDTH), rng.uniform(0, HEIGHT)
+        state.spawn_bullet(x, y, rng.uniform(0, WIDTH), rng.uniform(0, HEIGHT), rng.randint(0, 1))
+
+
+def record_frames(bullet_count, frames=FRAMES, seed=1):
+    """State dicts for `frames` consecutive ticks with a steady bullet count."""
+    rng = random.Random(seed)
+    state = GameState(obstacles=[])
+    states = []
+    for _ in range(frames):
+        fill_bullets(state, bullet_count, rng)
+        step(state, [None, None])
+        states.append(state.to_dict())
+    return states
+
+
+def bench_json(states):
+    start = time.perf_counter()
+    encoded = [encode_frame(s) for s in states]
+    encode_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for data in encoded:
+        json.loads(data[FRAME.size:])
+    decode_time = time.perf_counter() - start
+    return encoded, encode_time, decode_time
+
+
+def bench_binary(states, ack_lag):
+    """Encode/decode with acks arriving `ack_lag` ticks late (None = never ack)."""
+    encoder = SnapshotEncoder()
+    decoder = SnapshotDecoder()
+    encoded = []
+    encode_time = decode_time = 0.0
+    for s in states:
+        if ack_lag is not None and s["tick"] - ack_lag in decoder.history:
+            encoder.ack(s["tick"] - ack_lag)
+        start = time.perf_counter()
+        data = encoder.encode(s)
+        encode_time += time.perf_counter() - start
+        start = time.perf_counter()
+        decoder.decode(data)
+        decode_time += time.perf_counter() - start
+        encoded.append(data)
+    return encoded, encode_time, decode_time
+
+
+def bench_codec():
+    print("Snapshot codec: bytes and microseconds per frame")
+    print(f"{'bullets':>8} {'format':<8} {'bytes':>8} {'encode':>9} {'decode':>9}")
+    for bullet_count in (0, 10, 50, 200, 1000):
+        states = record_frames(bullet_count)
+        runs = [
+            ("json", bench_json(states)),
+            ("full", bench_binary(states, None)),
+            ("delta", bench_binary(states, ACK_LAG)),
+        ]
+        for name, (encoded, encode_time, decode_time) in runs:
+            size = sum(len(d) for d in encoded) / len(encoded)
+            encode_us = encode_time / len(encoded) * 1e6
+            decode_us = decode_time / len(encoded) * 1e6
+            print(f"{bullet_count:>8} {name:<8} {size:>8.0f} {encode_us:>9.1f} {decode_us:>9.1f}")
+            record("codec", bullets=bullet_count, format=name, bytes=size,
+                   encode_us=encode_us, decode_us=decode_us)
+
+
+def input_script(name, tick):
+    """Scripted local input for `tick`: idle, walking (turns every 0.5 s) or busy (also shoots)."""
+    if name == "idle":
+        return make_input()
+    phase = tick // 30 % 4
+    keys = {"left": phase == 0, "up": phase == 1, "right": phase == 2, "down": phase == 3}
+    if name == "busy":
+        keys["up"] = keys["up"] or tick // 7 % 2 == 0
+        return make_input(shoot=(tick % 800, 300) if tick % 20 == 0 else None, **keys)
+    return make_input(**keys)
+
+
+def bench_inputs():
+    print(f"Upstream input: one player at {TICK_RATE} Hz, acks {ACK_LAG} ticks late")
+    print(f"{'script':<8} {'format':<7} {'packets/s':>9} {'bytes/s':>8}")
+    ticks = INPUT_SECONDS * TICK_RATE
+    for name in ("idle", "walking", "busy"):
+        # Before: a JSON message every tick holding every unacked input
+        sent = 0
+        history = []
+        for tick in range(1, ticks + 1):
+            history.append(dict(input_script(name, tick), seq=tick))
+            unacked = history[-min(ACK_LAG + 1, 16):]
+            sent += len(encode_frame({"inputs": unacked, "ack": tick}))
+        rows = [("json", ticks, sent)]
+
+        predictor = Predictor(0, [])
+        packets = sent = 0
+        for tick in range(1, ticks + 1):
+            predictor.apply_local(input_script(name, tick))
+            if tick > ACK_LAG:
+                predictor.reconcile({"players": [predictor.player.to_dict()], "input_ack": tick - ACK_LAG})
+            packet = predictor.outgoing(tick)
+            if packet:
+                packets += 1
+                sent += len(encode_frame(packet))
+        rows.append(("packed", packets, sent))
+        for fmt, count, size in rows:
+            print(f"{name:<8} {fmt:<7} {count / INPUT_SECONDS:>9.1f} {size / INPUT_SECONDS:>8.0f}")
+            record("inputs", script=name, format=fmt, packets_per_second=count / INPUT_SECONDS,
+                   bytes_per_second=size / INPUT_SECONDS)
+
+
+def random_obstacles(count, rng):
+    """`count` obstacles at the default map's density (8 per 800x600 arena)."""
+    scale = (count / 8) ** 0.5
+    width, height = WIDTH * scale, HEIGHT * scale
+    obstacles = [
+        Obstacle(rng.uniform(0, width - 100), rng.uniform(0, height - 100),
+                 rng.randint(40, 100), rng.randint(40, 100))
+        for _ in range(count)
+    ]
+    return obstacles, width, height
+
+
+def time_queries(circles, candidates):
+    start = time.perf_counter()
+    hits = 0
+    for circle in circles:
+        for obstacle in candidates(circle):
+            if check_circle_rect_collision(circle, obstacle):
+                hits += 1
+                break
+    return time.perf_counter() - start, hits
+
+
+def bench_collision():
+    print("Obstacle collision: microseconds per player-sized circle check")
+    print(f"{'obstacles':>9} {'linear':>9} {'grid':>9}")
+    rng = random.Random(1)
+    for count in (8, 32, 128, 512):
+        obstacles, width, height = random_obstacles(count, rng)
+        grid = SpatialGrid(obstacles)
+        circles = [Circle(rng.uniform(0, width), rng.uniform(0, height), 15) for _ in range(QUERIES)]
+        linear_time, linear_hits = time_queries(circles, lambda c: obstacles)
+        grid_time, grid_hits = time_queries(circles, lambda c: grid.query(c.x, c.y, c.radius))
+        assert linear_hits == grid_hits
+        print(f"{count:>9} {linear_time / QUERIES * 1e6:>9.2f} {grid_time / QUERIES * 1e6:>9.2f}")
+        record("collision", obstacles=count, linear_us=linear_time / QUERIES * 1e6,
+               grid_us=grid_time / QUERIES * 1e6)
+
+
+def update_bullet_objects(bullets, obstacles, players):
+    """The per-object bullet update game.py used before BulletPool."""
+    for bullet in bullets:
+        bullet.update(1.0 / TICK_RATE)
+    bullets = [b for b in bullets if not b.off_screen() and not b.hits_obstacle(obstacles)]
+    for bullet in bullets[:]:
+        for i, player in enumerate(players):
+            if i != bullet.owner and player.alive and check_collision(bullet, player):
+                bullets.remove(bullet)
+                break
+    return bullets
+
+
+def bench_bullets():
+    print("Bullet update: milliseconds per tick (60 Hz budget is 16.7 ms)")
+    print(f"{'bullets':>8} {'objects':>9} {'pool':>9}")
+    rng = random.Random(1)
+    obstacles = generate_obstacles()
+    players = [Player(200, HEIGHT // 2), Player(WIDTH - 200, HEIGHT // 2)]
+    ticks = 100
+    for count in (100, 1000, 5000):
+        shots = [(rng.uniform(0, WIDTH), rng.uniform(0, HEIGHT), rng.uniform(0, WIDTH),
+                  rng.uniform(0, HEIGHT), rng.randint(0, 1)) for _ in range(count * 2)]
+
+        bullets = []
+        start = time.perf_counter()
+        for t in range(ticks):
+            while len(bullets) < count:
+                bullets.append(Bullet(*shots[(t + len(bullets)) % len(shots)]))
+            bullets = update_bullet_objects(bullets, obstacles, players)
+        object_time = time.perf_counter() - start
+
+        pool = BulletPool()
+        pool.set_obstacles(obstacles, WIDTH, HEIGHT)
+        start = time.perf_counter()
+        for t in range(ticks):
+            while len(pool) < count:
+                pool.spawn(*shots[(t + len(pool)) % len(shots)], bullet_id=0)
+            hits = pool.update(WIDTH, HEIGHT, players, 1.0 / TICK_RATE)
+            pool.remove([slot for _, _, _, slot in hits])
+        pool_time = time.perf_counter() - start
+        print(f"{count:>8} {object_time / ticks * 1e3:>9.2f} {pool_time / ticks * 1e3:>9.2f}")
+        record("bullets", bullets=count, objects_ms=object_time / ticks * 1e3,
+               pool_ms=pool_time / ticks * 1e3)
+
+
+def bench_sim():
+    print("Simulation: full step() calls per second, bullets topped up every tick")
+    print(f"{'obstacles':>9} {'bullets':>8} {'ticks/s':>9} {'ms/tick':>8}")
+    for obstacle_count in (8, 32, 128):
+        for bullet_count in (0, 100, 1000, 5000):
+            rng = random.Random(1)
+            obstacles = [
+                Obstacle(rng.uniform(0, WIDTH - 100), rng.uniform(0, HEIGHT - 100),
+                         rng.randint(20, 60), rng.randint(20, 60))
+                for _ in range(obstacle_count)
+            ]
+            state = GameState(obstacles=obstacles, bots=(1,))
+            elapsed = 0.0
+            for t in range(SIM_TICKS):
+                fill_bullets(state, bullet_count, rng)
+                player_input = make_input(left=t % 60 < 30, right=t % 60 >= 30, up=t % 90 < 45)
+                start = time.perf_counter()
+                step(state, [player_input, None])
+                elapsed += time.perf_counter() - start
+                for player in state.players:
+                    player.lives = max(player.lives, 1)  # Keep the match going
+            rate = SIM_TICKS / elapsed
+            print(f"{obstacle_count:>9} {bullet_count:>8} {rate:>9.0f} {1e3 / rate:>8.3f}")
+            record("sim", obstacles=obstacle_count, bullets=bullet_count, ticks_per_second=rate,
+                   ms_per_tick=1e3 / rate)
+
+
+def bench_mapgen():
+    print(f"Obstacle generation: {MAPGEN_TRIALS} maps per size")
+    print(f"{'requested':>9} {'ms/map':>8} {'placed':>7} {'success':>8}")
+    random.seed(1)
+    for count in (8, 16, 24, 32, 48, 64):
+        placed = complete = 0
+        start = time.perf_counter()
+        for _ in range(MAPGEN_TRIALS):
+            try:
+                obstacles = generate_obstacles(count)
+            except ValueError:
+                continue  # Arena too full for this many
+            placed += len(obstacles)
+            complete += len(obstacles) == count
+        elapsed = time.perf_counter() - start
+        ms = elapsed / MAPGEN_TRIALS * 1e3
+        print(f"{count:>9} {ms:>8.2f} {placed / MAPGEN_TRIALS:>7.1f} {complete / MAPGEN_TRIALS:>8.0%}")
+        record("mapgen", requested=count, ms_per_map=ms, placed=placed / MAPGEN_TRIALS,
+               success_rate=complete / MAPGEN_TRIALS)
+
+
+def loopback_pair():
+    """A started Server with one connected Client, both on 127.0.0.1."""
+    port = free_port()
+    server = Server(port)
+    server.socket.bind(("127.0.0.1", port))
+    server.socket.listen(1)
+    client = Client()
+    with contextlib.redirect_stdout(io.StringIO()):  # Connection messages would break up the table
+        client.connect("127.0.0.1", port)
+    conn, addr = server.socket.accept()
+    conn.setblocking(False)
+    server.peers.append(Peer(conn, addr))
+    server.running = True
+    return server, client
+
+
+def poll(receive):
+    """Spin on a non-blocking receive until it returns a message."""
+    while True:
+        message = receive()
+        if message is not None:
+            return message
+
+
+def bench_network():
+    print("Loopback TCP, server and client polled from one thread (transport overhead, no network)")
+    print("Throughput streams state frames as fast as possible; stale ones are dropped, not queued")
+    print(f"{'payload':<9} {'bytes':>7} {'rtt p50 us':>11} {'rtt p99 us':>11} {'sent/s':>9} {'MB/s in':>8} {'dropped':>8}")
+    snapshot = SnapshotEncoder().encode(record_frames(200, frames=1)[0])
+    payloads = [
+        ("input", encode_input_packet(16, 1, [(i, make_input(up=i % 2 == 0)) for i in range(1, 17)])),
+        ("snapshot", snapshot),
+    ]
+    for name, payload in payloads:
+        server, client = loopback_pair()
+        size = len(encode_frame(payload))
+        rtts = []
+        for _ in range(PINGS):
+            start = time.perf_counter()
+            client.send(payload)
+            server.send(poll(server.receive))
+            poll(client.receive)
+            rtts.append(time.perf_counter() - start)
+        rtts.sort()
+
+        # Throughput: server streams state frames; the client keeps only the newest
+        sent = received = 0
+        dropped_before = client.frames.dropped
+        end = time.perf_counter() + THROUGHPUT_SECONDS
+        while time.perf_counter() < end:
+            server.send(payload)
+            sent += 1
+            if client.receive() is not None:
+                received += 1
+        while len(server.peers[0].outgoing):
+            server.flush()
+            if client.receive() is not None:
+                received += 1
+        received += client.receive() is not None
+        # Frames the client fully read, whether returned or superseded by a newer one
+        arrived = received + client.frames.dropped - dropped_before
+        dropped = sent - received
+        rate = sent / THROUGHPUT_SECONDS
+        megabytes = arrived * size / THROUGHPUT_SECONDS / 1e6
+        client.close()
+        server.close()
+
+        p50 = rtts[len(rtts) // 2] * 1e6
+        p99 = rtts[int(len(rtts) * 0.99)] * 1e6
+        print(f"{name:<9} {size:>7} {p50:>11.1f} {p99:>11.1f} {rate:>9.0f} {megabytes:>8.1f} {dropped:>8}")
+        record("network", payload=name, bytes=size, rtt_p50_us=p50, rtt_p99_us=p99,
+               sent_per_second=rate, megabytes_per_second=megabytes, delivered=received,
+               dropped=dropped)
+
+
+def udp_pair(**link):
+    """A UdpServer and UdpClient that finished their handshake on 127.0.0.1."""
+    port = free_port()
+    server = UdpServer(port, **link)
+    client = UdpClient(**link)
+    with contextlib.redirect_stdout(io.StringIO()):  # Connection messages would break up the table
+        thread = threading.Thread(target=server.start, daemon=True)
+        thread.start()
+        connected = client.connect("127.0.0.1", port)
+        thread.join(HANDSHAKE_ATTEMPTS * HANDSHAKE_TIMEOUT)
+    if not connected:
+        raise RuntimeError("UDP handshake failed")
+    return server, client
+
+
+def stray_packets():
+    """Malformed datagrams: too short, an event cut off, an event that isn't JSON."""
+    header = PACKET.pack(PROTOCOL_VERSION, PKT_PAYLOAD, 0, 0, 0)
+    return [
+        b"\x01",
+        header[:5],
+        header + bytes((3,)) + PACKET_EVENT.pack(1 << 20, 50) + b"{",
+        header + bytes((1,)) + PACKET_EVENT.pack(1 << 20, 3) + b"{x}",
+    ]
+
+
+def bench_udp():
+    print(f"Loopback UDP with simulated loss and {UDP_LATENCY * 1e3:.0f} ms latency each way, stray packets mixed in")
+    print("Events must all arrive, once and in order; state is best effort")
+    print(f"{'loss':>5} {'events':>7} {'in order':>9} {'ev p50 ms':>10} {'ev p99 ms':>10} {'state':>6} {'stray':>6}")
+    snapshot = SnapshotEncoder().encode(record_frames(20, frames=1)[0])
+    strays = stray_packets()
+    for loss in (0.0, 0.1, 0.3):
+        random.seed(1)
+        server, client = udp_pair(loss=loss, latency=UDP_LATENCY)
+        sent_at = {}
+        events = []
+        states = 0
+        try:
+            for tick in range(UDP_TICKS):
+                server.send(snapshot)
+                if tick % UDP_EVENT_EVERY == 0:
+                    sent_at[len(sent_at)] = time.perf_counter()
+                    server.send_event({"type": "bench", "n": len(sent_at) - 1})
+                if tick % 50 == 0:
+                    for packet in strays:
+                        client.socket.sendto(packet, client.peer)
+                        server.socket.sendto(packet, server.peer)
+                client.send(encode_input_packet(tick + 1, None, []))  # Carries the client's acks back
+                states += client.receive() is not None
+                events += [(e["n"], time.perf_counter()) for e in client.receive_events()]
+                server.receive()
+                server.receive_events()
+                server.flush()
+                time.sleep(0.002)
+            deadline = time.perf_counter() + UDP_DRAIN_SECONDS
+            while len(events) < len(sent_at) and time.perf_counter() < deadline:
+                server.send(snapshot)
+                client.send(encode_input_packet(UDP_TICKS, None, []))
+                client.receive()
+                events += [(e["n"], time.perf_counter()) for e in client.receive_events()]
+                server.receive()
+                server.flush()
+                time.sleep(0.002)
+        finally:
+            client.close()
+            server.close()
+
+        order = [n for n, _ in events]
+        in_order = order == list(range(len(sent_at)))
+        delays = sorted(arrived - sent_at[n] for n, arrived in events)
+        p50 = delays[len(delays) // 2] * 1e3 if delays else float("nan")
+        p99 = delays[int(len(delays) * 0.99)] * 1e3 if delays else float("nan")
+        print(f"{loss:>5.0%} {len(events):>3}/{len(sent_at):<3} {'yes' if in_order else 'NO':>9} "
+              f"{p50:>10.1f} {p99:>10.1f} {states / UDP_TICKS:>6.0%} {len(strays) * (UDP_TICKS // 50):>6}")
+        record("udp", loss=loss, latency=UDP_LATENCY, events_sent=len(sent_at), events_delivered=len(events),
+               events_in_order=in_order, event_p50_ms=p50, event_p99_ms=p99, state_delivered=states / UDP_TICKS)
+        if not in_order:
+            failures.append(f"udp: events lost or out of order at {loss:.0%} loss")
+
+
+BENCHMARKS = {
+    "codec": bench_codec,
+    "inputs": bench_inputs,
+    "collision": bench_collision,
+    "bullets": bench_bullets,
+    "sim": bench_sim,
+    "mapgen": bench_mapgen,
+    "network": bench_network,
+    "udp": bench_udp,
+}
+
+
+def write_json(path):
+    report = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    with open(path, "w") as f:
+        json.dump(report, f, indent=1)
+    print(f"Wrote {len(results)} results to {path}")
+
+
+def main():
+    args = sys.argv[1:]
+    json_path = None
+    if "--json" in args:
+        i = args.index("--json")
+        if i + 1 >= len(args):
+            print("--json needs a file name")
+            return 1
+        json_path = args[i + 1]
+        del args[i:i + 2]
+    names = args or list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            print(f"Unknown benchmark {name!r}, choose from: {', '.join(BENCHMARKS)}")
+            return 1
+    for name in names:
+        BENCHMARKS[name]()
+        print()
+    if json_path:
+        write_json(json_path)
+    for failure in failures:
+        print(f"FAILED {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
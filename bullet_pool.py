@@ -0,0 +1,248 @@
+"""Struct-of-arrays bullet storage.
+
+A match can have thousands of bullets in flight (shotgun, rapid fire), so
+instead of one `Bullet` object per shot their fields live in NumPy arrays
+and a tick moves, culls and collides all of them with a few array
+operations. Freed slots are reused by later shots.
+"""
+import numpy as np
+
+INITIAL_CAPACITY = 256
+BULLET_SPEED = 600  # Pixels per second
+BULLET_RADIUS = 5
+CELL_SIZE = 64  # Obstacle lookup table resolution
+
+
+class BulletPool:
+    def __init__(self, capacity=INITIAL_CAPACITY):
+        self.x = np.zeros(capacity)
+        self.y = np.zeros(capacity)
+        self.vx = np.zeros(capacity)
+        self.vy = np.zeros(capacity)
+        self.radius = np.zeros(capacity)
+        self.owner = np.zeros(capacity, dtype=np.int16)
+        self.id = np.zeros(capacity, dtype=np.int64)
+        self.rewind = np.zeros(capacity, dtype=np.int64)  # Ticks its targets are rewound (history.py)
+        self.active = np.zeros(capacity, dtype=bool)
+        self.free = list(range(capacity - 1, -1, -1))  # Stack of unused slots
+        self.obstacle_table = None
+
+    def __len__(self):
+        return len(self.active) - len(self.free)
+
+    def _grow(self):
+        old = len(self.active)
+        for name in ("x", "y", "vx", "vy", "radius", "owner", "id", "rewind", "active"):
+            array = getattr(self, name)
+            setattr(self, name, np.concatenate([array, np.zeros_like(array)]))
+        self.free.extend(range(2 * old - 1, old - 1, -1))
+
+    def add(self, x, y, vx, vy, owner, bullet_id, radius=BULLET_RADIUS, rewind=0):
+        """Store a bullet in a free slot and return the slot."""
+        if not self.free:
+            self._grow()
+        slot = self.free.pop()
+        self.x[slot] = x
+        self.y[slot] = y
+        self.vx[slot] = vx
+        self.vy[slot] = vy
+        self.radius[slot] = radius
+        self.owner[slot] = owner
+        self.id[slot] = bullet_id
+        self.rewind[slot] = rewind
+        self.active[slot] = True
+        return slot
+
+    def spawn(self, x, y, target_x, target_y, owner, bullet_id, speed=BULLET_SPEED, rewind=0):
+        """Fire from (x, y) toward a target, like `Bullet.__init__`."""
+        dx = target_x - x
+        dy = target_y - y
+        dist = max((dx**2 + dy**2) ** 0.5, 1)
+        return self.add(x, y, (dx / dist) * speed, (dy / dist) * speed, owner, bullet_id, rewind=rewind)
+
+    def remove(self, slots):
+        slots = np.asarray(slots, dtype=np.int64)
+        self.active[slots] = False
+        self.free.extend(slots.tolist())
+
+    def clear(self):
+        self.active[:] = False
+        self.free = list(range(len(self.active) - 1, -1, -1))
+
+    def live_slots(self):
+        return np.flatnonzero(self.active)
+
+    def set_obstacles(self, obstacles, width, height, cell_size=CELL_SIZE, margin=2 * BULLET_RADIUS, travel=0.0):
+        """Build the per-cell obstacle lookup used by `update`.
+
+        Each cell lists every obstacle within `margin` (the largest bullet
+        radius) plus `travel` (the longest distance a bullet moves in one
+        tick) of it, padded with -1, so one gather at each bullet's start
+        position gives it every obstacle its path could touch.
+        """
+        self.table_params = (obstacles, width, height, cell_size, margin)
+        self.travel = travel
+        reach = margin + travel
+        cols = int(width // cell_size) + 1
+        rows = int(height // cell_size) + 1
+        cells = [[[] for _ in range(cols)] for _ in range(rows)]
+        for i, o in enumerate(obstacles):
+            left = max(int((o.x - reach) // cell_size), 0)
+            right = min(int((o.x + o.width + reach) // cell_size), cols - 1)
+            top = max(int((o.y - reach) // cell_size), 0)
+            bottom = min(int((o.y + o.height + reach) // cell_size), rows - 1)
+            for row in range(top, bottom + 1):
+                for col in range(left, right + 1):
+                    cells[row][col].append(i)
+        depth = max([len(c) for row in cells for c in row] + [1])
+        table = np.full((rows, cols, depth), -1, dtype=np.int32)
+        for row in range(rows):
+            for col in range(cols):
+                table[row, col, :len(cells[row][col])] = cells[row][col]
+        self.obstacle_table = table
+        self.cell_size = cell_size
+        self.ox = np.array([o.x for o in obstacles], dtype=float)
+        self.oy = np.array([o.y for o in obstacles], dtype=float)
+        self.ox2 = self.ox + np.array([o.width for o in obstacles], dtype=float)
+        self.oy2 = self.oy + np.array([o.height for o in obstacles], dtype=float)
+
+    def update(self, width, height, players, dt, history=None):
+        """Move every bullet `dt` seconds, drop ones that left the arena or hit an obstacle.
+
+        Collisions are swept along each bullet's path over the tick, so a
+        low tick rate can't let a bullet skip through a thin obstacle or a
+        player. With a `history.PositionHistory` holding this tick, a
+        bullet with a rewind is tested against players where they were
+        that many ticks ago. Returns (bullet id, owner, player index, slot) for each
+        bullet whose path reached a living player other than its owner
+        before any obstacle, without removing it: the caller decides what
+        the hit does and frees the slot.
+        """
+        slots = self.live_slots()
+        if not len(slots):
+            return []
+        x0 = self.x[slots]
+        y0 = self.y[slots]
+        dx = self.vx[slots] * dt
+        dy = self.vy[slots] * dt
+        x = x0 + dx
+        y = y0 + dy
+        self.x[slots] = x
+        self.y[slots] = y
+        radius = self.radius[slots]
+
+        # Fraction of this tick's path (0-1) at which each bullet stops
+        blocked = np.full(len(slots), np.inf)
+        if self.obstacle_table is not None:
+            blocked = self._obstacle_contact(x0, y0, dx, dy, radius)
+        contact = np.full(len(slots), np.inf)
+        victim = np.zeros(len(slots), dtype=np.int64)
+        if players:
+            rewind = self.rewind[slots]
+            if history is not None and rewind.any():
+                px, py, alive = history.lookup(history.tick - rewind)  # One row of players per bullet
+            else:
+                px = np.array([p.x for p in players], dtype=float)
+                py = np.array([p.y for p in players], dtype=float)
+                alive = np.array([p.alive for p in players])
+            reach = radius[:, None] + np.array([p.radius for p in players], dtype=float)
+            t = _circle_contact(x0[:, None], y0[:, None], dx[:, None], dy[:, None], px, py, reach)
+            t[~alive | (self.owner[slots, None] == np.arange(len(players)))] = np.inf
+            victim = t.argmin(axis=1)
+            contact = t[np.arange(len(slots)), victim]
+
+        hit = contact < blocked
+        gone = ~hit & (np.isfinite(blocked) | (x < 0) | (x > width) | (y < 0) | (y > height))
+        if gone.any():
+            self.remove(slots[gone])
+        return [(int(self.id[slot]), int(self.owner[slot]), int(v), int(slot))
+                for slot, v in zip(slots[hit], victim[hit])]
+
+    def _obstacle_contact(self, x0, y0, dx, dy, radius):
+        """Path fraction at which each bullet first touches an obstacle, inf if never."""
+        travel = np.sqrt((dx * dx + dy * dy).max())
+        if travel > self.travel:
+            # Longer ticks or faster bullets than the table was built for
+            self.set_obstacles(*self.table_params, travel=travel * 1.5)
+        table = self.obstacle_table
+        rows, cols, _ = table.shape
+        col = np.clip((x0 // self.cell_size).astype(np.int64), 0, cols - 1)
+        row = np.clip((y0 // self.cell_size).astype(np.int64), 0, rows - 1)
+        candidates = table[row, col]  # (bullets, depth), -1 = empty
+
+        # Only (bullet, obstacle) pairs that share a cell are tested
+        bullet, k = np.nonzero(candidates >= 0)
+        blocked = np.full(len(x0), np.inf)
+        if not len(bullet):
+            return blocked
+        obstacle = candidates[bullet, k]
+        left, right = self.ox[obstacle], self.ox2[obstacle]
+        top, bottom = self.oy[obstacle], self.oy2[obstacle]
+        x0, y0, dx, dy, r = x0[bullet], y0[bullet], dx[bullet], dy[bullet], radius[bullet]
+
+        # Slab test against the rectangle grown by the radius (square corners)
+        enter = np.zeros(len(bullet))
+        leave = np.ones(len(bullet))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for start, delta, low, high in ((x0, dx, left - r, right + r), (y0, dy, top - r, bottom + r)):
+                inside = (start >= low) & (start <= high)
+                t_low = (low - start) / delta
+                t_high = (high - start) / delta
+                near = np.where(delta == 0, np.where(inside, -np.inf, np.inf), np.minimum(t_low, t_high))
+                far = np.where(delta == 0, np.where(inside, np.inf, -np.inf), np.maximum(t_low, t_high))
+                enter = np.maximum(enter, near)
+                leave = np.minimum(leave, far)
+        touches = enter <= leave
+        t = np.where(touches, enter, np.inf)
+
+        # Entering through a grown corner square only counts once the round corner is reached
+        enter = np.where(touches, enter, 0.0)
+        ex = x0 + dx * enter
+        ey = y0 + dy * enter
+        corner = np.isfinite(t) & ((ex < left) | (ex > right)) & ((ey < top) | (ey > bottom))
+        if corner.any():
+            t[corner] = _circle_contact(x0[corner], y0[corner], dx[corner], dy[corner],
+                                        np.where(ex < left, left, right)[corner],
+                                        np.where(ey < top, top, bottom)[corner], r[corner])
+        np.minimum.at(blocked, bullet, t)
+        return blocked
+
+    def to_dicts(self, rewind=False):
+        """Live bullets as `Bullet.to_dict()`-style dicts, oldest shot first.
+
+        `rewind` adds each bullet's rewind, which only the host needs.
+        """
+        slots = self.live_slots()
+        slots = slots[np.argsort(self.id[slots], kind="stable")]
+        bullets = [
+            {"id": int(i), "x": float(x), "y": float(y), "vx": float(vx), "vy": float(vy), "owner": int(o)}
+            for i, x, y, vx, vy, o in zip(self.id[slots], self.x[slots], self.y[slots],
+                                          self.vx[slots], self.vy[slots], self.owner[slots])
+        ]
+        if rewind:
+            for bullet, ticks in zip(bullets, self.rewind[slots].tolist()):
+                bullet["rewind"] = ticks
+        return bullets
+
+    def from_dicts(self, bullets):
+        """Replace the contents with `Bullet.to_dict()`-style dicts."""
+        self.clear()
+        for data in bullets:
+            self.add(data["x"], data["y"], data["vx"], data["vy"], data["owner"], data.get("id", 0),
+                     rewind=data.get("rewind", 0))
+
+
+def _circle_contact(x0, y0, dx, dy, cx, cy, reach):
+    """Path fraction (0-1) at which a point moving by (dx, dy) from (x0, y0)
+    first comes within `reach` of (cx, cy); 0 if it starts there, inf if never.
+    """
+    rel_x = x0 - cx
+    rel_y = y0 - cy
+    a = dx * dx + dy * dy
+    b = dx * rel_x + dy * rel_y
+    c = rel_x * rel_x + rel_y * rel_y - reach * reach
+    disc = b * b - a * c
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = (-b - np.sqrt(disc)) / a
+    t = np.where((disc >= 0) & (a > 0) & (t >= 0) & (t <= 1), t, np.inf)
+    return np.where(c < 0, 0.0, t)
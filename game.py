@@ -1,12 +1,20 @@
-import pygame
+import sys
+import threading
 import time
-import random
-from network import Server, Client
+import pygame
+from netio import HostWorker, JoinWorker
+from network import TRANSPORTS, create_client, create_server
+from prediction import InputQueue, InterpolationBuffer, Predictor
+from profiler import Profiler
+from relay import SPECTATOR_RATE, SpectatorRelay
+from replay import Recorder, recording_path
+from render import Renderer, TextCache
+from sim import (WIDTH, HEIGHT, VIEW_WIDTH, VIEW_HEIGHT, BOT_POLICIES, DEFAULT_BOT, MAX_PLAYERS, MAX_REWIND, TICK_RATE,
+                 FORFEIT, GameState, Obstacle, parse_world, step, view_origin)
 
 # Initialize
 pygame.init()
-WIDTH, HEIGHT = 800, 600
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
+screen = pygame.display.set_mode((VIEW_WIDTH, VIEW_HEIGHT))
 pygame.display.set_caption("Dot Dodger")
 clock = pygame.time.Clock()
 font = pygame.font.Font(None, 36)
@@ -23,243 +31,159 @@ GRAY = (100, 100, 100)
 YELLOW = (255, 255, 100)
 PURPLE = (150, 100, 200)
 
-PORT = 5555
+PLAYER_COLOR_NAMES = [
+    "Blue", "Green", "Orange", "Pink", "Cyan", "Red", "Lime", "Violet",
+    "Gold", "Teal", "Salmon", "Sky", "Mint", "Magenta", "Tan", "Silver",
+]
+PLAYER_COLORS = [
+    BLUE, GREEN, (255, 160, 50), (255, 120, 200), (80, 230, 230), RED, (190, 255, 60), (190, 120, 255),
+    (230, 200, 60), (40, 170, 150), (250, 150, 130), (140, 200, 255), (170, 255, 200), (230, 60, 230),
+    (210, 180, 140), (200, 200, 200),
+]
 
 
-class Obstacle:
-    def __init__(self, x, y, width, height):
-        self.x = x
-        self.y = y
-        self.width = width
-        self.height = height
-        self.color = PURPLE
-
-    def draw(self):
-        pygame.draw.rect(screen, self.color, (self.x, self.y, self.width, self.height))
-        pygame.draw.rect(screen, WHITE, (self.x, self.y, self.width, self.height), 2)
-
-    def to_dict(self):
-        return {"x": self.x, "y": self.y, "width": self.width, "height": self.height}
-
-    @staticmethod
-    def from_dict(data):
-        return Obstacle(data["x"], data["y"], data["width"], data["height"])
-
-
-class Player:
-    def __init__(self, x, y, color, start_x=None, start_y=None):
-        self.x = x
-        self.y = y
-        self.start_x = start_x if start_x else x
-        self.start_y = start_y if start_y else y
-        self.color = color
-        self.radius = 15
-        self.speed = 5
-        self.alive = True
-        self.lives = 3  # Default, will be set by game
-
-    def respawn(self):
-        """Reset position after being hit."""
-        self.x = self.start_x
-        self.y = self.start_y
-        self.alive = True
-
-    def move_with_keys(self, keys, obstacles=None):
-        if not self.alive:
-            return
-        
-        old_x, old_y = self.x, self.y
-        
-        if keys[pygame.K_LEFT] or keys[pygame.K_a]:
-            self.x -= self.speed
-        if keys[pygame.K_RIGHT] or keys[pygame.K_d]:
-            self.x += self.speed
-        if keys[pygame.K_UP] or keys[pygame.K_w]:
-            self.y -= self.speed
-        if keys[pygame.K_DOWN] or keys[pygame.K_s]:
-            self.y += self.speed
-        
-        # Check boundaries
-        self.x = max(self.radius, min(WIDTH - self.radius, self.x))
-        self.y = max(self.radius, min(HEIGHT - self.radius, self.y))
-        
-        # Check obstacle collisions
-        if obstacles:
-            for obstacle in obstacles:
-                if check_circle_rect_collision(self, obstacle):
-                    self.x, self.y = old_x, old_y
-                    break
-
-    def move_with_input(self, input_data, obstacles=None):
-        """Move based on network input data."""
-        if not self.alive or not input_data:
-            return
-        
-        old_x, old_y = self.x, self.y
-        keys = input_data.get("keys", {})
-        if keys.get("left"):
-            self.x -= self.speed
-        if keys.get("right"):
-            self.x += self.speed
-        if keys.get("up"):
-            self.y -= self.speed
-        if keys.get("down"):
-            self.y += self.speed
-        
-        # Check boundaries
-        self.x = max(self.radius, min(WIDTH - self.radius, self.x))
-        self.y = max(self.radius, min(HEIGHT - self.radius, self.y))
-        
-        # Check obstacle collisions
-        if obstacles:
-            for obstacle in obstacles:
-                if check_circle_rect_collision(self, obstacle):
-                    self.x, self.y = old_x, old_y
-                    break
-
-    def draw(self):
-        if self.alive:
-            pygame.draw.circle(screen, self.color, (int(self.x), int(self.y)), self.radius)
-
-    def to_dict(self):
-        return {"x": self.x, "y": self.y, "alive": self.alive, "lives": self.lives}
-
-    def from_dict(self, data):
-        self.x = data["x"]
-        self.y = data["y"]
-        self.alive = data["alive"]
-        self.lives = data.get("lives", self.lives)
-
-
-class Bullet:
-    def __init__(self, x, y, target_x, target_y, owner):
-        self.x = x
-        self.y = y
-        self.radius = 5
-        self.speed = 10
-        self.owner = owner  # 0 = player 1, 1 = player 2
-        dx = target_x - x
-        dy = target_y - y
-        dist = max((dx**2 + dy**2) ** 0.5, 1)
-        self.vx = (dx / dist) * self.speed
-        self.vy = (dy / dist) * self.speed
-
-    def update(self):
-        self.x += self.vx
-        self.y += self.vy
-
-    def draw(self):
-        pygame.draw.circle(screen, YELLOW, (int(self.x), int(self.y)), self.radius)
-
-    def off_screen(self):
-        return self.x < 0 or self.x > WIDTH or self.y < 0 or self.y > HEIGHT
-    
-    def hits_obstacle(self, obstacles):
-        if obstacles:
-            for obstacle in obstacles:
-                if check_circle_rect_collision(self, obstacle):
-                    return True
-        return False
-
-    def to_dict(self):
-        return {"x": self.x, "y": self.y, "vx": self.vx, "vy": self.vy, "owner": self.owner}
-
-    @staticmethod
-    def from_dict(data):
-        b = Bullet(data["x"], data["y"], data["x"] + data["vx"], data["y"] + data["vy"], data["owner"])
-        b.vx = data["vx"]
-        b.vy = data["vy"]
-        return b
-
-
-def check_collision(obj1, obj2):
-    dx = obj1.x - obj2.x
-    dy = obj1.y - obj2.y
-    dist = (dx**2 + dy**2) ** 0.5
-    return dist < obj1.radius + obj2.radius
-
-
-def check_circle_rect_collision(circle, rect):
-    closest_x = max(rect.x, min(circle.x, rect.x + rect.width))
-    closest_y = max(rect.y, min(circle.y, rect.y + rect.height))
-    dx = circle.x - closest_x
-    dy = circle.y - closest_y
-    return (dx * dx + dy * dy) < (circle.radius * circle.radius)
-
-
-def generate_obstacles(num_obstacles=8):
-    obstacles = []
-    min_size = 40
-    max_size = 100
-    margin = 100
-    
-    attempts = 0
-    while len(obstacles) < num_obstacles and attempts < 1000:
-        width = random.randint(min_size, max_size)
-        height = random.randint(min_size, max_size)
-        x = random.randint(margin, WIDTH - width - margin)
-        y = random.randint(margin, HEIGHT - height - margin)
-        
-        new_obstacle = Obstacle(x, y, width, height)
-        
-        # Check if obstacle blocks player starting positions
-        player1_start = (200, HEIGHT // 2)
-        player2_start = (WIDTH - 200, HEIGHT // 2)
-        
-        valid = True
-        
-        # Check if obstacle overlaps with player starting areas
-        for px, py in [player1_start, player2_start]:
-            player_circle = type('Player', (), {'x': px, 'y': py, 'radius': 30})
-            if check_circle_rect_collision(player_circle, new_obstacle):
-                valid = False
-                break
-        
-        # Check if obstacle overlaps with other obstacles
-        for obs in obstacles:
-            if (new_obstacle.x < obs.x + obs.width and
-                new_obstacle.x + new_obstacle.width > obs.x and
-                new_obstacle.y < obs.y + obs.height and
-                new_obstacle.y + new_obstacle.height > obs.y):
-                valid = False
-                break
-        
-        if valid:
-            obstacles.append(new_obstacle)
-        
-        attempts += 1
-    
-    return obstacles
+def arg_value(flag, default):
+    """Value following `flag` on the command line, or `default`."""
+    if flag in sys.argv[:-1]:
+        return sys.argv[sys.argv.index(flag) + 1]
+    return default
+
+
+PORT = 5555
+SPECTATE_PORT = int(arg_value("--spectate-port", PORT + 1))  # Where spectators of a hosted match connect; 0 = off
+TRANSPORT = "udp" if "--udp" in sys.argv else "tcp"
+NUM_PLAYERS = max(2, min(MAX_PLAYERS, int(arg_value("--players", 2))))  # Players in a hosted match
+TRACE_PATH = arg_value("--trace", None)  # Chrome trace file written on exit
+RECORD_DIR = arg_value("--record", None)  # Directory for replay files of matches we run
+BOT = arg_value("--bot", DEFAULT_BOT)  # Single player opponent, a BOT_POLICIES name
+if BOT not in BOT_POLICIES:
+    print(f"Unknown bot {BOT!r}, using {DEFAULT_BOT} (choose from: {', '.join(BOT_POLICIES)})")
+    BOT = DEFAULT_BOT
+SIM_RATE = int(arg_value("--tick-rate", TICK_RATE))  # Ticks per second of matches we run
+MAX_REWIND_SECONDS = float(arg_value("--max-rewind", MAX_REWIND))  # Lag compensation window when hosting
+try:
+    WORLD = parse_world(arg_value("--world", f"{WIDTH}x{HEIGHT}"))  # World size of matches we run
+except ValueError as e:
+    print(f"Bad --world: {e}; using {WIDTH}x{HEIGHT}")
+    WORLD = (WIDTH, HEIGHT)
+FPS = int(arg_value("--fps", 144))  # Frame rate cap while playing; independent of the tick rate
+MAX_FRAME_TIME = 0.25  # Longest stall the simulation catches up on; beyond this it slows down
+OVERLAY_REFRESH = 0.5  # Seconds between profiler overlay text updates
+
+
+text_cache = TextCache()
+renderer = Renderer(screen, BLACK, PURPLE, WHITE, YELLOW)
+profiler = Profiler()
+recorder = None  # Recorder for the match in progress, closed by main()
+overlay = {"visible": "--profile" in sys.argv, "lines": [], "updated": 0.0, "font": None,
+           "network": None}  # Worker of the match in progress, for its link telemetry
+camera = {"origin": (0, 0)}  # World position of the screen's top-left corner, last frame
+
+
+class FixedStep:
+    """Fixed-timestep accumulator: the simulation runs at `tick_rate` whatever the frame rate."""
+
+    def __init__(self, tick_rate):
+        self.dt = 1.0 / tick_rate
+        self.accumulator = 0.0
+        self.last = time.perf_counter()
+
+    def ticks(self):
+        """How many ticks are due since the previous call."""
+        now = time.perf_counter()
+        self.accumulator += min(now - self.last, MAX_FRAME_TIME)
+        self.last = now
+        due = int(self.accumulator / self.dt)
+        self.accumulator -= due * self.dt
+        return due
+
+    def alpha(self):
+        """How far (0-1) the current frame is into the next tick."""
+        return self.accumulator / self.dt
+
+
+def render_text(text_font, text, color):
+    """Rendered text surface, reused until the string or colour changes."""
+    return text_cache.render(text_font, text, color)
+
+
+def start_recording(state, num_lives):
+    """Record the match if --record was given."""
+    global recorder
+    if RECORD_DIR:
+        recorder = Recorder(recording_path(RECORD_DIR, state), state, num_lives)
+
+
+def stop_recording():
+    global recorder
+    if recorder:
+        recorder.close()
+        recorder = None
+
+
+def toggle_overlay():
+    """F3: show or hide the frame timing and network overlay."""
+    overlay["visible"] = not overlay["visible"]
+    profiler.set_enabled(overlay["visible"] or profiler.trace_events is not None)
+
+
+def overlay_hud(top):
+    """(surface, position) pairs for the profiler and link overlay, refreshed twice a second."""
+    now = time.monotonic()
+    if now - overlay["updated"] > OVERLAY_REFRESH:
+        overlay["lines"] = ["phase (ms)    p50    p95    p99"] + profiler.lines()
+        if overlay["network"]:
+            for stats in overlay["network"].links():
+                overlay["lines"] += stats.lines()
+        overlay["updated"] = now
+    if overlay["font"] is None:
+        overlay["font"] = pygame.font.SysFont("monospace", 14)
+    return [(render_text(overlay["font"], line, WHITE), (10, top + i * 16))
+            for i, line in enumerate(overlay["lines"])]
+
+
+def exposed(event):
+    """True if the window needs repainting (it was uncovered or restored)."""
+    return event.type in (pygame.WINDOWEXPOSED, pygame.VIDEOEXPOSE)
+
+
+def draw_menu(title, title_font, title_y, lines, lines_y, spacing):
+    """Fill the screen with a centred title and lines of menu text."""
+    screen.fill(BLACK)
+    text = render_text(title_font, title, WHITE)
+    screen.blit(text, (VIEW_WIDTH // 2 - text.get_width() // 2, title_y))
+    for i, line in enumerate(lines):
+        color = GRAY if line == "" else WHITE
+        text = render_text(font, line, color)
+        screen.blit(text, (VIEW_WIDTH // 2 - text.get_width() // 2, lines_y + i * spacing))
 
 
 def show_main_menu():
     """Show main menu with game mode selection."""
+    instructions = [
+        "",
+        "Press 1 for SINGLE PLAYER",
+        "Press 2 to HOST GAME",
+        "Press 3 to JOIN GAME",
+        "Press 4 to SPECTATE",
+        "",
+        "Arrow keys or WASD to move",
+        "SPACE to shoot toward mouse",
+        "ESC to quit",
+    ]
+    redraw = True
     while True:
-        screen.fill(BLACK)
-        title = big_font.render("DOT DODGER", True, WHITE)
-        screen.blit(title, (WIDTH // 2 - title.get_width() // 2, 120))
-
-        subtitle = font.render("PvP Edition", True, GRAY)
-        screen.blit(subtitle, (WIDTH // 2 - subtitle.get_width() // 2, 190))
-
-        instructions = [
-            "",
-            "Press 1 for SINGLE PLAYER",
-            "Press 2 to HOST GAME",
-            "Press 3 to JOIN GAME",
-            "",
-            "Arrow keys or WASD to move",
-            "SPACE to shoot toward mouse",
-            "ESC to quit",
-        ]
-        for i, line in enumerate(instructions):
-            color = GRAY if line == "" else WHITE
-            text = font.render(line, True, color)
-            screen.blit(text, (WIDTH // 2 - text.get_width() // 2, 240 + i * 35))
-
-        pygame.display.flip()
+        # Menus are static: draw once, then only when the window is exposed
+        if redraw:
+            draw_menu("DOT DODGER", big_font, 120, instructions, 240, 35)
+            subtitle = render_text(font, "PvP Edition", GRAY)
+            screen.blit(subtitle, (VIEW_WIDTH // 2 - subtitle.get_width() // 2, 190))
+            pygame.display.flip()
+            redraw = False
 
         for event in pygame.event.get():
+            if exposed(event):
+                redraw = True
             if event.type == pygame.QUIT:
                 return None, None
             if event.type == pygame.KEYDOWN:
@@ -269,6 +193,8 @@ def show_main_menu():
                     return "host", None
                 if event.key == pygame.K_3:
                     return "join", None
+                if event.key == pygame.K_4:
+                    return "spectate", None
                 if event.key == pygame.K_ESCAPE:
                     return None, None
         clock.tick(60)
@@ -276,29 +202,26 @@ def show_main_menu():
 
 def select_lives():
     """Let the user select number of lives."""
+    options = [
+        "",
+        "Press 1 for 1 LIFE",
+        "Press 2 for 2 LIVES",
+        "Press 3 for 3 LIVES",
+        "Press 4 for 5 LIVES",
+        "Press 5 for 10 LIVES",
+        "",
+        "ESC to go back",
+    ]
+    redraw = True
     while True:
-        screen.fill(BLACK)
-        title = font.render("SELECT NUMBER OF LIVES", True, WHITE)
-        screen.blit(title, (WIDTH // 2 - title.get_width() // 2, 150))
-
-        options = [
-            "",
-            "Press 1 for 1 LIFE",
-            "Press 2 for 2 LIVES",
-            "Press 3 for 3 LIVES",
-            "Press 4 for 5 LIVES",
-            "Press 5 for 10 LIVES",
-            "",
-            "ESC to go back",
-        ]
-        for i, line in enumerate(options):
-            color = GRAY if line == "" else WHITE
-            text = font.render(line, True, color)
-            screen.blit(text, (WIDTH // 2 - text.get_width() // 2, 220 + i * 40))
-
-        pygame.display.flip()
+        if redraw:
+            draw_menu("SELECT NUMBER OF LIVES", font, 150, options, 220, 40)
+            pygame.display.flip()
+            redraw = False
 
         for event in pygame.event.get():
+            if exposed(event):
+                redraw = True
             if event.type == pygame.QUIT:
                 return None
             if event.type == pygame.KEYDOWN:
@@ -317,31 +240,35 @@ def select_lives():
         clock.tick(60)
 
 
-def get_join_address():
+def get_join_address(title="JOIN GAME"):
     """Get server address from user input."""
     input_text = ""
+    redraw = True
     while True:
-        screen.fill(BLACK)
-        title = font.render("JOIN GAME", True, WHITE)
-        screen.blit(title, (WIDTH // 2 - title.get_width() // 2, 150))
+        if redraw:
+            draw_menu(title, font, 150, [], 0, 0)
 
-        prompt = font.render("Enter host address (e.g., 0.tcp.ngrok.io:12345):", True, GRAY)
-        screen.blit(prompt, (WIDTH // 2 - prompt.get_width() // 2, 250))
+            prompt = render_text(font, "Enter host address (e.g., 0.tcp.ngrok.io:12345):", GRAY)
+            screen.blit(prompt, (VIEW_WIDTH // 2 - prompt.get_width() // 2, 250))
 
-        # Input box
-        input_surface = font.render(input_text + "_", True, WHITE)
-        pygame.draw.rect(screen, GRAY, (100, 300, 600, 40), 2)
-        screen.blit(input_surface, (110, 308))
+            # Input box
+            input_surface = font.render(input_text + "_", True, WHITE)
+            pygame.draw.rect(screen, GRAY, (100, 300, 600, 40), 2)
+            screen.blit(input_surface, (110, 308))
 
-        hint = small_font.render("Press ENTER to connect, ESC to go back", True, GRAY)
-        screen.blit(hint, (WIDTH // 2 - hint.get_width() // 2, 380))
+            hint = render_text(small_font, "Press ENTER to connect, ESC to go back", GRAY)
+            screen.blit(hint, (VIEW_WIDTH // 2 - hint.get_width() // 2, 380))
 
-        pygame.display.flip()
+            pygame.display.flip()
+            redraw = False
 
         for event in pygame.event.get():
+            if exposed(event):
+                redraw = True
             if event.type == pygame.QUIT:
                 return None
             if event.type == pygame.KEYDOWN:
+                redraw = True
                 if event.key == pygame.K_ESCAPE:
                     return "back"
                 if event.key == pygame.K_RETURN:
@@ -364,29 +291,60 @@ def get_join_address():
 def show_waiting_screen(message):
     """Show a waiting screen with a message."""
     screen.fill(BLACK)
-    text = font.render(message, True, WHITE)
-    screen.blit(text, (WIDTH // 2 - text.get_width() // 2, HEIGHT // 2))
-    hint = small_font.render("Press ESC to cancel", True, GRAY)
-    screen.blit(hint, (WIDTH // 2 - hint.get_width() // 2, HEIGHT // 2 + 50))
+    text = render_text(font, message, WHITE)
+    screen.blit(text, (VIEW_WIDTH // 2 - text.get_width() // 2, VIEW_HEIGHT // 2))
+    hint = render_text(small_font, "Press ESC to cancel", GRAY)
+    screen.blit(hint, (VIEW_WIDTH // 2 - hint.get_width() // 2, VIEW_HEIGHT // 2 + 50))
     pygame.display.flip()
 
 
+def wait_for(task, message):
+    """Run a blocking network call in the background behind a waiting screen.
+
+    Returns the call's result, or None if it failed or the player pressed ESC.
+    """
+    result = {}
+
+    def run():
+        try:
+            result["value"] = task()
+        except OSError as e:
+            print(f"Network error: {e}")
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    show_waiting_screen(message)
+    while thread.is_alive():
+        for event in pygame.event.get():
+            if exposed(event):
+                show_waiting_screen(message)
+            if event.type == pygame.QUIT:
+                return None
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
+                return None
+        clock.tick(30)
+    return result.get("value")
+
+
 def show_result_screen(won):
     """Show win/lose screen."""
+    if won:
+        title = render_text(big_font, "YOU WIN!", GREEN)
+    else:
+        title = render_text(big_font, "YOU LOSE!", RED)
+    restart_text = render_text(font, "Press R to play again or ESC to quit", GRAY)
+    redraw = True
     while True:
-        screen.fill(BLACK)
-        if won:
-            title = big_font.render("YOU WIN!", True, GREEN)
-        else:
-            title = big_font.render("YOU LOSE!", True, RED)
-        screen.blit(title, (WIDTH // 2 - title.get_width() // 2, 200))
-
-        restart_text = font.render("Press R to play again or ESC to quit", True, GRAY)
-        screen.blit(restart_text, (WIDTH // 2 - restart_text.get_width() // 2, 320))
-
-        pygame.display.flip()
+        if redraw:
+            screen.fill(BLACK)
+            screen.blit(title, (VIEW_WIDTH // 2 - title.get_width() // 2, 200))
+            screen.blit(restart_text, (VIEW_WIDTH // 2 - restart_text.get_width() // 2, 320))
+            pygame.display.flip()
+            redraw = False
 
         for event in pygame.event.get():
+            if exposed(event):
+                redraw = True
             if event.type == pygame.QUIT:
                 return False
             if event.type == pygame.KEYDOWN:
@@ -411,106 +369,391 @@ def get_local_input():
     }
 
 
+def aim():
+    """World position under the mouse pointer."""
+    x, y = pygame.mouse.get_pos()
+    return x + camera["origin"][0], y + camera["origin"][1]
+
+
+def draw_game(state, me, alpha=1.0, follow=None):
+    """Draw the arena, players, bullets and lives HUD (`me` is the local player, None for a spectator).
+
+    The camera follows `follow` (default `me`), stopping at the edges of the world.
+    """
+    player = state.players[me if follow is None else follow]
+    x = player.prev_x + (player.x - player.prev_x) * alpha
+    y = player.prev_y + (player.y - player.prev_y) * alpha
+    left, top = view_origin(x, y, state.width, state.height)
+    camera["origin"] = (int(left), int(top))
+    hud = []
+    if len(state.players) == 2:
+        labels = []
+        for i, player in enumerate(state.players):
+            name = "YOU" if i == me else f"P{i + 1}"
+            labels.append(render_text(font, f"{name} ({PLAYER_COLOR_NAMES[i]}) - Lives: {player.lives}",
+                                      PLAYER_COLORS[i]))
+        hud.append((labels[0], (10, 10)))
+        hud.append((labels[1], (VIEW_WIDTH - labels[1].get_width() - 10, 10)))
+        hud_bottom = 40
+    else:
+        # Free-for-all: four compact labels per row
+        for i, player in enumerate(state.players):
+            name = "YOU" if i == me else f"P{i + 1}"
+            label = render_text(small_font, f"{name}: {player.lives}", PLAYER_COLORS[i])
+            hud.append((label, (10 + (i % 4) * (VIEW_WIDTH // 4), 10 + (i // 4) * 24)))
+        hud_bottom = 10 + (len(state.players) + 3) // 4 * 24 + 6
+    if me is None:
+        label = render_text(small_font, f"SPECTATING P{follow + 1} - TAB to switch", GRAY)
+        hud.append((label, (10, VIEW_HEIGHT - 30)))
+    if overlay["visible"]:
+        hud.extend(overlay_hud(hud_bottom))
+    renderer.draw(state, PLAYER_COLORS, hud, alpha, camera["origin"])
+
+
 def run_single_player(num_lives):
     """Single player mode - you vs AI (simple bot)."""
-    player1 = Player(200, HEIGHT // 2, BLUE)
-    player2 = Player(WIDTH - 200, HEIGHT // 2, GREEN)  # Bot
-    player1.lives = num_lives
-    player2.lives = num_lives
-    bullets = []
-    obstacles = generate_obstacles()
-    last_bot_shot = time.time()
-    respawn_time = None  # Track respawn delay
+    state = GameState(num_lives, bots={1: BOT}, tick_rate=SIM_RATE, width=WORLD[0], height=WORLD[1])
+    start_recording(state, num_lives)
+    overlay["network"] = None
+    timestep = FixedStep(SIM_RATE)
+    shot = None  # Shot fired since the last tick
 
     while True:
-        shoot_target = None
+        profiler.start_frame()
+        player1 = state.players[0]
+        local_input = get_local_input()
 
         for event in pygame.event.get():
+            if exposed(event):
+                renderer.invalidate()
             if event.type == pygame.QUIT:
                 return None
             if event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_ESCAPE:
                     return None
+                if event.key == pygame.K_F3:
+                    toggle_overlay()
                 if event.key == pygame.K_SPACE and player1.alive:
-                    mx, my = pygame.mouse.get_pos()
-                    shoot_target = (mx, my)
-
-        # Handle respawn delay
-        if respawn_time and time.time() - respawn_time > 1.0:
-            if not player1.alive and player1.lives > 0:
-                player1.respawn()
-            if not player2.alive and player2.lives > 0:
-                player2.respawn()
-            respawn_time = None
-            bullets = []  # Clear bullets on respawn
-
-        # Player 1 input
-        keys = pygame.key.get_pressed()
-        player1.move_with_keys(keys, obstacles)
-
-        if shoot_target:
-            bullets.append(Bullet(player1.x, player1.y, shoot_target[0], shoot_target[1], 0))
-
-        # Bot AI - simple: move toward player, shoot periodically
-        if player2.alive and player1.alive:
-            dx = player1.x - player2.x
-            dy = player1.y - player2.y
-            dist = max((dx**2 + dy**2) ** 0.5, 1)
-            player2.x += (dx / dist) * 2  # Slower than player
-            player2.y += (dy / dist) * 2
-            player2.x = max(player2.radius, min(WIDTH - player2.radius, player2.x))
-            player2.y = max(player2.radius, min(HEIGHT - player2.radius, player2.y))
-
-            # Bot shoots every 1.5 seconds
-            if time.time() - last_bot_shot > 1.5:
-                bullets.append(Bullet(player2.x, player2.y, player1.x, player1.y, 1))
-                last_bot_shot = time.time()
-
-        # Update bullets
-        for bullet in bullets:
-            bullet.update()
-        bullets = [b for b in bullets if not b.off_screen() and not b.hits_obstacle(obstacles)]
-
-        # Check bullet-player collisions
-        for bullet in bullets[:]:
-            if bullet.owner == 0 and player2.alive and check_collision(bullet, player2):
-                player2.lives -= 1
-                player2.alive = False
-                bullets.remove(bullet)
-                if player2.lives > 0:
-                    respawn_time = time.time()
-            elif bullet.owner == 1 and player1.alive and check_collision(bullet, player1):
-                player1.lives -= 1
-                player1.alive = False
-                bullets.remove(bullet)
-                if player1.lives > 0:
-                    respawn_time = time.time()
-
-        # Check win condition
-        if player1.lives <= 0 and not player1.alive:
-            return False  # You lose
-        if player2.lives <= 0 and not player2.alive:
-            return True  # You win
-
-        # Draw
-        screen.fill(BLACK)
-        for obstacle in obstacles:
-            obstacle.draw()
-        player1.draw()
-        player2.draw()
-        for bullet in bullets:
-            bullet.draw()
-
-        p1_text = font.render(f"P1 (Blue) - Lives: {player1.lives}", True, BLUE)
-        p2_text = font.render(f"YOU (Green) - Lives: {player2.lives}", True, GREEN)
-        screen.blit(p1_text, (10, 10))
-        screen.blit(p2_text, (WIDTH - p2_text.get_width() - 10, 10))
-
-        pygame.display.flip()
-        clock.tick(60)
+                    shot = aim()
+        profiler.mark("input")
+
+        for _ in range(timestep.ticks()):
+            inputs = [dict(local_input, shoot=shot), None]
+            shot = None
+            if recorder:
+                recorder.record(inputs)
+            step(state, inputs, profiler)
+
+            # Check win condition
+            if state.is_over():
+                return state.winner() == 0
+
+        draw_game(state, 0, timestep.alpha())
+        profiler.mark("draw")
+        clock.tick(FPS)
+        profiler.mark("idle")
+
+
+def run_host_game(num_lives, num_players=None):
+    """Host mode - you're blue and run the match for everyone who joins."""
+    num_players = num_players or NUM_PLAYERS
+    try:
+        server = create_server(PORT, TRANSPORT, max_clients=num_players - 1)
+    except ValueError as e:
+        print(e)
+        return None
+    waiting = "Waiting for player 2" if num_players == 2 else f"Waiting for {num_players - 1} players"
+    if not wait_for(server.start, f"{waiting} on port {PORT}..."):
+        server.close()
+        return None
+
+    state = GameState(num_lives, num_players=num_players, tick_rate=SIM_RATE, width=WORLD[0], height=WORLD[1],
+                      max_rewind=MAX_REWIND_SECONDS)
+    obstacles = [o.to_dict() for o in state.obstacles]
+    clients = range(1, num_players)  # Player index of each connected client
+    relay = None
+    if SPECTATE_PORT:
+        relay = SpectatorRelay(SPECTATE_PORT, {"type": "start", "player": None, "players": num_players,
+                                               "lives": num_lives, "tick_rate": SIM_RATE, "world": WORLD,
+                                               "obstacles": obstacles}, SIM_RATE)
+        if not relay.listen():
+            relay = None
+    # Client index is player index - 1
+    network = HostWorker(server, SIM_RATE, WORLD, {client - 1: client for client in clients}, relay)
+    overlay["network"] = network
+    for client in clients:
+        network.send_event({
+            "type": "start",
+            "player": client,
+            "players": num_players,
+            "lives": num_lives,
+            "tick_rate": SIM_RATE,
+            "world": WORLD,
+            "obstacles": obstacles,
+        }, client - 1)
+    network.start()
+    remote_inputs = {client: InputQueue(SIM_RATE) for client in clients}
+    start_recording(state, num_lives)
+    timestep = FixedStep(SIM_RATE)
+    shot = None
+
+    while True:
+        profiler.start_frame()
+        player1 = state.players[0]
+        local_input = get_local_input()
+
+        for event in pygame.event.get():
+            if exposed(event):
+                renderer.invalidate()
+            if event.type == pygame.QUIT:
+                network.close()
+                return None
+            if event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_ESCAPE:
+                    network.close()
+                    return None
+                if event.key == pygame.K_F3:
+                    toggle_overlay()
+                if event.key == pygame.K_SPACE and player1.alive:
+                    shot = aim()
+        profiler.mark("input")
+
+        # Clients send their unacked input changes; the worker has decoded them
+        for index, seq, changes in network.inputs():
+            remote_inputs[index + 1].add(seq, changes)
+        if not network.running:
+            network.close()
+            return None  # Everyone left
+        profiler.mark("receive")
+
+        # A client whose connection closed forfeits, as on the dedicated server
+        present = [client for client in clients if client - 1 in network.connected]
+        for _ in range(timestep.ticks()):
+            inputs = [dict(local_input, shoot=shot)] + [remote_inputs[client].pop() if client in present else FORFEIT
+                                                        for client in clients]
+            shot = None
+            if recorder:
+                recorder.record(inputs)
+            step(state, inputs, profiler)
+
+            # The worker encodes and sends it; a tick it hasn't got to yet is replaced
+            network.publish(state.to_dict(), {c - 1: remote_inputs[c].last_applied for c in present})
+            profiler.mark("publish")
+
+            # Check win condition
+            if state.is_over():
+                network.send_event({"type": "game_over", "winner": state.winner()})
+                network.close()
+                return state.winner() == 0
+
+        draw_game(state, 0, timestep.alpha())
+        profiler.mark("draw")
+        clock.tick(FPS)
+        profiler.mark("idle")
+
+
+def wait_for_start(network):
+    """The host's start event, or None (with `network` closed) if it left or the player pressed ESC."""
+    show_waiting_screen("Waiting for host...")
+    while True:
+        for event in pygame.event.get():
+            if exposed(event):
+                show_waiting_screen("Waiting for host...")
+            if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
+                network.close()
+                return None
+        running = network.running
+        for event in network.events():
+            if event.get("type") == "start":
+                return event
+        if not running:
+            network.close()
+            return None
+        clock.tick(30)
+
+
+def run_join_game(address):
+    """Join mode - your own dot is predicted locally.
+
+    `address` is host:port, optionally prefixed with a transport (udp://).
+    """
+    transport = TRANSPORT
+    if "://" in address:
+        transport, address = address.split("://", 1)
+    host, _, port = address.strip().rpartition(":")
+    if transport not in TRANSPORTS or not host or not port.isdigit():
+        print(f"Invalid address: {address}")
+        return None
+
+    client = create_client(transport)
+    if not wait_for(lambda: client.connect(host, int(port)), f"Connecting to {address}..."):
+        client.close()
+        return None
+
+    network = JoinWorker(client).start()
+    overlay["network"] = network
+    start = wait_for_start(network)
+    if start is None:
+        return None
+
+    me = start["player"]
+    num_players = start.get("players", 2)
+    tick_rate = start.get("tick_rate", TICK_RATE)
+    width, height = start.get("world", (WIDTH, HEIGHT))
+    obstacles = [Obstacle.from_dict(o) for o in start["obstacles"]]
+    view = GameState(start["lives"], obstacles=obstacles, num_players=num_players, tick_rate=tick_rate,
+                     width=width, height=height)
+    predictor = Predictor(me, obstacles, start["lives"], num_players, tick_rate, width, height)
+    interpolation = InterpolationBuffer(tick_rate=tick_rate)
+    timestep = FixedStep(tick_rate)  # One input per host tick
+    shot = None
+    seen_tick = None  # Host tick the last frame showed the others at; shots are aimed at it
+    shot_tick = None
 
-    client.close()
-    return None
+    while True:
+        profiler.start_frame()
+        local_input = get_local_input()
+
+        for event in pygame.event.get():
+            if exposed(event):
+                renderer.invalidate()
+            if event.type == pygame.QUIT:
+                network.close()
+                return None
+            if event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_ESCAPE:
+                    network.close()
+                    return None
+                if event.key == pygame.K_F3:
+                    toggle_overlay()
+                if event.key == pygame.K_SPACE and predictor.player.alive:
+                    shot = aim()
+                    shot_tick = None if seen_tick is None else max(0, round(seen_tick))
+        profiler.mark("input")
+
+        for _ in range(timestep.ticks()):
+            predictor.apply_local(dict(local_input, shoot=shot, view=shot_tick if shot else None))
+            shot = None
+            profiler.mark("predict")
+            packet = predictor.outgoing(network.ack_tick(predictor.keepalive_ticks))
+            if packet:
+                network.send_input(packet)
+            profiler.mark("send")
+
+        # Snapshots were decoded on the worker and stamped when they arrived
+        snapshots = network.received()
+        for snapshot, arrived in snapshots:
+            interpolation.push(snapshot, arrived)
+        if snapshots:
+            predictor.reconcile(snapshots[-1][0])
+        profiler.mark("receive")
+
+        running = network.running  # Read first: the worker queues game over before it stops
+        for event in network.events():
+            if event.get("type") == "game_over":
+                network.close()
+                return event["winner"] == me
+        if not running:
+            network.close()
+            return None  # Host left
+
+        # Remote entities come from the past, our own dot from the prediction
+        now = time.monotonic()
+        sample = interpolation.sample(now)
+        if sample:
+            view.from_dict(sample)
+            seen_tick = interpolation.render_tick(now)
+        view.players[me].from_dict(predictor.player.to_dict())
+        if view.is_over():
+            network.close()
+            return view.winner() == me
+        # The sample is already for this instant; only our own dot moves in whole
+        # ticks, so draw it between its last two predicted positions
+        mine, predicted = view.players[me], predictor.player
+        alpha = timestep.alpha()
+        mine.x = predicted.prev_x + (predicted.x - predicted.prev_x) * alpha
+        mine.y = predicted.prev_y + (predicted.y - predicted.prev_y) * alpha
+        profiler.mark("interpolate")
+
+        draw_game(view, me)
+        profiler.mark("draw")
+        clock.tick(FPS)
+        profiler.mark("idle")
+
+
+def run_spectate(address):
+    """Spectate mode - watch a hosted match from its spectator port, a little behind.
+
+    Everyone is drawn from the interpolated stream; TAB changes whom the camera follows.
+    """
+    host, _, port = address.strip().rpartition(":")
+    if not host or not port.isdigit():
+        print(f"Invalid address: {address}")
+        return None
+
+    client = create_client("tcp")
+    if not wait_for(lambda: client.connect(host, int(port)), f"Connecting to {address}..."):
+        client.close()
+        return None
+    network = JoinWorker(client).start()
+    overlay["network"] = network
+    start = wait_for_start(network)
+    if start is None:
+        return None
+
+    num_players = start.get("players", 2)
+    tick_rate = start.get("tick_rate", TICK_RATE)
+    width, height = start.get("world", (WIDTH, HEIGHT))
+    obstacles = [Obstacle.from_dict(o) for o in start["obstacles"]]
+    view = GameState(start["lives"], obstacles=obstacles, num_players=num_players, tick_rate=tick_rate,
+                     width=width, height=height, max_rewind=0)
+    # Two spectator frames of delay, so there is always a pair to blend between
+    interpolation = InterpolationBuffer(delay=2.0 / SPECTATOR_RATE, tick_rate=tick_rate)
+    following = 0
+
+    while True:
+        profiler.start_frame()
+        for event in pygame.event.get():
+            if exposed(event):
+                renderer.invalidate()
+            if event.type == pygame.QUIT:
+                network.close()
+                return None
+            if event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_ESCAPE:
+                    network.close()
+                    return None
+                if event.key == pygame.K_F3:
+                    toggle_overlay()
+                if event.key == pygame.K_TAB:
+                    following = (following + 1) % num_players
+        profiler.mark("input")
+
+        for snapshot, arrived in network.received():
+            interpolation.push(snapshot, arrived)
+        running = network.running  # Read first: the worker queues game over before it stops
+        for event in network.events():
+            if event.get("type") == "game_over":
+                winner = event["winner"]
+                print("Match over:", "draw" if winner is None else f"P{winner + 1} wins")
+                network.close()
+                return None
+        if not running:
+            network.close()
+            return None  # Host left
+        profiler.mark("receive")
+
+        sample = interpolation.sample(time.monotonic())
+        if sample:
+            view.from_dict(sample)
+            for player in view.players:
+                player.prev_x, player.prev_y = player.x, player.y
+        profiler.mark("interpolate")
+
+        draw_game(view, None, follow=following)
+        profiler.mark("draw")
+        clock.tick(FPS)
+        profiler.mark("idle")
 
 
 def main():
@@ -518,6 +761,10 @@ def main():
     global socket
     socket = socket_module
 
+    if TRACE_PATH:
+        profiler.start_trace(TRACE_PATH)
+    profiler.set_enabled(overlay["visible"] or TRACE_PATH is not None)
+
     while True:
         mode, _ = show_main_menu()
         if mode is None:
@@ -546,6 +793,14 @@ def main():
             if address == "back":
                 continue
             result = run_join_game(address)
+        elif mode == "spectate":
+            address = get_join_address("SPECTATE")
+            if address is None:
+                break
+            if address == "back":
+                continue
+            result = run_spectate(address)
+        stop_recording()
 
         if result is None:
             continue
@@ -553,6 +808,7 @@ def main():
         if not show_result_screen(result):
             break
 
+    profiler.stop_trace()
     pygame.quit()
 
 
@@ -0,0 +1,73 @@
+"""Recent player positions by tick, for lag-compensated hits.
+
+A remote player aims at the others where their screen shows them: an
+older snapshot, drawn INTERPOLATION_DELAY behind the newest one. Their
+shots carry that tick (the input's "view"), and while the bullet flies
+the host tests it against positions rewound by the same number of ticks
+instead of the current ones, so a shot that was on target on the
+shooter's screen hits. Rewinding is capped at the history's window, and
+any tick not kept (older than the window, or from before the match
+started) reads as the oldest tick that is.
+
+Positions sit in NumPy arrays with one row per tick of the window,
+reused in a ring, so memory is fixed and finding a tick is one modulo.
+"""
+import numpy as np
+
+
+class PositionHistory:
+    def __init__(self, window, num_players):
+        """Keep the last `window` ticks (plus the current one) for `num_players` players."""
+        self.window = window
+        size = window + 1
+        self.x = np.zeros((size, num_players))
+        self.y = np.zeros((size, num_players))
+        self.alive = np.zeros((size, num_players), dtype=bool)
+        self.ticks = np.full(size, -1, dtype=np.int64)  # Tick stored in each row, -1 = never
+        self.tick = None  # Newest tick recorded
+
+    def record(self, tick, players):
+        """Store where `players` are at `tick` (the snapshot tick they will be sent in)."""
+        row = tick % len(self.ticks)
+        self.x[row] = [p.x for p in players]
+        self.y[row] = [p.y for p in players]
+        self.alive[row] = [p.alive for p in players]
+        self.ticks[row] = tick
+        self.tick = tick
+
+    def rewind(self, tick, view):
+        """Ticks to rewind at `tick` for a shot aimed at snapshot tick `view` (None: no rewind)."""
+        if view is None:
+            return 0
+        return int(min(max(tick - view, 0), self.window))
+
+    def lookup(self, ticks):
+        """(x, y, alive) arrays with one row of every player per entry of `ticks`.
+
+        A tick not kept reads as the oldest one that is.
+        """
+        ticks = np.asarray(ticks, dtype=np.int64)
+        rows = ticks % len(self.ticks)
+        missing = self.ticks[rows] != ticks
+        if missing.any():
+            kept = np.flatnonzero(self.ticks >= 0)
+            rows = np.where(missing, kept[self.ticks[kept].argmin()], rows)
+        return self.x[rows], self.y[rows], self.alive[rows]
+
+    def to_dict(self):
+        kept = np.flatnonzero(self.ticks >= 0)
+        return {
+            "tick": self.tick,
+            "rows": [[int(self.ticks[row]), self.x[row].tolist(), self.y[row].tolist(), self.alive[row].tolist()]
+                     for row in kept],
+        }
+
+    def from_dict(self, data):
+        self.ticks[:] = -1
+        for tick, x, y, alive in data["rows"]:
+            row = tick % len(self.ticks)
+            self.x[row] = x
+            self.y[row] = y
+            self.alive[row] = alive
+            self.ticks[row] = tick
+        self.tick = data["tick"]
@@ -0,0 +1,346 @@
+"""Load test the dedicated server with synthetic headless players over loopback.
+
+    python loadtest.py                                # ramp 2, 4, 8 ... 64 players, 10 s per step
+    python loadtest.py --clients 8,32,128 --players 4 --tick-rate 30
+    python loadtest.py --latency 0.05 --loss 0.02     # 50 ms each way, 2% of packets lost
+    python loadtest.py --json load.json               # also save every step's numbers
+
+A MatchServer runs on a background thread of this process, listening on
+127.0.0.1 only; no display and no outside network is needed. Each step of
+the ramp connects more `Client`s, which fill rooms of --players the way
+real players do, and plays them for --seconds. Every client plays like
+someone at the keyboard: it walks with changing keys and fires at random
+spots, feeding a Predictor and sending the same packed input packets as
+the join loop, decodes delta snapshots and answers pings.
+
+`--latency`, `--jitter` and `--loss` are applied to every client's
+traffic in both directions inside the client, since loopback TCP has
+none of its own. A lost snapshot is simply never decoded; a lost input
+packet is repaired by the unacked changes in the next one.
+
+Measured per step:
+
+- server tick: how long one tick of every room takes (p50/p99/max), and
+  the share of the tick budget used at p99
+- staleness: how many ticks the newest snapshot a client has decoded is
+  behind its room, sampled every client frame
+- receive latency: from the start of the server tick that produced a
+  snapshot to the client decoding it, latency injection included
+- snapshots decoded per client per second (one read per client frame
+  keeps only the newest, as the game does)
+- snapshots the server skipped because a client's socket was backed up,
+  and the generator's own frame time, since it shares the process (and
+  the GIL) with the server; once that passes the tick interval the
+  numbers say more about the generator than the server
+"""
+import argparse
+import asyncio
+import contextlib
+import heapq
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+from network import Client, SnapshotDecoder, free_port
+from prediction import Predictor
+from profiler import percentile
+from server import MatchServer
+from sim import WIDTH, HEIGHT, TICK_RATE, Obstacle, make_input, parse_world
+from telemetry import pong_message
+
+CONNECT_TIMEOUT = 5.0  # Seconds to wait for the server thread to listen
+SENT_TICKS_KEPT = 600  # Per room, ticks whose start time is kept for receive latency
+
+
+class LoadServer(MatchServer):
+    """MatchServer that records its tick times and when each room's ticks started."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.load_ticks = []  # Seconds per tick since the last `take_ticks`
+        self.tick_started = {}  # Room -> {tick: perf_counter at the start of the server tick}
+
+    def tick(self):
+        start = time.perf_counter()
+        super().tick()
+        self.load_ticks.append(time.perf_counter() - start)
+        for room in self.rooms:
+            started = self.tick_started.setdefault(room, {})
+            started[room.state.tick] = start
+            started.pop(room.state.tick - SENT_TICKS_KEPT, None)
+        if len(self.tick_started) > len(self.rooms):
+            self.tick_started = {room: self.tick_started[room] for room in self.rooms if room in self.tick_started}
+
+    def take_ticks(self):
+        ticks, self.load_ticks = self.load_ticks, []
+        return ticks
+
+    def room_of(self, address):
+        """The room holding the connection whose peer address is `address`."""
+        for room in self.rooms:
+            for conn in room.connections:
+                if conn.addr == address:
+                    return room
+        return None
+
+
+def scripted_input(tick, phase, rng, world):
+    """Keyboard-shaped input: turn every half second or so, fire every third of a second or so."""
+    turn = (tick + phase) // 30 % 4
+    keys = {"left": turn == 0, "up": turn == 1, "right": turn == 2, "down": turn == 3}
+    if rng.random() < 0.05:
+        keys[rng.choice(list(keys))] = True  # Diagonals now and then
+    shoot = None
+    if rng.random() < 0.05:
+        shoot = (rng.uniform(0, world[0]), rng.uniform(0, world[1]))
+    return make_input(shoot=shoot, **keys)
+
+
+class SyntheticClient:
+    """One headless player: connects, plays scripted input, rejoins when its match ends."""
+
+    def __init__(self, server, port, rng, latency=0.0, jitter=0.0, loss=0.0):
+        self.server = server
+        self.port = port
+        self.rng = rng
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.phase = rng.randrange(120)  # So clients don't all turn on the same tick
+        self.client = None
+        self.delayed = []  # Heap of (due time, order, "in" or "out", message, event)
+        self.order = 0
+        self.matches = 0
+        self.stats = {}  # Running counters, read and reset by the ramp
+        self.reset_stats()
+        self.connect()
+
+    def reset_stats(self):
+        self.stats = {"staleness": [], "latency": [], "snapshots": 0, "undecodable": 0}
+
+    def connect(self):
+        self.client = Client()
+        self.client.connect("127.0.0.1", self.port)
+        self.delayed = []
+        self.decoder = None
+        self.predictor = None
+        self.room = None
+        self.world = (WIDTH, HEIGHT)
+        self.tick = 0
+
+    def delay(self, now, direction, message, event=False):
+        """Queue a message behind the simulated latency, or lose it."""
+        if not event and self.loss and self.rng.random() < self.loss:
+            return
+        due = now + self.latency + self.rng.uniform(0, self.jitter)
+        if event:
+            due = max([due] + [d[0] for d in self.delayed if d[2] == direction and d[4]])  # Reliable: in order
+        heapq.heappush(self.delayed, (due, self.order, direction, message, event))
+        self.order += 1
+
+    def start(self, event):
+        self.matches += 1
+        self.decoder = SnapshotDecoder(event.get("tick_rate", TICK_RATE))
+        self.world = tuple(event.get("world", (WIDTH, HEIGHT)))
+        obstacles = [Obstacle.from_dict(o) for o in event["obstacles"]]
+        self.predictor = Predictor(event["player"], obstacles, event["lives"], event["players"],
+                                   event.get("tick_rate", TICK_RATE), *self.world)
+        self.room = self.server.room_of(self.client.socket.getsockname())
+
+    def frame(self, now):
+        """One client tick: send this tick's input, take what arrived; False once the link is gone."""
+        client = self.client
+        for event in client.receive_events():
+            self.delay(now, "in", event, event=True)
+        message = client.receive()
+        if message is not None:
+            self.delay(now, "in", message)
+
+        while self.delayed and self.delayed[0][0] <= now:
+            _, _, direction, message, event = heapq.heappop(self.delayed)
+            if direction == "out":
+                client.send(message, event)
+            elif event:
+                self.on_event(message, now)
+            else:
+                self.on_snapshot(message, now)
+
+        if self.predictor:
+            if self.room is None:
+                self.room = self.server.room_of(self.client.socket.getsockname())
+            self.tick += 1
+            self.predictor.apply_local(scripted_input(self.tick, self.phase, self.rng, self.world))
+            packet = self.predictor.outgoing(self.decoder.ack_tick(self.predictor.keepalive_ticks))
+            if packet:
+                self.delay(now, "out", packet)
+            if self.room and self.decoder.last_tick is not None:
+                self.stats["staleness"].append(self.room.state.tick - self.decoder.last_tick)
+        self.client.flush()  # A new client if the match just ended
+        return self.client.running or bool(self.delayed)
+
+    def on_event(self, event, now):
+        kind = event.get("type")
+        if kind == "ping":
+            self.delay(now, "out", pong_message(event), event=True)
+        elif kind == "start":
+            self.start(event)
+        elif kind == "game_over":
+            self.client.close()
+            self.connect()  # Straight back into the queue for the next room
+
+    def on_snapshot(self, data, now):
+        if not isinstance(data, bytes) or not self.decoder:
+            return
+        try:
+            snapshot = self.decoder.decode(data)
+        except ValueError:
+            self.stats["undecodable"] += 1
+            return
+        if "tick" not in snapshot:
+            return
+        self.stats["snapshots"] += 1
+        started = self.server.tick_started.get(self.room, {}).get(snapshot["tick"])
+        if started is not None:
+            self.stats["latency"].append(now - started)
+        if "players" in snapshot and self.predictor.player_index < len(snapshot["players"]):
+            self.predictor.reconcile(snapshot)
+
+    def close(self):
+        self.client.close()
+
+
+def start_server(args):
+    """A LoadServer on a daemon thread, listening on 127.0.0.1; returns (server, port)."""
+    server = LoadServer(args.lives, args.players, args.tick_rate, world=args.world)
+    port = free_port()
+    # Told by the server task itself: a probe connection would join the waiting queue
+    listening = threading.Event()
+    threading.Thread(target=asyncio.run, args=(server.serve("127.0.0.1", port, listening.set),), daemon=True).start()
+    if not listening.wait(CONNECT_TIMEOUT):
+        raise SystemExit("server thread did not start listening")
+    return server, port
+
+
+def summarize(values, scale=1.0):
+    """(p50, p99, max) of `values` times `scale`."""
+    ordered = sorted(values)
+    return (percentile(ordered, 0.5) * scale, percentile(ordered, 0.99) * scale,
+            (ordered[-1] if ordered else 0.0) * scale)
+
+
+def run_step(server, clients, seconds, tick_rate):
+    """Play every client for `seconds`; returns the step's result row."""
+    interval = 1.0 / tick_rate
+    for client in clients:
+        client.reset_stats()
+    skipped_before = sum(conn.skipped for conn in list(server.connections))
+    rooms_before = server.rooms_started
+    server.take_ticks()
+    frame_times = []
+    start = next_frame = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        now = time.perf_counter()
+        for client in clients:
+            if not client.frame(now):
+                client.close()
+                client.connect()  # Dropped by the server: rejoin
+        frame_times.append(time.perf_counter() - now)
+        next_frame += interval
+        delay = next_frame - time.perf_counter()
+        if delay < -interval:
+            next_frame = time.perf_counter()  # The generator is behind; don't try to catch up
+        time.sleep(max(delay, 0))
+    elapsed = time.perf_counter() - start
+
+    ticks = server.take_ticks()
+    staleness = [s for client in clients for s in client.stats["staleness"]]
+    latency = [s for client in clients for s in client.stats["latency"]]
+    tick_p50, tick_p99, tick_max = summarize(ticks, 1e3)
+    stale_p50, stale_p99, stale_max = summarize(staleness)
+    latency_p50, latency_p99, latency_max = summarize(latency, 1e3)
+    frame_p50, frame_p99, _ = summarize(frame_times, 1e3)
+    return {
+        "clients": len(clients),
+        "rooms": len(server.rooms),
+        "rooms_started": server.rooms_started - rooms_before,
+        "waiting": len(server.waiting),
+        "server_ticks_per_second": len(ticks) / elapsed,
+        "tick_p50_ms": tick_p50,
+        "tick_p99_ms": tick_p99,
+        "tick_max_ms": tick_max,
+        "tick_budget_p99": tick_p99 / (interval * 1e3),
+        "staleness_p50_ticks": stale_p50,
+        "staleness_p99_ticks": stale_p99,
+        "staleness_max_ticks": stale_max,
+        "latency_p50_ms": latency_p50,
+        "latency_p99_ms": latency_p99,
+        "latency_max_ms": latency_max,
+        "snapshots_per_client_per_second": sum(c.stats["snapshots"] for c in clients) / len(clients) / elapsed,
+        "undecodable": sum(c.stats["undecodable"] for c in clients),
+        "skipped": sum(conn.skipped for conn in list(server.connections)) - skipped_before,
+        "generator_frame_p50_ms": frame_p50,
+        "generator_frame_p99_ms": frame_p99,
+    }
+
+
+def print_row(row, out):
+    print(f"{row['clients']:>7} {row['rooms']:>5} {row['server_ticks_per_second']:>6.1f} "
+          f"{row['tick_p50_ms']:>7.2f} {row['tick_p99_ms']:>7.2f} {row['tick_max_ms']:>7.2f} "
+          f"{row['tick_budget_p99']:>6.0%} {row['staleness_p50_ticks']:>5.0f} {row['staleness_p99_ticks']:>5.0f} "
+          f"{row['latency_p50_ms']:>7.1f} {row['latency_p99_ms']:>7.1f} {row['snapshots_per_client_per_second']:>6.1f} "
+          f"{row['skipped']:>7} {row['generator_frame_p99_ms']:>7.2f}", file=out, flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Loopback load test of the dedicated server")
+    parser.add_argument("--clients", default="2,4,8,16,32,64", help="comma-separated client counts to ramp through")
+    parser.add_argument("--seconds", type=float, default=10.0, help="seconds played at each step")
+    parser.add_argument("--players", type=int, default=2, help="players per room")
+    parser.add_argument("--lives", type=int, default=50, help="lives per player; high, so rooms last")
+    parser.add_argument("--tick-rate", type=int, default=TICK_RATE)
+    parser.add_argument("--world", type=parse_world, default=(WIDTH, HEIGHT), help="world size as WxH")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added each way")
+    parser.add_argument("--jitter", type=float, default=0.0, help="up to this many more seconds each way")
+    parser.add_argument("--loss", type=float, default=0.0, help="fraction of snapshots and input packets lost")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--verbose", action="store_true", help="keep the server's and clients' own output")
+    parser.add_argument("--json", metavar="PATH", help="write every step's numbers to PATH")
+    args = parser.parse_args()
+
+    counts = [int(n) for n in args.clients.split(",")]
+    if any(n < 1 for n in counts) or counts != sorted(counts):
+        parser.error("--clients must be increasing positive counts")
+    rng = random.Random(args.seed)
+    out = sys.stdout
+    rows = []
+    print(f"Rooms of {args.players} at {args.tick_rate} Hz in a {args.world[0]}x{args.world[1]} world, "
+          f"{args.seconds:g} s per step, latency {args.latency * 1e3:g} ms +{args.jitter * 1e3:g}, "
+          f"loss {args.loss:.0%}", file=out)
+    print(f"{'clients':>7} {'rooms':>5} {'tick/s':>6} {'tick ms':>7} {'p99':>7} {'max':>7} {'budget':>6} "
+          f"{'stale':>5} {'p99':>5} {'rx ms':>7} {'p99':>7} {'snap/s':>6} {'skipped':>7} {'gen p99':>7}", file=out)
+    with open(os.devnull, "w") as devnull:
+        quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(devnull)
+        with quiet:
+            server, port = start_server(args)
+            clients = []
+            for count in counts:
+                while len(clients) < count:
+                    clients.append(SyntheticClient(server, port, random.Random(rng.random()),
+                                                   args.latency, args.jitter, args.loss))
+                row = run_step(server, clients, args.seconds, args.tick_rate)
+                rows.append(row)
+                print_row(row, out)
+            for client in clients:
+                client.close()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "steps": rows}, f, indent=1)
+        print(f"Wrote {len(rows)} steps to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""Constructive obstacle placement and an on-disk map cache.
+
+Instead of throwing random rectangles at the arena and retrying on
+overlap, the arena is tracked as a grid of CELL-sized cells. For each
+obstacle a summed-area table gives every position where it still fits,
+one of those is picked at random, and a flood fill checks that all
+spawns can still reach each other. Every fitting position is tried
+before an obstacle is shrunk toward the minimum size, and a layout that
+still runs out of room is started over, a few times, before giving up.
+
+    python mapgen.py --cache maps --seeds 1000   # precompute seeds 0-999
+"""
+import argparse
+import hashlib
+import json
+import math
+import os
+import random
+import time
+
+import numpy as np
+
+MAPGEN_VERSION = 2  # Bump when the output for a given seed changes; invalidates caches
+CELL = 10  # Grid resolution in pixels
+MIN_SIZE = 40
+MAX_SIZE = 100
+MARGIN = 100  # Obstacle-free band along the arena edges
+SPAWN_CLEARANCE = 30  # Obstacle-free radius around each spawn
+PLAYER_RADIUS = 15
+WALL_CELLS = math.ceil(PLAYER_RADIUS / CELL)  # Cells around an obstacle a player's centre can't use
+LAYOUT_ATTEMPTS = 4  # Fresh starts before an arena counts as too full
+FILL_STEPS = 8  # Flood fill steps between checks for a result
+MAP_POOL_SIZE = 256
+
+
+def _spread(mask):
+    """Mask grown by one cell in all 8 directions."""
+    grown = mask.copy()
+    grown[1:] |= mask[:-1]
+    grown[:-1] |= mask[1:]
+    wide = grown.copy()
+    wide[:, 1:] |= grown[:, :-1]
+    wide[:, :-1] |= grown[:, 1:]
+    return wide
+
+
+def _fits(blocked, rows, cols):
+    """Flat indices of top-left cells where a rows x cols block is all free, and the row stride."""
+    if rows > blocked.shape[0] or cols > blocked.shape[1]:
+        return np.zeros(0, dtype=np.int64), 1
+    table = np.zeros((blocked.shape[0] + 1, blocked.shape[1] + 1), dtype=np.int32)
+    table[1:, 1:] = blocked.cumsum(0).cumsum(1)
+    area = table[rows:, cols:] - table[:-rows, cols:] - table[rows:, :-cols] + table[:-rows, :-cols]
+    return np.flatnonzero(area == 0), area.shape[1]
+
+
+def _wall(occupied):
+    """Cells a player's centre can't reach (conservatively) around `occupied` cells."""
+    wall = occupied
+    for _ in range(WALL_CELLS):
+        wall = _spread(wall)
+    return wall
+
+
+def _connected(wall, spawn_cells):
+    """True if every spawn is reachable from the first without crossing `wall`."""
+    free = ~wall
+    reach = np.zeros_like(free)
+    reach[spawn_cells[0]] = True
+    while True:
+        before = reach
+        for _ in range(FILL_STEPS):
+            grown = reach.copy()
+            grown[1:] |= reach[:-1]
+            grown[:-1] |= reach[1:]
+            grown[:, 1:] |= reach[:, :-1]
+            grown[:, :-1] |= reach[:, 1:]
+            grown &= free
+            reach = grown
+        if all(reach[cell] for cell in spawn_cells):
+            return True
+        if (reach == before).all():
+            return False
+
+
+def generate(count, width, height, spawns, rng=random, min_size=MIN_SIZE, max_size=MAX_SIZE, margin=MARGIN):
+    """`count` (x, y, width, height) rectangles that keep the spawns connected.
+
+    Placement is greedy, so a layout can paint itself into a corner on a
+    crowded arena; it is then started over from a fresh seed stream drawn
+    from `rng`. Raises ValueError if LAYOUT_ATTEMPTS layouts all ran out of
+    positions for a minimum-size obstacle.
+    """
+    rows, cols = math.ceil(height / CELL), math.ceil(width / CELL)
+    keep_clear = np.zeros((rows, cols), dtype=bool)
+    band = math.ceil(margin / CELL)
+    keep_clear[:band] = keep_clear[-band:] = True
+    keep_clear[:, :band] = keep_clear[:, -band:] = True
+    centres_y = (np.arange(rows) + 0.5) * CELL
+    centres_x = (np.arange(cols) + 0.5) * CELL
+    reach = SPAWN_CLEARANCE + 2 * CELL  # Also keeps each spawn's own cell walkable
+    for x, y in spawns:
+        keep_clear |= (centres_y[:, None] - y) ** 2 + (centres_x[None, :] - x) ** 2 < reach ** 2
+    spawn_cells = [(min(int(y // CELL), rows - 1), min(int(x // CELL), cols - 1)) for x, y in spawns]
+
+    for _ in range(LAYOUT_ATTEMPTS):
+        rects = _layout(count, keep_clear, spawn_cells, rng, min_size, max_size)
+        if len(rects) == count:
+            return rects
+        rng = random.Random(rng.getrandbits(64))
+    raise ValueError(f"No room for obstacle {len(rects) + 1} of {count}")
+
+
+def _layout(count, keep_clear, spawn_cells, rng, min_size, max_size):
+    """Place up to `count` rectangles one by one; stops early when one fits nowhere."""
+    rows, cols = keep_clear.shape
+    occupied = np.zeros((rows, cols), dtype=bool)
+    wall = np.zeros((rows, cols), dtype=bool)
+    rects = []
+    for placed_count in range(count):
+        # Dense maps: keep obstacles small enough to leave room for the rest
+        free_area = np.count_nonzero(~(keep_clear | occupied)) * CELL * CELL
+        size_cap = max(min_size, min(max_size, int(math.sqrt(free_area / (2 * (count - placed_count))))))
+        w = rng.randint(min_size, size_cap)
+        h = rng.randint(min_size, size_cap)
+        while True:
+            block_rows, block_cols = math.ceil(h / CELL), math.ceil(w / CELL)
+            candidates, stride = _fits(keep_clear | occupied, block_rows, block_cols)
+            candidates = candidates.tolist()
+            placed = False
+            # Every fitting position, in random order, before giving up on this size
+            for left_over in range(len(candidates), 0, -1):
+                pick = rng.randrange(left_over)
+                index = candidates[pick]
+                candidates[pick] = candidates[left_over - 1]
+                row, col = divmod(index, stride)
+                # An obstacle whose wall touches no other wall (or the arena edge)
+                # can't cut anyone off, so the flood fill is only needed otherwise
+                top, left = row - WALL_CELLS - 1, col - WALL_CELLS - 1
+                bottom, right = row + block_rows + WALL_CELLS + 1, col + block_cols + WALL_CELLS + 1
+                touches = (top < 0 or left < 0 or bottom > rows or right > cols
+                           or wall[max(top, 0):bottom, max(left, 0):right].any())
+                occupied[row:row + block_rows, col:col + block_cols] = True
+                new_wall = _wall(occupied) if touches else None
+                if not touches or len(spawn_cells) < 2 or _connected(new_wall, spawn_cells):
+                    wall[max(top + 1, 0):bottom - 1, max(left + 1, 0):right - 1] = True
+                    rects.append((col * CELL, row * CELL, w, h))
+                    placed = True
+                    break
+                occupied[row:row + block_rows, col:col + block_cols] = False
+            if placed:
+                break
+            if w == min_size and h == min_size:
+                return rects
+            w = max(min_size, int(w * 0.8))
+            h = max(min_size, int(h * 0.8))
+    return rects
+
+
+class MapCache:
+    """Generated maps on disk, one JSON file per seed and parameter set."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, seed, count, width, height, spawns):
+        params = {"version": MAPGEN_VERSION, "count": count, "width": width, "height": height,
+                  "spawns": [list(s) for s in spawns]}
+        digest = hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()[:12]
+        return os.path.join(self.directory, f"{digest}-{seed}.json")
+
+    def get(self, seed, count, width, height, spawns):
+        """Rectangles for this seed, generated and stored on the first request.
+
+        Raises ValueError, as generate() does, if they don't fit.
+        """
+        path = self.path(seed, count, width, height, spawns)
+        try:
+            with open(path) as f:
+                return [tuple(rect) for rect in json.load(f)]
+        except (OSError, ValueError):
+            pass
+        rects = generate(count, width, height, spawns, random.Random(seed))
+        temp = f"{path}.{os.getpid()}.tmp"
+        with open(temp, "w") as f:
+            json.dump(rects, f)
+        os.replace(temp, path)  # Atomic, so concurrent servers never read half a file
+        return rects
+
+
+def main():
+    from sim import WIDTH, HEIGHT, obstacle_count, parse_world, start_positions
+
+    parser = argparse.ArgumentParser(description="Precompute maps into a cache directory")
+    parser.add_argument("--cache", default="maps")
+    parser.add_argument("--seeds", type=int, default=MAP_POOL_SIZE, help="generate seeds 0..N-1")
+    parser.add_argument("--count", type=int, help="obstacles per map (default: by world area)")
+    parser.add_argument("--players", type=int, default=2)
+    parser.add_argument("--world", type=parse_world, default=(WIDTH, HEIGHT), metavar="WxH",
+                        help="arena size; match the server's --world")
+    args = parser.parse_args()
+
+    cache = MapCache(args.cache)
+    width, height = args.world
+    spawns = start_positions(args.players, width, height)
+    count = args.count or obstacle_count(width, height)
+    start = time.perf_counter()
+    failed = 0
+    for seed in range(args.seeds):
+        try:
+            cache.get(seed, count, width, height, spawns)
+        except ValueError as e:
+            print(f"Seed {seed}: {e}")
+            failed += 1
+    elapsed = time.perf_counter() - start
+    print(f"{args.seeds - failed} maps in {args.cache} ({elapsed:.1f} s)")
+
+
+if __name__ == "__main__":
+    main()
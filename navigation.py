@@ -0,0 +1,148 @@
+"""Grid navigation for bots: flow fields and line of sight.
+
+The obstacle layout is rasterised once per map into a grid of CELL-sized
+cells a player's centre can stand in. Toward any target cell a BFS gives
+every cell the neighbour to step to next (a flow field); fields are
+cached per target cell, so a bot chasing someone only pays for a new
+field when the target crosses into a cell nobody has asked about yet.
+Line of sight between cells is computed a whole row (one source cell to
+every cell) at a time and cached too. After that, a bot's decision each
+tick is a few array lookups.
+"""
+from collections import OrderedDict, deque
+
+import numpy as np
+
+CELL = 20
+MAX_FLOW_FIELDS = 256  # Cached target cells per map (LRU)
+MAX_SIGHT_ROWS = 512  # Cached line-of-sight rows per map (LRU)
+NEIGHBOURS = [(-1, 0), (1, 0), (0, -1), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1)]
+
+
+class NavGrid:
+    """Walkable cells for a circle of `radius` among rectangle `obstacles`."""
+
+    def __init__(self, obstacles, width, height, radius=15, shot_radius=5, cell=CELL):
+        self.cell = cell
+        self.cols = int(np.ceil(width / cell))
+        self.rows = int(np.ceil(height / cell))
+        xs = (np.arange(self.cols) + 0.5) * cell
+        ys = (np.arange(self.rows) + 0.5) * cell
+        self.centres_x = np.tile(xs, self.rows)  # Flat index = row * cols + col
+        self.centres_y = np.repeat(ys, self.cols)
+
+        rects = np.array([(o.x, o.y, o.x + o.width, o.y + o.height) for o in obstacles],
+                         dtype=float).reshape(-1, 4)
+        walkable = np.ones(self.rows * self.cols, dtype=bool)
+        for left, top, right, bottom in rects:
+            dx = self.centres_x - np.clip(self.centres_x, left, right)
+            dy = self.centres_y - np.clip(self.centres_y, top, bottom)
+            walkable &= dx * dx + dy * dy >= radius * radius
+        self.walkable = walkable
+        self.walkable_list = walkable.tolist()
+        # Shots are blocked by obstacles grown by the bullet radius (square
+        # corners, so a shot grazing a corner is conservatively refused)
+        self.shot_rects = rects + np.array([-shot_radius, -shot_radius, shot_radius, shot_radius])
+        self.flows = OrderedDict()  # target cell -> next cell per cell (-1 = none)
+        self.sight = OrderedDict()  # source cell -> visible flag per cell
+
+    def cell_at(self, x, y):
+        col = min(max(int(x // self.cell), 0), self.cols - 1)
+        row = min(max(int(y // self.cell), 0), self.rows - 1)
+        return row * self.cols + col
+
+    def centre(self, cell):
+        return self.centres_x[cell], self.centres_y[cell]
+
+    def flow(self, target):
+        """Next-cell array toward `target`, built by BFS on first use."""
+        field = self.flows.get(target)
+        if field is not None:
+            self.flows.move_to_end(target)
+            return field
+        cols, rows, walkable = self.cols, self.rows, self.walkable_list
+        distance = [-1] * (rows * cols)  # Plain lists: much faster than numpy per element
+        distance[target] = 0
+        queue = deque([target])
+        while queue:
+            cell = queue.popleft()
+            row, col = divmod(cell, cols)
+            d = distance[cell] + 1
+            for dr, dc in NEIGHBOURS[:4]:
+                r, c = row + dr, col + dc
+                if 0 <= r < rows and 0 <= c < cols:
+                    n = r * cols + c
+                    if distance[n] < 0 and walkable[n]:
+                        distance[n] = d
+                        queue.append(n)
+        distance = np.array(distance)
+
+        # Each reached cell steps to its closest neighbour. Diagonals win ties
+        # (shorter on screen) but only when both orthogonal cells are open,
+        # so bots don't clip corners.
+        grid = np.where(distance < 0, np.inf, distance.astype(float)).reshape(rows, cols)
+        padded = np.pad(grid, 1, constant_values=np.inf)
+        costs = []
+        for dr, dc in NEIGHBOURS:
+            cost = padded[1 + dr:1 + dr + rows, 1 + dc:1 + dc + cols]
+            if dr and dc:
+                corner = np.isinf(padded[1 + dr:1 + dr + rows, 1:1 + cols]) | \
+                    np.isinf(padded[1:1 + rows, 1 + dc:1 + dc + cols])
+                cost = np.where(corner, np.inf, cost - 0.5)
+            costs.append(cost.ravel())
+        costs = np.array(costs)
+        choice = costs.argmin(axis=0)
+        offsets = np.array([dr * cols + dc for dr, dc in NEIGHBOURS])
+        field = np.arange(rows * cols) + offsets[choice]
+        field[(distance <= 0) | np.isinf(costs.min(axis=0))] = -1
+
+        self.flows[target] = field
+        if len(self.flows) > MAX_FLOW_FIELDS:
+            self.flows.popitem(last=False)
+        return field
+
+    def step_toward(self, x, y, target_x, target_y):
+        """Point to head for from (x, y) to reach the target around obstacles.
+
+        Returns the target itself when it is in the same cell or unreachable.
+        """
+        here = self.cell_at(x, y)
+        goal = self.cell_at(target_x, target_y)
+        if here == goal:
+            return target_x, target_y
+        next_cell = self.flow(goal)[here]
+        if next_cell < 0:
+            return target_x, target_y
+        return self.centre(next_cell)
+
+    def sight_row(self, source):
+        """Which cells a shot fired from `source` cell's centre reaches."""
+        row = self.sight.get(source)
+        if row is not None:
+            self.sight.move_to_end(source)
+            return row
+        sx, sy = self.centre(source)
+        dx = self.centres_x - sx
+        dy = self.centres_y - sy
+        row = np.ones(self.rows * self.cols, dtype=bool)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for left, top, right, bottom in self.shot_rects:
+                # Liang-Barsky: clip the segment source -> cell centre to the rectangle
+                t0 = np.zeros_like(dx)
+                t1 = np.ones_like(dx)
+                outside = np.zeros_like(row)
+                for p, q in ((-dx, sx - left), (dx, right - sx), (-dy, sy - top), (dy, bottom - sy)):
+                    r = q / p
+                    t0 = np.where(p < 0, np.maximum(t0, r), t0)
+                    t1 = np.where(p > 0, np.minimum(t1, r), t1)
+                    outside |= (p == 0) & (q < 0)
+                row &= outside | (t0 > t1)
+        row[source] = True
+        self.sight[source] = row
+        if len(self.sight) > MAX_SIGHT_ROWS:
+            self.sight.popitem(last=False)
+        return row
+
+    def can_see(self, x, y, target_x, target_y):
+        """True if a shot from (x, y) at the target would clear every obstacle."""
+        return bool(self.sight_row(self.cell_at(x, y))[self.cell_at(target_x, target_y)])
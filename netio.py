@@ -0,0 +1,310 @@
+"""Network I/O on a background thread.
+
+The game loop never touches a socket. Once a match starts, a worker
+thread owns the connected endpoint (any transport in network.py) and does
+all of the framing, snapshot encoding and decoding. Results cross between
+the two threads through deques, whose append and popleft are atomic, so
+neither side takes a lock or waits on the other:
+
+- state going out sits in a one-slot deque; a newer tick replaces one the
+  worker has not sent yet
+- decoded messages coming in sit in a bounded deque; if the game stalls,
+  the oldest are dropped
+- events (match start, game over) are queued in full and in order
+
+Posting to the worker writes a byte to a socket pair so it wakes from
+select() at once; otherwise it sleeps until a socket is readable.
+
+The worker also keeps the links' telemetry: it pings every remote end,
+answers their pings straight away, samples the rates once a second and
+prints a summary every LOG_INTERVAL (see telemetry.py).
+"""
+import select
+import socket
+import threading
+import time
+from collections import deque
+
+from network import SnapshotDecoder, SnapshotFanout, decode_input_packet
+from sim import WIDTH, HEIGHT, TICK_RATE
+from telemetry import LOG_INTERVAL, ping_message, pong_message
+
+IDLE_WAIT = 0.05  # Longest select() sleep, so a stop request is noticed
+BACKLOG_WAIT = 0.002  # Sleep while frames or delayed packets wait to go out
+INPUT_QUEUE_SIZE = 64  # Decoded input packets kept for the host loop
+SNAPSHOT_QUEUE_SIZE = 8  # Decoded snapshots kept for the join loop
+SAMPLE_INTERVAL = 1.0  # Seconds between telemetry rate samples
+
+
+class NetworkWorker:
+    """Runs `pump` on a daemon thread whenever a socket or the game has something."""
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.running = endpoint.running
+        self.outbox = deque()  # (client index or None for everyone, event) to send reliably
+        self.stopping = False
+        self.next_sample = 0.0
+        self.next_log = time.monotonic() + LOG_INTERVAL
+        self.wake_reader, self.wake_writer = socket.socketpair()
+        self.wake_reader.setblocking(False)
+        self.wake_writer.setblocking(False)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def wake(self):
+        try:
+            self.wake_writer.send(b"\0")
+        except (BlockingIOError, OSError):
+            pass  # Already has a wake-up pending, or closed
+
+    def send_event(self, data, index=None):
+        """Queue an event for one client index, or for everyone."""
+        self.outbox.append((index, data))
+        self.wake()
+
+    def links(self):
+        """LinkStats per remote end, in client index order (see telemetry.py)."""
+        return self.endpoint.links()
+
+    def close(self):
+        """Ask the worker to send what is queued and close the endpoint; doesn't wait."""
+        self.stopping = True
+        self.running = False
+        self.wake()
+
+    def run(self):
+        endpoint = self.endpoint
+        while True:
+            self.pump()
+            if self.stopping or not endpoint.running:
+                break
+            wait = BACKLOG_WAIT if self.backlog() else IDLE_WAIT
+            try:
+                select.select(self.sockets() + [self.wake_reader], [], [], wait)
+                while self.wake_reader.recv(4096):
+                    pass
+            except BlockingIOError:
+                pass
+            except (OSError, ValueError):
+                break  # A socket was closed under us
+        self.running = False  # After pump queued the last events, so the game sees them first
+        self.finish()
+        self.wake_reader.close()
+        self.wake_writer.close()
+
+    def sockets(self):
+        """Sockets to wake up for."""
+        return self.endpoint.sockets()
+
+    def backlog(self):
+        """True while something waits to go out, so the worker polls sooner."""
+        return self.endpoint.backlog()
+
+    def finish(self):
+        """Send events queued after the last pump (game over right before close), then close."""
+        self.send_outbox()
+        self.endpoint.close()
+
+    def broadcast(self, data):
+        """Send an event to every remote end."""
+        self.endpoint.send_event(data)
+
+    def send_outbox(self):
+        while self.outbox:
+            index, data = self.outbox.popleft()
+            if index is None:
+                self.broadcast(data)
+            else:
+                self.endpoint.send_to(index, data, event=True)
+
+    def pump(self):
+        """Send what the game posted and read what arrived."""
+        self.send_outbox()
+
+        now = time.monotonic()
+        links = self.links()
+        for index, stats in enumerate(links):
+            if stats.ping_due(now):
+                self.send_control(index, ping_message(now))
+        if now >= self.next_sample:
+            self.next_sample = now + SAMPLE_INTERVAL
+            for stats in links:
+                stats.sample(now)
+        if now >= self.next_log:
+            self.next_log = now + LOG_INTERVAL
+            for stats in links:
+                print(stats.summary())
+
+    def send_control(self, index, data):
+        """Send a telemetry event to one remote end."""
+        self.endpoint.send_to(index, data, event=True)
+
+    def control(self, index, event):
+        """Answer a ping or take a pong from remote end `index`; False for any other event."""
+        kind = event.get("type") if isinstance(event, dict) else None
+        if kind == "ping":
+            self.send_control(index, pong_message(event))
+        elif kind == "pong":
+            self.links()[index].on_pong(event)
+        else:
+            return False
+        return True
+
+
+class HostWorker(NetworkWorker):
+    """Owns a started server: decodes client inputs and fans out snapshots.
+
+    `world` and `players` (client index -> player index) go to the
+    SnapshotFanout for interest management. A listening
+    relay.SpectatorRelay, if given, gets the states and events sent to
+    everyone, and is served from this thread until its delayed stream
+    has run out after the match. `connected` holds the client indices
+    whose connection is still open.
+    """
+
+    def __init__(self, server, tick_rate=TICK_RATE, world=(WIDTH, HEIGHT), players=None, relay=None):
+        super().__init__(server)
+        self.relay = relay
+        self.dt = 1.0 / tick_rate
+        self.fanout = SnapshotFanout(tick_rate, world, players)
+        self.state_slot = deque(maxlen=1)  # (state dict, input acks) of the newest tick
+        self.received = deque(maxlen=INPUT_QUEUE_SIZE)  # (client index, seq, changes)
+        self.connected = frozenset(server.connected())  # Client indices still connected, replaced whole
+
+    def publish(self, state, input_acks):
+        """Hand over this tick's `state.to_dict()` and input acks per client index."""
+        self.state_slot.append((state, input_acks))
+        self.wake()
+
+    def inputs(self):
+        """Pop every (client index, seq, changes) decoded since the last call."""
+        return [self.received.popleft() for _ in range(len(self.received))]
+
+    def pump(self):
+        super().pump()
+        server = self.endpoint
+        links = server.links()
+        for index in range(len(links)):
+            for event in server.receive_events_from(index):
+                self.control(index, event)
+        for index, message in enumerate(server.receive_all()):
+            if isinstance(message, bytes):
+                try:
+                    seq, ack, changes = decode_input_packet(message)
+                except ValueError:
+                    links[index].dropped_in += 1
+                    continue
+                links[index].on_arrival(seq * self.dt)  # Input seqs count the client's ticks
+                self.received.append((index, seq, changes))
+                if ack is not None:
+                    self.fanout.ack(index, ack)
+        connected = frozenset(server.connected())
+        for index in self.connected - connected:
+            self.fanout.remove(index)
+        self.connected = connected
+        if self.state_slot:
+            state, input_acks = self.state_slot.popleft()
+            # One encode per tick (per client in a big world); each client gets its own header
+            for index, snapshot in self.fanout.encode(state, input_acks).items():
+                server.send_to(index, snapshot)
+            if self.relay:
+                self.relay.publish(state)
+        server.flush()
+        if self.relay:
+            self.relay.pump()
+
+    def sockets(self):
+        return super().sockets() + (self.relay.sockets() if self.relay else [])
+
+    def backlog(self):
+        return super().backlog() or bool(self.relay and self.relay.backlog())
+
+    def broadcast(self, data):
+        super().broadcast(data)
+        if self.relay:
+            self.relay.send_event(data)
+
+    def finish(self):
+        super().finish()
+        relay = self.relay
+        if not relay:
+            return
+        # Spectators are behind: play out the rest of the match to those already
+        # watching, with the port already free for a rematch
+        relay.stop_listening()
+        deadline = time.monotonic() + relay.delay + 1.0
+        while not relay.finished() and time.monotonic() < deadline:
+            relay.pump()
+            try:
+                select.select(relay.sockets(), [], [], BACKLOG_WAIT)
+            except (OSError, ValueError):
+                break
+        relay.close()
+
+
+class JoinWorker(NetworkWorker):
+    """Owns a connected client: decodes snapshots and sends input packets.
+
+    The snapshot decoder is created from the host's start event, which
+    always arrives before the first snapshot.
+    """
+
+    def __init__(self, client):
+        super().__init__(client)
+        self.decoder = None
+        self.input_slot = deque(maxlen=1)  # Newest input packet; each one repeats unacked changes
+        self.snapshots = deque(maxlen=SNAPSHOT_QUEUE_SIZE)  # (snapshot, arrival time)
+        self.inbox = deque()
+
+    @property
+    def last_tick(self):
+        """Newest snapshot tick decoded."""
+        return self.decoder.last_tick if self.decoder else None
+
+    def ack_tick(self, grid=1):
+        """Snapshot tick to ack in input packets (see SnapshotDecoder.ack_tick)."""
+        return self.decoder.ack_tick(grid) if self.decoder else None
+
+    def send_input(self, packet):
+        self.input_slot.append(packet)
+        self.wake()
+
+    def send_control(self, index, data):
+        self.endpoint.send_event(data)
+
+    def events(self):
+        """Pop every event received since the last call."""
+        return [self.inbox.popleft() for _ in range(len(self.inbox))]
+
+    def received(self):
+        """Pop every (snapshot, arrival time) decoded since the last call, oldest first."""
+        return [self.snapshots.popleft() for _ in range(len(self.snapshots))]
+
+    def pump(self):
+        super().pump()
+        client = self.endpoint
+        if self.input_slot:
+            client.send(self.input_slot.popleft())
+        for event in client.receive_events():
+            if self.control(0, event):
+                continue
+            if event.get("type") == "start":
+                self.decoder = SnapshotDecoder(event.get("tick_rate", TICK_RATE))
+            self.inbox.append(event)
+        message = client.receive()
+        if isinstance(message, bytes) and self.decoder:
+            stats = client.links()[0]
+            try:
+                snapshot = self.decoder.decode(message)
+            except ValueError:
+                snapshot = None  # Delta against a baseline we no longer have
+                stats.dropped_in += 1
+            if snapshot and "tick" in snapshot:
+                now = time.monotonic()
+                stats.on_arrival(snapshot["tick"] * self.decoder.dt, now)
+                self.snapshots.append((snapshot, now))
+        client.flush()
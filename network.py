@@ -1,71 +1,765 @@
 import socket
 import json
-import threading
+import heapq
+import random
+import struct
+import time
+from collections import deque
+
+import numpy as np
+
+from sim import WIDTH, HEIGHT, VIEW_WIDTH, VIEW_HEIGHT, TICK_RATE, make_input, view_origin
+from telemetry import LinkStats
 
 BUFFER_SIZE = 4096
-DELIMITER = b'\n'
+
+# Every message on a stream is a FRAME header followed by `length` payload bytes.
+FRAME = struct.Struct("<IB")  # payload length, flags
+FLAG_BINARY = 1  # Payload is a binary snapshot, not JSON
+FLAG_EVENT = 2  # Never dropped as stale (match start, hits, game over)
+MAX_FRAME_SIZE = 1 << 20
+MAX_QUEUED_FRAMES = 256  # A peer this far behind on events is dropped
+
+# Datagram transport: every packet is PACKET, then its events, then the payload.
+PACKET = struct.Struct("<BBIII")  # protocol version, flags, seq, ack, event ack
+PACKET_EVENT = struct.Struct("<IH")  # event id, length
+PROTOCOL_VERSION = 1
+PKT_HELLO = 1  # Handshake, payload is empty
+PKT_CLOSE = 2  # Peer is going away
+PKT_PAYLOAD = 4  # Packet carries a state/input payload after its events
+PKT_BINARY = 8  # Payload is a binary snapshot, not JSON
+MAX_DATAGRAM = 65507
+MAX_EVENTS_PER_PACKET = 16
+HANDSHAKE_ATTEMPTS = 10
+HANDSHAKE_TIMEOUT = 0.5
+
+# Binary snapshot format. Bump SNAPSHOT_VERSION whenever a layout below changes.
+SNAPSHOT_VERSION = 3
+KIND_FULL = 1  # Complete state
+KIND_DELTA = 2  # Changes against a baseline tick the client acknowledged
+
+HEADER = struct.Struct("<BBIII")  # version, kind, tick, baseline tick, input ack
+COUNT = struct.Struct("<H")
+PLAYER = struct.Struct("<ffBB")  # x, y, alive, lives
+BULLET = struct.Struct("<Hffffb")  # id, x, y, vx, vy (pixels per second), owner
+BULLET_ID = struct.Struct("<H")
+F32 = struct.Struct("<f")
+
+# Delta field mask per player
+PLAYER_POS = 1
+PLAYER_STATUS = 2
+
+SNAPSHOT_HISTORY = 64  # Ticks of sent / received snapshots kept as baselines
+EXTRAPOLATION_TOLERANCE = 0.01  # Pixels a bullet may drift before it is resent
+INTEREST_MARGIN = 200  # Pixels beyond a player's view that bullets are still sent for
+
+# Binary input packets, client to host. Only ticks where the input changed
+# are listed; the host holds the keys in between.
+INPUT_VERSION = 2  # Version 2: shots carry the snapshot tick they were aimed at
+INPUT_HEADER = struct.Struct("<BIIB")  # version, newest input seq, snapshot ack (0 = none), change count
+INPUT_CHANGE = struct.Struct("<HB")  # ticks before the newest seq, INPUT_* bits
+INPUT_TARGET = struct.Struct("<HH")  # shoot target in 1 / SHOT_SCALE pixels, after an INPUT_SHOOT change
+INPUT_VIEW_TICK = struct.Struct("<I")  # snapshot tick the shooter was looking at, after INPUT_VIEW
+INPUT_KEYS = {"left": 1, "right": 2, "up": 4, "down": 8}
+INPUT_SHOOT = 16
+INPUT_VIEW = 32
+SHOT_SCALE = 4
+MAX_INPUT_CHANGES = 255
+
+
+def _f32(value):
+    """Round a float the way it will look after a trip through the wire."""
+    return F32.unpack(F32.pack(value))[0]
+
+
+def _quantize_player(data):
+    return {"x": _f32(data["x"]), "y": _f32(data["y"]),
+            "alive": bool(data["alive"]), "lives": data["lives"]}
+
+
+def _quantize_bullet(data):
+    return {"id": data["id"] & 0xFFFF, "x": _f32(data["x"]), "y": _f32(data["y"]),
+            "vx": _f32(data["vx"]), "vy": _f32(data["vy"]), "owner": data["owner"]}
+
+
+def _advance_bullet(data, seconds):
+    """Where a bullet from a baseline is `seconds` later."""
+    moved = dict(data)
+    moved["x"] = data["x"] + data["vx"] * seconds
+    moved["y"] = data["y"] + data["vy"] * seconds
+    return moved
+
+
+class SnapshotEncoder:
+    """Server side of the snapshot codec.
+
+    Feed it `GameState.to_dict()` every tick, plus an optional "input_ack"
+    (the last client input seq applied) for prediction. Until the client
+    acks a tick it sends full snapshots; afterwards it sends deltas against
+    the newest acked snapshot. Unchanged players and bullets that are
+    where their baseline velocity puts them are left out. `tick_rate` is
+    the match's, so the decoder must be given the same one.
+    """
+
+    def __init__(self, tick_rate=TICK_RATE):
+        self.dt = 1.0 / tick_rate
+        self.history = {}  # tick -> what a client holds after decoding that tick
+        self.baseline_tick = None
+        self.current = None  # (tick, quantized players, quantized bullets)
+        self.bodies = {}  # baseline tick (None = full) -> body for the current tick
+
+    def ack(self, tick):
+        """Record that the client has decoded the snapshot for `tick`."""
+        if tick in self.history and (self.baseline_tick is None or tick > self.baseline_tick):
+            self.baseline_tick = tick
+
+    def encode(self, state):
+        self.add(state)
+        return self.pack(self.baseline_tick, state.get("input_ack", 0))
+
+    def add(self, state):
+        """Quantize a new tick; later `body`/`pack` calls encode against it."""
+        tick = state["tick"]
+        players = [_quantize_player(p) for p in state["players"]]
+        bullets = [_quantize_bullet(b) for b in state["bullets"]]
+        self.current = (tick, players, bullets)
+        self.bodies = {}
+        for old in [t for t in self.history if t <= tick - SNAPSHOT_HISTORY]:
+            del self.history[old]
+        if self.baseline_tick not in self.history:
+            self.baseline_tick = None
+
+    def body(self, baseline_tick=None):
+        """Encoded body of the current tick, built once per baseline.
+
+        Returns (kind, baseline tick, body); falls back to a full snapshot
+        when the baseline is unknown.
+        """
+        if baseline_tick not in self.history:
+            baseline_tick = None
+        if baseline_tick not in self.bodies:
+            tick, players, bullets = self.current
+            if baseline_tick is None:
+                body = self._encode_full(players, bullets)
+                view = {"players": players, "bullets": {b["id"]: b for b in bullets}}
+            else:
+                body, view = self._encode_delta((tick - baseline_tick) * self.dt, players, bullets,
+                                                self.history[baseline_tick])
+            self.bodies[baseline_tick] = body
+            # Deltas win: most clients decode those, full snapshots only differ by rounding
+            if baseline_tick is not None or tick not in self.history:
+                self.history[tick] = view
+        kind = KIND_FULL if baseline_tick is None else KIND_DELTA
+        return kind, baseline_tick, self.bodies[baseline_tick]
+
+    def pack(self, baseline_tick=None, input_ack=0):
+        """Complete snapshot message for one client."""
+        kind, baseline_tick, body = self.body(baseline_tick)
+        tick = self.current[0]
+        return HEADER.pack(SNAPSHOT_VERSION, kind, tick, baseline_tick or 0, input_ack) + body
+
+    def _encode_full(self, players, bullets):
+        parts = [COUNT.pack(len(players))]
+        for p in players:
+            parts.append(PLAYER.pack(p["x"], p["y"], p["alive"], p["lives"]))
+        parts.append(COUNT.pack(len(bullets)))
+        for b in bullets:
+            parts.append(BULLET.pack(b["id"], b["x"], b["y"], b["vx"], b["vy"], b["owner"]))
+        return b"".join(parts)
+
+    def _encode_delta(self, seconds, players, bullets, baseline):
+        parts = [COUNT.pack(len(players))]
+        view_players = []
+        for i, p in enumerate(players):
+            old = baseline["players"][i] if i < len(baseline["players"]) else None
+            mask = 0
+            if old is None or (p["x"], p["y"]) != (old["x"], old["y"]):
+                mask |= PLAYER_POS
+            if old is None or (p["alive"], p["lives"]) != (old["alive"], old["lives"]):
+                mask |= PLAYER_STATUS
+            parts.append(bytes((mask,)))
+            if mask & PLAYER_POS:
+                parts.append(struct.pack("<ff", p["x"], p["y"]))
+            if mask & PLAYER_STATUS:
+                parts.append(struct.pack("<BB", p["alive"], p["lives"]))
+            view_players.append(p)
+
+        view_bullets = {}
+        changed = []
+        for b in bullets:
+            old = baseline["bullets"].get(b["id"])
+            if old is not None and (old["vx"], old["vy"], old["owner"]) == (b["vx"], b["vy"], b["owner"]):
+                predicted = _advance_bullet(old, seconds)
+                if (abs(predicted["x"] - b["x"]) <= EXTRAPOLATION_TOLERANCE and
+                        abs(predicted["y"] - b["y"]) <= EXTRAPOLATION_TOLERANCE):
+                    view_bullets[b["id"]] = predicted
+                    continue
+            changed.append(b)
+            view_bullets[b["id"]] = b
+        removed = [bid for bid in baseline["bullets"] if bid not in view_bullets]
+
+        parts.append(COUNT.pack(len(removed)))
+        parts.extend(BULLET_ID.pack(bid) for bid in removed)
+        parts.append(COUNT.pack(len(changed)))
+        for b in changed:
+            parts.append(BULLET.pack(b["id"], b["x"], b["y"], b["vx"], b["vy"], b["owner"]))
+        return b"".join(parts), {"players": view_players, "bullets": view_bullets}
+
+
+def interest_area(x, y, width=WIDTH, height=HEIGHT, margin=INTEREST_MARGIN):
+    """(left, top, right, bottom) of the world a player at (x, y) is sent bullets for.
+
+    That is their view plus `margin`, so a shot is already known by the time
+    it flies on screen.
+    """
+    left, top = view_origin(x, y, width, height)
+    return left - margin, top - margin, left + VIEW_WIDTH + margin, top + VIEW_HEIGHT + margin
+
+
+class SnapshotFanout:
+    """Encodes each tick once for every client of a match.
+
+    Clients ack ticks they decoded. An idle client only acks now and then,
+    so clients ack ticks on a shared grid (`SnapshotDecoder.ack_tick`)
+    whatever their timing. The delta baseline is the tick acked by the
+    most clients (newest on ties), so one delta body serves all of them; a
+    client that hasn't acked it yet gets a delta against its own newest
+    acked tick, and only a client with no acked tick left in history gets
+    a full snapshot. Bodies are built once per baseline, not per client.
+    Only the small header, which carries each client's input ack, is
+    packed per client.
+
+    In a world bigger than one `interest_area`, `players` (client -> the
+    player index it controls) switches to interest management: each
+    client has its own encoder and is only sent the bullets around its
+    player, so its snapshots cost the same whatever the world holds.
+    Players are always all sent; there are few and the HUD shows them.
+    """
+
+    def __init__(self, tick_rate=TICK_RATE, world=(WIDTH, HEIGHT), players=None):
+        self.tick_rate = tick_rate
+        self.encoder = SnapshotEncoder(tick_rate)
+        self.acked = {}  # client -> ticks it acked that are still in history
+        self.world = world
+        self.players = players
+        self.culled = players is not None and (world[0] > VIEW_WIDTH + INTEREST_MARGIN or
+                                               world[1] > VIEW_HEIGHT + INTEREST_MARGIN)
+        self.encoders = {}  # client -> its own SnapshotEncoder, when culled
+
+    def ack(self, client, tick):
+        if self.culled:
+            if client in self.encoders:
+                self.encoders[client].ack(tick)
+        elif tick in self.encoder.history:
+            self.acked.setdefault(client, set()).add(tick)
+
+    def remove(self, client):
+        self.acked.pop(client, None)
+        self.encoders.pop(client, None)
+
+    def encode(self, state, input_acks):
+        """Snapshot bytes per client; `input_acks` maps client -> input ack."""
+        if self.culled:
+            return self._encode_culled(state, input_acks)
+        encoder = self.encoder
+        encoder.add(state)
+        counts = {}
+        for client in input_acks:
+            ticks = self.acked.get(client, set())
+            ticks.intersection_update(encoder.history)
+            for tick in ticks:
+                counts[tick] = counts.get(tick, 0) + 1
+        baseline = max(counts, key=lambda t: (counts[t], t)) if counts else None
+
+        messages = {}
+        for client, input_ack in input_acks.items():
+            ticks = self.acked.get(client, ())
+            own = baseline if baseline in ticks else max(ticks, default=None)
+            messages[client] = encoder.pack(own, input_ack)
+        return messages
+
+    def _encode_culled(self, state, input_acks):
+        bullets = state["bullets"]
+        xs = np.array([b["x"] for b in bullets], dtype=float)
+        ys = np.array([b["y"] for b in bullets], dtype=float)
+        messages = {}
+        for client, input_ack in input_acks.items():
+            player = state["players"][self.players[client]]
+            left, top, right, bottom = interest_area(player["x"], player["y"], *self.world)
+            near = np.flatnonzero((xs >= left) & (xs <= right) & (ys >= top) & (ys <= bottom))
+            encoder = self.encoders.get(client)
+            if encoder is None:
+                encoder = self.encoders[client] = SnapshotEncoder(self.tick_rate)
+            encoder.add({"tick": state["tick"], "players": state["players"],
+                         "bullets": [bullets[i] for i in near.tolist()]})
+            messages[client] = encoder.pack(encoder.baseline_tick, input_ack)
+        return messages
+
+
+class SnapshotDecoder:
+    """Client side of the snapshot codec.
+
+    `decode` returns a dict shaped like `GameState.to_dict()`, so the
+    result goes straight into the existing `from_dict` methods (the map
+    arrives in the JSON start event). Raises ValueError for
+    data it cannot use (wrong version, unknown baseline).
+    """
+
+    def __init__(self, tick_rate=TICK_RATE):
+        self.dt = 1.0 / tick_rate
+        self.history = {}  # tick -> decoded view, kept as delta baselines
+        self.last_tick = None  # Newest snapshot decoded
+
+    def ack_tick(self, grid=1):
+        """Tick to ack: the newest decoded one on a multiple of `grid`.
+
+        Clients that ack only every `grid` ticks, each at its own moment,
+        then still ack the same ticks, so the host can delta all of them
+        against one baseline. Falls back to the newest tick decoded.
+        """
+        newest = self.last_tick  # Read once: the network thread may be decoding
+        if newest is None or grid <= 1:
+            return newest
+        tick = newest - newest % grid
+        while tick > newest - SNAPSHOT_HISTORY:
+            if tick in self.history:
+                return tick
+            tick -= grid
+        return newest
+    def decode(self, data):
+        view = memoryview(data)
+        version, kind, tick, baseline_tick, input_ack = HEADER.unpack_from(view, 0)
+        if version != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported snapshot version {version}")
+        offset = HEADER.size
+
+        if kind == KIND_FULL:
+            players, bullets = self._decode_full(view, offset)
+        elif kind == KIND_DELTA:
+            baseline = self.history.get(baseline_tick)
+            if baseline is None:
+                raise ValueError(f"Missing baseline for tick {baseline_tick}")
+            players, bullets = self._decode_delta(view, offset, baseline, (tick - baseline_tick) * self.dt)
+        else:
+            raise ValueError(f"Unknown snapshot kind {kind}")
+
+        self.history[tick] = {"players": players, "bullets": bullets}
+        for old in [t for t in self.history if t <= tick - SNAPSHOT_HISTORY]:
+            del self.history[old]
+        if self.last_tick is None or tick > self.last_tick:
+            self.last_tick = tick
+        return {
+            "tick": tick,
+            "input_ack": input_ack,
+            "players": [dict(p) for p in players],
+            "bullets": [dict(b) for b in bullets.values()],
+        }
+
+    def _decode_full(self, view, offset):
+        (count,) = COUNT.unpack_from(view, offset)
+        offset += COUNT.size
+        players = []
+        for _ in range(count):
+            x, y, alive, lives = PLAYER.unpack_from(view, offset)
+            offset += PLAYER.size
+            players.append({"x": x, "y": y, "alive": bool(alive), "lives": lives})
+        (count,) = COUNT.unpack_from(view, offset)
+        offset += COUNT.size
+        bullets = {}
+        for _ in range(count):
+            bid, x, y, vx, vy, owner = BULLET.unpack_from(view, offset)
+            offset += BULLET.size
+            bullets[bid] = {"id": bid, "x": x, "y": y, "vx": vx, "vy": vy, "owner": owner}
+        return players, bullets
+
+    def _decode_delta(self, view, offset, baseline, seconds):
+        (count,) = COUNT.unpack_from(view, offset)
+        offset += COUNT.size
+        players = []
+        for i in range(count):
+            player = dict(baseline["players"][i]) if i < len(baseline["players"]) else {}
+            mask = view[offset]
+            offset += 1
+            if mask & PLAYER_POS:
+                player["x"], player["y"] = struct.unpack_from("<ff", view, offset)
+                offset += 8
+            if mask & PLAYER_STATUS:
+                alive, player["lives"] = struct.unpack_from("<BB", view, offset)
+                player["alive"] = bool(alive)
+                offset += 2
+            players.append(player)
+
+        bullets = {bid: _advance_bullet(b, seconds) for bid, b in baseline["bullets"].items()}
+        (count,) = COUNT.unpack_from(view, offset)
+        offset += COUNT.size
+        for _ in range(count):
+            (bid,) = BULLET_ID.unpack_from(view, offset)
+            offset += BULLET_ID.size
+            bullets.pop(bid, None)
+        (count,) = COUNT.unpack_from(view, offset)
+        offset += COUNT.size
+        for _ in range(count):
+            bid, x, y, vx, vy, owner = BULLET.unpack_from(view, offset)
+            offset += BULLET.size
+            bullets[bid] = {"id": bid, "x": x, "y": y, "vx": vx, "vy": vy, "owner": owner}
+        return players, bullets
+
+
+def input_bits(input_data):
+    """INPUT_KEYS bits for the keys held in an input dict."""
+    keys = input_data.get("keys", {}) if input_data else {}
+    bits = 0
+    for key, bit in INPUT_KEYS.items():
+        if keys.get(key):
+            bits |= bit
+    return bits
+
+
+def _quantize_shot(value):
+    return min(max(int(round(value * SHOT_SCALE)), 0), 0xFFFF)
+
+
+def encode_input_packet(seq, snapshot_ack, changes):
+    """Pack an input message: `changes` are (seq, input dict), oldest first."""
+    changes = [c for c in changes[-MAX_INPUT_CHANGES:] if seq - c[0] <= 0xFFFF]
+    parts = [INPUT_HEADER.pack(INPUT_VERSION, seq, snapshot_ack or 0, len(changes))]
+    for change_seq, input_data in changes:
+        bits = input_bits(input_data)
+        shoot = input_data.get("shoot") if input_data else None
+        view = input_data.get("view") if shoot else None
+        if shoot:
+            bits |= INPUT_SHOOT
+        if view is not None:
+            bits |= INPUT_VIEW
+        parts.append(INPUT_CHANGE.pack(seq - change_seq, bits))
+        if shoot:
+            parts.append(INPUT_TARGET.pack(_quantize_shot(shoot[0]), _quantize_shot(shoot[1])))
+        if view is not None:
+            parts.append(INPUT_VIEW_TICK.pack(view))
+    return b"".join(parts)
+
+
+def decode_input_packet(data):
+    """(newest seq, snapshot ack or None, [(seq, input dict), ...] oldest first).
+
+    Raises ValueError for data that is not an input packet.
+    """
+    try:
+        version, seq, snapshot_ack, count = INPUT_HEADER.unpack_from(data, 0)
+        if version != INPUT_VERSION:
+            raise ValueError(f"Unsupported input version {version}")
+        offset = INPUT_HEADER.size
+        changes = []
+        for _ in range(count):
+            back, bits = INPUT_CHANGE.unpack_from(data, offset)
+            offset += INPUT_CHANGE.size
+            shoot = view = None
+            if bits & INPUT_SHOOT:
+                x, y = INPUT_TARGET.unpack_from(data, offset)
+                offset += INPUT_TARGET.size
+                shoot = (x / SHOT_SCALE, y / SHOT_SCALE)
+                if bits & INPUT_VIEW:
+                    (view,) = INPUT_VIEW_TICK.unpack_from(data, offset)
+                    offset += INPUT_VIEW_TICK.size
+            keys = {key: bool(bits & bit) for key, bit in INPUT_KEYS.items()}
+            changes.append((seq - back, make_input(shoot=shoot, view=view, **keys)))
+    except struct.error as e:
+        raise ValueError(f"Truncated input packet: {e}")
+    return seq, snapshot_ack or None, changes
+
+
+def encode_frame(data, event=False):
+    """Frame a message: dicts are sent as JSON, bytes as a binary snapshot."""
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        payload, flags = data, FLAG_BINARY
+    else:
+        payload, flags = json.dumps(data).encode(), 0
+    if event:
+        flags |= FLAG_EVENT
+    return FRAME.pack(len(payload), flags) + payload
+
+
+def decode_payload(payload, flags):
+    if flags & FLAG_BINARY:
+        return bytes(payload)
+    return json.loads(bytes(payload))
+
+
+class FrameBuffer:
+    """Reassembles frames from one non-blocking stream socket.
+
+    Only the newest state frame is worth anything to the game loop, so
+    `latest()` skips older ones and counts them in `dropped`. Event frames
+    are never skipped; they queue up in `events` instead. Traffic is
+    counted in `stats`.
+    """
+
+    def __init__(self, stats=None):
+        self.stats = stats or LinkStats()
+        self.data = bytearray()
+        self.chunk = bytearray(BUFFER_SIZE)  # recv_into target, reused every read
+        self.events = deque()
+        self.pending = None  # (payload, flags) of the newest state not yet returned
+        self.dropped = 0  # Stale frames skipped since the connection opened
+        self.reported_dropped = 0
+        self.last_dropped = 0  # Stale frames skipped since the previous latest() call
+
+    def read_from(self, sock):
+        """Drain everything the socket has. Returns False once the peer closed."""
+        chunk = memoryview(self.chunk)
+        while True:
+            try:
+                n = sock.recv_into(chunk)
+            except BlockingIOError:
+                return True
+            if n == 0:
+                return False
+            self.stats.bytes_in += n
+            self.data += chunk[:n]
+
+    def parse(self):
+        """Split off every complete frame, keeping only the newest state frame."""
+        view = memoryview(self.data)
+        offset = 0
+        while len(view) - offset >= FRAME.size:
+            length, flags = FRAME.unpack_from(view, offset)
+            if length > MAX_FRAME_SIZE:
+                view.release()
+                raise ValueError(f"Frame of {length} bytes exceeds MAX_FRAME_SIZE")
+            end = offset + FRAME.size + length
+            if end > len(view):
+                break  # Rest of this frame is still in flight
+            payload = view[offset + FRAME.size:end]
+            self.stats.messages_in += 1
+            if flags & FLAG_EVENT:
+                self.events.append(decode_payload(payload, flags))
+            else:
+                if self.pending is not None:
+                    self.dropped += 1
+                    self.stats.dropped_in += 1
+                self.pending = (bytes(payload), flags)
+            payload.release()
+            offset = end
+        view.release()
+        del self.data[:offset]
+
+    def latest(self):
+        """Newest complete state message, or None if no new one arrived."""
+        self.parse()
+        self.last_dropped = self.dropped - self.reported_dropped
+        self.reported_dropped = self.dropped
+        if self.pending is None:
+            return None
+        newest, self.pending = self.pending, None
+        return decode_payload(*newest)
+
+
+class OutgoingQueue:
+    """Frames waiting to go out on a non-blocking stream socket.
+
+    A new state frame replaces queued state frames that have not started
+    sending yet, so a slow peer gets the latest snapshot instead of a
+    growing backlog. Event frames always stay queued.
+    """
+
+    def __init__(self, stats=None):
+        self.stats = stats or LinkStats()
+        self.frames = deque()  # (frame, is_event)
+        self.offset = 0  # Bytes of frames[0] already written
+        self.dropped = 0  # Stale state frames replaced before sending
+
+    def push(self, frame, event=False):
+        if not event:
+            kept = deque()
+            for i, item in enumerate(self.frames):
+                if item[1] or (i == 0 and self.offset):
+                    kept.append(item)  # Events, and a frame that is half written
+                else:
+                    self.dropped += 1
+                    self.stats.dropped_out += 1
+            self.frames = kept
+        self.frames.append((frame, event))
+        if len(self.frames) > MAX_QUEUED_FRAMES:
+            raise ConnectionError("Peer is not reading")
+
+    def flush(self, sock):
+        """Write as much as the socket takes without blocking."""
+        while self.frames:
+            frame = self.frames[0][0]
+            try:
+                sent = sock.send(memoryview(frame)[self.offset:])
+            except BlockingIOError:
+                return
+            self.offset += sent
+            self.stats.bytes_out += sent
+            if self.offset < len(frame):
+                return
+            self.frames.popleft()
+            self.offset = 0
+            self.stats.messages_out += 1
+
+    def __len__(self):
+        return len(self.frames)
+
+
+class Peer:
+    """One client connection on a Server."""
+
+    def __init__(self, conn, addr, name=""):
+        self.conn = conn
+        self.addr = addr
+        self.stats = LinkStats(name)
+        self.frames = FrameBuffer(self.stats)
+        self.outgoing = OutgoingQueue(self.stats)
+        self.open = True
+
+    def queue(self, frame, event=False):
+        if not self.open:
+            return
+        try:
+            self.outgoing.push(frame, event)
+            self.outgoing.flush(self.conn)
+        except (ConnectionError, OSError):
+            self.open = False
+
+    def flush(self):
+        if self.open:
+            try:
+                self.outgoing.flush(self.conn)
+            except (ConnectionError, OSError):
+                self.open = False
+
+    def read(self):
+        """Pull in everything waiting on the socket."""
+        if not self.open:
+            return
+        try:
+            if not self.frames.read_from(self.conn):
+                self.open = False
+            self.frames.parse()
+        except (ValueError, ConnectionError, OSError):
+            self.open = False
+
 
 class Server:
-    def __init__(self, port=5555):
+    def __init__(self, port=5555, max_clients=1):
         self.port = port
-        self.conn = None
+        self.max_clients = max_clients
+        self.peers = []
+        self.conn = None  # First peer's socket, kept for one-opponent callers
         self.addr = None
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.received_data = None
-        self.lock = threading.Lock()
         self.running = False
 
     def start(self):
-        """Start server and wait for a client to connect."""
+        """Start server and wait for every client to connect."""
         self.socket.bind(('0.0.0.0', self.port))
-        self.socket.listen(1)
+        self.socket.listen(self.max_clients)
         print(f"Server listening on port {self.port}...")
-        print("Waiting for player 2 to connect...")
-        self.conn, self.addr = self.socket.accept()
-        self.conn.setblocking(False)
-        print(f"Player 2 connected from {self.addr}")
+        while len(self.peers) < self.max_clients:
+            print(f"Waiting for player {len(self.peers) + 2} to connect...")
+            conn, addr = self.socket.accept()
+            conn.setblocking(False)
+            self.peers.append(Peer(conn, addr, f"P{len(self.peers) + 2}"))
+            print(f"Player {len(self.peers) + 1} connected from {addr}")
+        self.conn, self.addr = self.peers[0].conn, self.peers[0].addr
         self.running = True
         return True
 
-    def send(self, data):
-        """Send game state to client."""
-        if self.conn:
-            try:
-                msg = json.dumps(data).encode() + DELIMITER
-                self.conn.sendall(msg)
-            except (BrokenPipeError, ConnectionResetError):
-                self.running = False
+    def send(self, data, event=False):
+        """Send game state (dict or encoded snapshot bytes) to every client.
+
+        The frame is encoded once and queued per client; nothing here blocks.
+        """
+        frame = encode_frame(data, event)
+        for peer in self.peers:
+            peer.queue(frame, event)
+        self._update_running()
+
+    def send_to(self, index, data, event=False):
+        """Send to a single client."""
+        self.peers[index].queue(encode_frame(data, event), event)
+        self._update_running()
+
+    def send_event(self, data):
+        """Send a message that must not be dropped as stale."""
+        self.send(data, event=True)
+
+    def flush(self):
+        """Push queued frames to clients whose sockets have room again."""
+        for peer in self.peers:
+            peer.flush()
+        self._update_running()
+
+    def sockets(self):
+        """Open client sockets, for select()."""
+        return [peer.conn for peer in self.peers if peer.open]
+
+    def backlog(self):
+        """True while frames wait for a client socket to have room."""
+        return any(peer.open and len(peer.outgoing) for peer in self.peers)
 
     def receive(self):
-        """Receive input from client (non-blocking)."""
-        if not self.conn:
-            return None
+        """Receive the newest input from the first client (non-blocking)."""
+        return self.receive_from(0) if self.peers else None
+
+    def receive_from(self, index):
+        """Newest message from one client, or None."""
+        peer = self.peers[index]
+        peer.read()
+        self._update_running()
         try:
-            data = self.conn.recv(BUFFER_SIZE)
-            if data:
-                # Get the last complete message
-                messages = data.split(DELIMITER)
-                for msg in reversed(messages):
-                    if msg:
-                        return json.loads(msg.decode())
-        except BlockingIOError:
-            pass
-        except (json.JSONDecodeError, ConnectionResetError):
-            pass
-        return None
+            return peer.frames.latest()
+        except ValueError:
+            return None
+
+    def receive_all(self):
+        """Newest message from each client, in client order (None if nothing new)."""
+        return [self.receive_from(i) for i in range(len(self.peers))]
+
+    def receive_events(self):
+        """Pop every event message received so far, from all clients."""
+        events = []
+        for index in range(len(self.peers)):
+            events.extend(self.receive_events_from(index))
+        return events
+
+    def receive_events_from(self, index):
+        """Pop every event message received so far from one client."""
+        peer = self.peers[index]
+        peer.read()
+        events = list(peer.frames.events)
+        peer.frames.events.clear()
+        self._update_running()
+        return events
+
+    def links(self):
+        """LinkStats per client."""
+        return [peer.stats for peer in self.peers]
+
+    def connected(self):
+        """Indices of the clients whose connection is still open."""
+        return [i for i, peer in enumerate(self.peers) if peer.open]
+
+    def _update_running(self):
+        self.running = any(peer.open for peer in self.peers)
 
     def close(self):
-        """Close server."""
+        """Close server, giving queued frames (like game over) one last push."""
+        self.flush()
         self.running = False
-        if self.conn:
-            self.conn.close()
+        for peer in self.peers:
+            peer.conn.close()
         self.socket.close()
 
 
 class Client:
     def __init__(self):
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.stats = LinkStats("host")
+        self.frames = FrameBuffer(self.stats)
+        self.outgoing = OutgoingQueue(self.stats)
         self.running = False
 
     def connect(self, host, port):
@@ -80,31 +774,361 @@ class Client:
             print(f"Connection failed: {e}")
             return False
 
-    def send(self, data):
-        """Send input to server."""
+    def send(self, data, event=False):
+        """Send input to server without blocking; unsent older input is replaced."""
         try:
-            msg = json.dumps(data).encode() + DELIMITER
-            self.socket.sendall(msg)
-        except (BrokenPipeError, ConnectionResetError):
+            self.outgoing.push(encode_frame(data, event), event)
+            self.outgoing.flush(self.socket)
+        except (ConnectionError, OSError):
             self.running = False
 
+    def send_event(self, data):
+        """Send a message that must not be dropped as stale."""
+        self.send(data, event=True)
+
+    def flush(self):
+        """Push queued frames if the socket has room again."""
+        try:
+            self.outgoing.flush(self.socket)
+        except (ConnectionError, OSError):
+            self.running = False
+
+    def sockets(self):
+        return [self.socket] if self.running else []
+
+    def backlog(self):
+        return self.running and len(self.outgoing) > 0
+
+    def links(self):
+        return [self.stats]
+
     def receive(self):
-        """Receive game state from server (non-blocking)."""
+        """Receive the newest game state from server (non-blocking).
+
+        Returns a dict for JSON messages and bytes for binary snapshots.
+        """
         try:
-            data = self.socket.recv(BUFFER_SIZE)
-            if data:
-                # Get the last complete message
-                messages = data.split(DELIMITER)
-                for msg in reversed(messages):
-                    if msg:
-                        return json.loads(msg.decode())
-        except BlockingIOError:
-            pass
-        except (json.JSONDecodeError, ConnectionResetError):
+            if not self.frames.read_from(self.socket):
+                self.running = False
+            return self.frames.latest()
+        except (ValueError, ConnectionResetError):
             self.running = False
         return None
 
+    def receive_events(self):
+        """Pop every event message received so far."""
+        try:
+            if not self.frames.read_from(self.socket):
+                self.running = False
+            self.frames.parse()
+        except (ValueError, ConnectionResetError):
+            self.running = False
+        events = list(self.frames.events)
+        self.frames.events.clear()
+        return events
+
     def close(self):
         """Close connection."""
         self.running = False
         self.socket.close()
+
+
+class DatagramEndpoint:
+    """Shared UDP logic for UdpServer and UdpClient.
+
+    State packets are sequence numbered and the newest one wins: anything
+    older than what was already delivered is dropped instead of stalling
+    the stream. Events ride along in every outgoing packet until the peer
+    acks them and are delivered exactly once, in order.
+
+    `loss`, `latency` and `jitter` (seconds) simulate a bad link on the
+    sending side so the transport can be exercised over loopback. The
+    handshake bypasses them.
+    """
+
+    def __init__(self, loss=0.0, latency=0.0, jitter=0.0):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.stats = LinkStats()
+        self.peer = None
+        self.running = False
+        self.loss = loss
+        self.latency = latency
+        self.jitter = jitter
+        self.delayed = []  # Heap of (due time, order, packet) waiting on simulated latency
+        self.delayed_count = 0
+        self.seq = 0  # Last sequence number sent
+        self.remote_seq = 0  # Newest sequence number received, echoed back as our ack
+        self.remote_state_seq = 0  # Sequence number of the newest state delivered
+        self.acked_seq = 0  # Newest of our packets the peer has seen
+        self.next_event_id = 1
+        self.unacked_events = {}  # event id -> encoded event, resent until acked
+        self.next_remote_event = 1  # Next event id to deliver from the peer
+        self.pending_events = {}  # Events that arrived ahead of a gap
+        self.events = deque()
+        self.pending = None  # (flags, payload) of the newest state not yet returned
+        self.dropped = 0  # State packets dropped as out of order or superseded
+        self.reported_dropped = 0
+        self.last_dropped = 0  # Dropped since the previous receive() call
+
+    def send(self, data):
+        """Send a state or input message (dict or snapshot bytes)."""
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            self._send_packet(PKT_PAYLOAD | PKT_BINARY, bytes(data))
+        else:
+            self._send_packet(PKT_PAYLOAD, json.dumps(data).encode())
+
+    def send_event(self, data):
+        """Queue a message for reliable, ordered delivery."""
+        payload = json.dumps(data).encode()
+        event_id = self.next_event_id
+        self.next_event_id += 1
+        self.unacked_events[event_id] = PACKET_EVENT.pack(event_id, len(payload)) + payload
+        self._send_packet(0)
+
+    def receive(self):
+        """Newest state message received since the last call, or None."""
+        self._drain()
+        self.last_dropped = self.dropped - self.reported_dropped
+        self.reported_dropped = self.dropped
+        if self.pending is None:
+            return None
+        flags, payload = self.pending
+        self.pending = None
+        if flags & PKT_BINARY:
+            return payload
+        try:
+            return json.loads(payload)
+        except ValueError:
+            self.stats.dropped_in += 1
+            return None
+
+    def receive_events(self):
+        """Pop every event delivered so far."""
+        self._drain()
+        events = list(self.events)
+        self.events.clear()
+        return events
+
+    def flush(self):
+        """Send packets whose simulated latency is up."""
+        self._flush_delayed()
+
+    def sockets(self):
+        return [self.socket] if self.running else []
+
+    def backlog(self):
+        return bool(self.delayed)
+
+    def links(self):
+        return [self.stats]
+
+    def close(self):
+        """Tell the peer and close the socket."""
+        if self.peer and self.running:
+            self._sendto(PACKET.pack(PROTOCOL_VERSION, PKT_CLOSE, self.seq + 1, self.remote_seq, 0) + b"\0")
+        self.running = False
+        self.socket.close()
+
+    def _drain(self):
+        """Read every waiting datagram; the newest state is kept in `pending`."""
+        self._flush_delayed()
+        while True:
+            try:
+                data, addr = self.socket.recvfrom(MAX_DATAGRAM)
+            except (BlockingIOError, ConnectionResetError):
+                return
+            self.stats.received(len(data))
+            try:
+                message = self._handle_packet(data, addr)
+            except (struct.error, ValueError):
+                self.stats.dropped_in += 1  # Malformed: a stray datagram must not end the session
+                continue
+            if message is not None:
+                if self.pending is not None:
+                    self.dropped += 1  # Superseded before the game loop saw it
+                    self.stats.dropped_in += 1
+                self.pending = message
+
+    def _send_packet(self, flags, payload=b""):
+        if self.peer is None:
+            return
+        self.seq += 1
+        events = list(self.unacked_events.values())[:MAX_EVENTS_PER_PACKET]
+        header = PACKET.pack(PROTOCOL_VERSION, flags, self.seq, self.remote_seq,
+                             self.next_remote_event - 1)
+        self._transmit(b"".join([header, bytes((len(events),))] + events + [payload]))
+
+    def _transmit(self, packet):
+        if self.loss and random.random() < self.loss:
+            return
+        if self.latency or self.jitter:
+            due = time.monotonic() + self.latency + random.uniform(0, self.jitter)
+            self.delayed_count += 1
+            heapq.heappush(self.delayed, (due, self.delayed_count, packet))
+            self._flush_delayed()
+            return
+        self._sendto(packet)
+
+    def _flush_delayed(self):
+        now = time.monotonic()
+        while self.delayed and self.delayed[0][0] <= now:
+            self._sendto(heapq.heappop(self.delayed)[2])
+
+    def _sendto(self, packet):
+        try:
+            self.socket.sendto(packet, self.peer)
+            self.stats.sent(len(packet))
+        except (BlockingIOError, OSError):
+            self.stats.dropped_out += 1  # A lost datagram is just a lost datagram
+
+    def _handle_packet(self, data, addr):
+        """Apply acks/events from one packet; returns (flags, payload) for fresh state.
+
+        Raises struct.error or ValueError for a malformed packet, before
+        anything from it has been applied.
+        """
+        if len(data) < PACKET.size + 1:
+            return None
+        version, flags, seq, ack, event_ack = PACKET.unpack_from(data, 0)
+        if version != PROTOCOL_VERSION:
+            return None
+        if flags & PKT_HELLO:
+            self._on_hello(addr)
+            return None
+        if addr != self.peer:
+            return None
+        if flags & PKT_CLOSE:
+            self.running = False
+            return None
+
+        view = memoryview(data)
+        offset = PACKET.size + 1
+        events = {}
+        for _ in range(data[PACKET.size]):
+            event_id, length = PACKET_EVENT.unpack_from(view, offset)
+            offset += PACKET_EVENT.size
+            if offset + length > len(data):
+                raise ValueError("Event runs past the end of the packet")
+            if event_id >= self.next_remote_event:
+                events[event_id] = json.loads(bytes(view[offset:offset + length]))
+            offset += length
+
+        self.stats.on_packet(seq)
+        self.acked_seq = max(self.acked_seq, ack)
+        for event_id in [e for e in self.unacked_events if e <= event_ack]:
+            del self.unacked_events[event_id]
+        self.pending_events.update(events)
+        while self.next_remote_event in self.pending_events:
+            self.events.append(self.pending_events.pop(self.next_remote_event))
+            self.next_remote_event += 1
+
+        self.remote_seq = max(self.remote_seq, seq)
+        if not flags & PKT_PAYLOAD:
+            return None
+        if seq <= self.remote_state_seq:
+            self.dropped += 1
+            self.stats.dropped_in += 1
+            return None
+        self.remote_state_seq = seq
+        return flags, bytes(view[offset:])
+
+    def _on_hello(self, addr):
+        pass
+
+
+class UdpServer(DatagramEndpoint):
+    def __init__(self, port=5555, max_clients=1, **link):
+        if max_clients != 1:
+            raise ValueError("UDP hosting supports a single opponent")
+        super().__init__(**link)
+        self.stats.name = "P2"
+        self.port = port
+        self.addr = None
+
+    def start(self):
+        """Bind and wait for a client's hello."""
+        self.socket.bind(('0.0.0.0', self.port))
+        print(f"Server listening on UDP port {self.port}...")
+        print("Waiting for player 2 to connect...")
+        while self.peer is None:
+            data, addr = self.socket.recvfrom(MAX_DATAGRAM)
+            try:
+                self._handle_packet(data, addr)
+            except (struct.error, ValueError):
+                pass
+        self.socket.setblocking(False)
+        print(f"Player 2 connected from {self.addr}")
+        self.running = True
+        return True
+
+    def send_to(self, index, data, event=False):
+        """Same as send / send_event; there is only ever client 0."""
+        if event:
+            self.send_event(data)
+        else:
+            self.send(data)
+
+    def receive_all(self):
+        return [self.receive()]
+
+    def connected(self):
+        return [0] if self.running else []
+
+    def receive_events_from(self, index):
+        return self.receive_events()
+
+    def _on_hello(self, addr):
+        if self.peer is None:
+            self.peer = self.addr = addr
+        if addr == self.peer:
+            self._sendto(PACKET.pack(PROTOCOL_VERSION, PKT_HELLO, 0, 0, 0) + b"\0")
+
+
+class UdpClient(DatagramEndpoint):
+    def __init__(self, **link):
+        super().__init__(**link)
+        self.stats.name = "host"
+
+    def connect(self, host, port):
+        """Handshake with the server."""
+        try:
+            self.peer = (socket.gethostbyname(host), port)
+            self.socket.settimeout(HANDSHAKE_TIMEOUT)
+            hello = PACKET.pack(PROTOCOL_VERSION, PKT_HELLO, 0, 0, 0) + b"\0"
+            for _ in range(HANDSHAKE_ATTEMPTS):
+                self._sendto(hello)
+                try:
+                    data, addr = self.socket.recvfrom(MAX_DATAGRAM)
+                except socket.timeout:
+                    continue
+                if addr == self.peer and len(data) >= PACKET.size and PACKET.unpack_from(data, 0)[1] & PKT_HELLO:
+                    self.socket.setblocking(False)
+                    self.running = True
+                    print(f"Connected to {host}:{port} (UDP)")
+                    return True
+            print("Connection failed: no reply from server")
+        except OSError as e:
+            print(f"Connection failed: {e}")
+        return False
+
+
+TRANSPORTS = {
+    "tcp": (Server, Client),
+    "udp": (UdpServer, UdpClient),
+}
+
+
+def create_server(port=5555, transport="tcp", **options):
+    """Server for `transport`; `options` takes max_clients and UDP loss/latency/jitter."""
+    return TRANSPORTS[transport][0](port, **options)
+
+
+def create_client(transport="tcp", **link):
+    return TRANSPORTS[transport][1](**link)
+
+
+def free_port():
+    """A loopback port nothing is listening on, for local benchmarks and load tests."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
@@ -0,0 +1,237 @@
+"""Client-side prediction and snapshot interpolation for join mode.
+
+The joining player moves their own dot immediately with the same
+`Player.move_with_input` the host runs, then corrects it when an
+authoritative snapshot says which inputs the host has applied. Everything
+else is drawn a little in the past, interpolated between two snapshots.
+
+Inputs go upstream as packed change lists (`network.encode_input_packet`):
+a packet is sent when the input changes, repeated every tick until the
+host acks the change, and otherwise only as a keepalive.
+"""
+from collections import deque
+
+from network import MAX_INPUT_CHANGES, encode_input_packet, input_bits
+from sim import WIDTH, HEIGHT, TICK_RATE, Player, start_positions
+from spatial import SpatialGrid
+
+INPUT_BUFFER_SIZE = 64  # Unacked inputs kept for replay (~1 s at 60 Hz)
+KEEPALIVE_INTERVAL = 0.15  # Seconds between input packets while nothing changes
+INPUT_DELAY = 2  # Ticks the host stays behind a client's clock to absorb jitter
+INTERPOLATION_DELAY = 0.1  # Seconds remote entities are drawn behind the newest snapshot
+SNAPSHOT_BUFFER_SIZE = 32
+
+
+class InputBuffer:
+    """Fixed-size ring buffer of (seq, input) the host has not acked yet."""
+
+    def __init__(self, size=INPUT_BUFFER_SIZE):
+        self.size = size
+        self.slots = [None] * size
+        self.oldest = 1  # Lowest seq still held
+        self.next_seq = 1
+
+    def push(self, input_data):
+        seq = self.next_seq
+        self.slots[seq % self.size] = input_data
+        self.next_seq += 1
+        if self.next_seq - self.oldest > self.size:
+            self.oldest = self.next_seq - self.size  # Oldest input overwritten
+        return seq
+
+    def ack(self, seq):
+        """Forget every input up to and including `seq`."""
+        self.oldest = max(self.oldest, min(seq + 1, self.next_seq))
+
+    def pending(self):
+        """Unacked (seq, input) pairs, oldest first."""
+        return [(seq, self.slots[seq % self.size]) for seq in range(self.oldest, self.next_seq)]
+
+    def __len__(self):
+        return self.next_seq - self.oldest
+
+
+class Predictor:
+    """Locally simulated copy of the joining player."""
+
+    def __init__(self, player_index, obstacles, lives=3, num_players=2, tick_rate=TICK_RATE,
+                 width=WIDTH, height=HEIGHT):
+        self.player_index = player_index
+        self.dt = 1.0 / tick_rate  # One local input per host tick
+        self.bounds = (width, height)
+        self.obstacles = SpatialGrid(obstacles)
+        self.inputs = InputBuffer()
+        self.player = Player(*start_positions(num_players, width, height)[player_index])
+        self.player.lives = lives
+        self.corrections = 0  # Snapshots that disagreed with the prediction
+        self.changes = []  # (seq, input) the host has not acked, where keys changed or a shot was fired
+        self.keys = None  # INPUT_KEYS bits of the newest input
+        self.last_sent = 0  # Newest seq sent to the host
+        self.keepalive_ticks = max(1, round(KEEPALIVE_INTERVAL * tick_rate))
+
+    def apply_local(self, input_data):
+        """Move the local player right away; returns the input's seq number."""
+        seq = self.inputs.push(input_data)
+        keys = input_bits(input_data)
+        if keys != self.keys or input_data.get("shoot"):
+            self.changes.append((seq, input_data))
+            del self.changes[:-MAX_INPUT_CHANGES]
+            self.keys = keys
+        self.player.prev_x, self.player.prev_y = self.player.x, self.player.y
+        self.player.move_with_input(input_data, self.obstacles, self.dt, *self.bounds)
+        return seq
+
+    def outgoing(self, snapshot_ack=None):
+        """Input packet for this tick, or None when the host already has everything.
+
+        Unacked changes ride in every packet, so one lost packet loses nothing.
+        """
+        seq = self.inputs.next_seq - 1
+        if not self.changes and seq - self.last_sent < self.keepalive_ticks:
+            return None
+        self.last_sent = seq
+        return encode_input_packet(seq, snapshot_ack, self.changes)
+
+    def reconcile(self, snapshot):
+        """Snap to the host's position, then replay inputs it has not seen."""
+        predicted = (self.player.x, self.player.y)
+        self.player.from_dict(snapshot["players"][self.player_index])
+        ack = snapshot.get("input_ack", 0)
+        self.inputs.ack(ack)
+        if self.changes and self.changes[0][0] <= ack:
+            self.changes = [change for change in self.changes if change[0] > ack]
+        for _, input_data in self.inputs.pending():
+            self.player.move_with_input(input_data, self.obstacles, self.dt, *self.bounds)
+        if abs(predicted[0] - self.player.x) > 0.01 or abs(predicted[1] - self.player.y) > 0.01:
+            self.corrections += 1
+
+
+class InterpolationBuffer:
+    """Recent snapshots, sampled a fixed delay behind the newest one."""
+
+    def __init__(self, delay=INTERPOLATION_DELAY, tick_rate=TICK_RATE):
+        self.tick_rate = tick_rate
+        self.delay_ticks = delay * tick_rate
+        self.snapshots = []  # (tick, snapshot), oldest first
+        self.newest_tick = None
+        self.newest_time = None
+
+    def push(self, snapshot, now):
+        tick = snapshot["tick"]
+        if self.newest_tick is not None and tick <= self.newest_tick:
+            return
+        self.snapshots.append((tick, snapshot))
+        del self.snapshots[:-SNAPSHOT_BUFFER_SIZE]
+        self.newest_tick = tick
+        self.newest_time = now
+
+    def render_tick(self, now):
+        """Host tick (fractional) drawn at `now`: the tick we think it is, minus the delay."""
+        if self.newest_tick is None:
+            return None
+        return self.newest_tick + (now - self.newest_time) * self.tick_rate - self.delay_ticks
+
+    def sample(self, now):
+        """Interpolated snapshot dict for the render time, or None if empty."""
+        if not self.snapshots:
+            return None
+        render_tick = self.render_tick(now)
+        older = self.snapshots[0]
+        for newer in self.snapshots:
+            if newer[0] >= render_tick:
+                break
+            older = newer
+        else:
+            return self.snapshots[-1][1]  # Starved: hold the newest state
+        if newer[0] <= older[0]:
+            return newer[1]
+        t = (render_tick - older[0]) / (newer[0] - older[0])
+        return interpolate(older[1], newer[1], max(0.0, min(1.0, t)))
+
+
+def _lerp_position(old, new, t):
+    result = dict(new)
+    result["x"] = old["x"] + (new["x"] - old["x"]) * t
+    result["y"] = old["y"] + (new["y"] - old["y"]) * t
+    return result
+
+
+def interpolate(old, new, t):
+    """Blend two snapshot dicts. Entities only in `new` are taken as-is."""
+    players = []
+    for i, player in enumerate(new["players"]):
+        previous = old["players"][i] if i < len(old["players"]) else None
+        # A dead or respawning player jumps rather than sliding across the map
+        if previous is None or previous["alive"] != player["alive"]:
+            players.append(dict(player))
+        else:
+            players.append(_lerp_position(previous, player, t))
+    old_bullets = {b["id"]: b for b in old["bullets"]}
+    bullets = []
+    for bullet in new["bullets"]:
+        previous = old_bullets.get(bullet["id"])
+        bullets.append(_lerp_position(previous, bullet, t) if previous else dict(bullet))
+    return {"tick": new["tick"], "players": players, "bullets": bullets}
+
+
+MAX_INPUT_BACKLOG = 4  # Remote ticks beyond this behind the client's clock are skipped to cap latency
+MAX_HOLD = 4  # Keepalive intervals a silent client's keys are held before it stops moving
+MAX_PENDING_SHOTS = 16  # Shots waiting for a tick of their own; a flood beyond this drops the oldest
+
+
+class InputQueue:
+    """Host side: a remote player's input for each of their ticks, applied one per host tick.
+
+    Clients only send the ticks where their input changed, so every tick
+    in between repeats the keys before it (shots are never repeated).
+    Every shot is fired, one per tick: shots in skipped ticks, or several
+    landing on the same tick, wait for the ticks after it.
+    Since a change is sent the moment it happens, the client's clock is
+    estimated from the newest seq heard plus host ticks since, and ticks
+    are applied INPUT_DELAY behind that: a change that arrives on time is
+    applied at the tick it was made.
+    """
+
+    def __init__(self, tick_rate=TICK_RATE):
+        self.changes = []  # (seq, input) not yet applied, oldest first
+        self.keys = None  # Input whose keys are held
+        self.shots = deque(maxlen=MAX_PENDING_SHOTS)  # Inputs that fired a shot not yet applied
+        self.last_received = 0  # Newest client seq heard of
+        self.last_applied = 0  # Newest seq applied, echoed to the client as input_ack
+        self.since_received = 0  # Host ticks since last_received went up
+        self.max_silence = MAX_HOLD * max(1, round(KEEPALIVE_INTERVAL * tick_rate))
+
+    def add(self, seq, changes):
+        """Take in a decoded input packet, ignoring what earlier packets already said."""
+        if seq <= self.last_received:
+            return
+        # Changes at or before a tick already applied on held keys still count: late, not lost
+        self.changes.extend(change for change in changes if change[0] > self.last_received)
+        self.last_received = seq
+        self.since_received = 0
+
+    def pop(self):
+        """Input for this tick, or None before the client's first packet or while it is silent."""
+        if not self.last_received or self.since_received >= self.max_silence:
+            return None
+        target = self.last_received + self.since_received - INPUT_DELAY
+        self.since_received += 1
+        if target <= self.last_applied:
+            return None
+        if target - self.last_applied > MAX_INPUT_BACKLOG:
+            self._advance(target - MAX_INPUT_BACKLOG - 1)  # Skip the oldest ticks, but not their shots
+        self._advance(self.last_applied + 1)
+        if self.keys is None:
+            return None
+        shot = self.shots.popleft() if self.shots else None
+        if shot is None:
+            return dict(self.keys, shoot=None, view=None)
+        return dict(self.keys, shoot=shot["shoot"], view=shot.get("view"))
+
+    def _advance(self, seq):
+        """Apply changes up to `seq`, queueing the shots among them."""
+        while self.changes and self.changes[0][0] <= seq:
+            self.keys = self.changes.pop(0)[1]
+            if self.keys.get("shoot"):
+                self.shots.append(self.keys)
+        self.last_applied = seq
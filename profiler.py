@@ -0,0 +1,96 @@
+"""Per-frame phase timings for the game loop.
+
+The loop calls `start_frame()` once per frame and `mark(name)` after each
+phase; the time since the previous mark is charged to that phase. Rolling
+p50/p95/p99 are kept per phase, and frames can be recorded to a Chrome
+trace file (open it in chrome://tracing or https://ui.perfetto.dev).
+
+When the profiler is disabled every call returns immediately.
+"""
+import json
+import os
+import time
+from collections import deque
+
+WINDOW = 300  # Frames kept per phase for the percentiles (~5 s at 60 Hz)
+MAX_TRACE_EVENTS = 500000  # Recording stops past this to bound memory
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+
+class Profiler:
+    def __init__(self, window=WINDOW):
+        self.window = window
+        self.enabled = False
+        self.samples = {}  # phase -> deque of seconds, insertion order = loop order
+        self.frame_start = None
+        self.last = None
+        self.trace_path = None
+        self.trace_events = None  # Chrome trace events while recording
+        self.trace_origin = time.perf_counter()
+
+    def start_frame(self):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        if self.frame_start is not None:
+            self._add("frame", self.frame_start, now)
+        self.frame_start = self.last = now
+
+    def mark(self, name):
+        """Charge the time since the previous mark to phase `name`."""
+        if not self.enabled or self.last is None:
+            return
+        now = time.perf_counter()
+        self._add(name, self.last, now)
+        self.last = now
+
+    def _add(self, name, start, end):
+        samples = self.samples.get(name)
+        if samples is None:
+            samples = self.samples[name] = deque(maxlen=self.window)
+        samples.append(end - start)
+        if self.trace_events is not None:
+            self.trace_events.append({
+                "name": name, "ph": "X", "pid": os.getpid(), "tid": 0 if name == "frame" else 1,
+                "ts": (start - self.trace_origin) * 1e6, "dur": (end - start) * 1e6,
+            })
+            if len(self.trace_events) >= MAX_TRACE_EVENTS:
+                self.stop_trace()
+
+    def set_enabled(self, enabled):
+        if enabled != self.enabled:
+            self.enabled = enabled
+            self.frame_start = self.last = None  # Don't charge the gap to a phase
+            self.samples.clear()
+
+    def stats(self):
+        """(phase, p50, p95, p99) in milliseconds for every phase seen."""
+        rows = []
+        for name, samples in self.samples.items():
+            ordered = sorted(samples)
+            rows.append((name, percentile(ordered, 0.5) * 1e3, percentile(ordered, 0.95) * 1e3,
+                         percentile(ordered, 0.99) * 1e3))
+        return rows
+
+    def lines(self):
+        """Overlay text: one line per phase."""
+        return [f"{name:<10} {p50:6.2f} {p95:6.2f} {p99:6.2f}" for name, p50, p95, p99 in self.stats()]
+
+    def start_trace(self, path):
+        """Record every phase from now on; `stop_trace` writes the file."""
+        self.set_enabled(True)
+        self.trace_path = path
+        self.trace_events = []
+
+    def stop_trace(self):
+        if self.trace_events is None:
+            return
+        events, self.trace_events = self.trace_events, None
+        with open(self.trace_path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        print(f"Wrote {len(events)} trace events to {self.trace_path}")
@@ -0,0 +1,201 @@
+"""Read-only spectator stream for a hosted match.
+
+Spectators connect to their own port, are sent a start event and then a
+snapshot stream that runs SPECTATOR_DELAY behind the match (so a viewer
+can't call out positions to a player) at SPECTATOR_RATE instead of the
+tick rate. Everything they send is read and thrown away.
+
+Each spectator frame is one full snapshot, encoded and framed once and
+shared by every viewer: a viewer holds a memoryview into the same bytes
+and an offset, so nothing is encoded or copied per viewer. Full snapshots
+need no baseline, so a viewer whose socket is backed up just finishes
+the frame it is in the middle of and skips to the newest one instead of
+queueing a backlog.
+
+The relay is driven from the host's network worker (netio.HostWorker),
+so viewers cost the game loop nothing.
+"""
+import socket
+import time
+from collections import deque
+
+from network import SnapshotEncoder, encode_frame
+from sim import TICK_RATE
+
+SPECTATOR_DELAY = 2.0  # Seconds spectators are behind the match
+SPECTATOR_RATE = 20  # Snapshots per second sent to spectators
+MAX_SPECTATORS = 64
+
+
+class Viewer:
+    def __init__(self, conn, addr):
+        self.conn = conn
+        self.addr = addr
+        self.events = deque()  # Frames that must arrive (start, game over), ahead of snapshots
+        self.latest = None  # Newest snapshot frame not yet started; a newer one replaces it
+        self.sending = None  # memoryview of the rest of the frame on the wire
+        self.skipped = 0  # Snapshots replaced before they were sent
+        self.open = True
+
+    def push(self, frame):
+        if self.latest is not None:
+            self.skipped += 1
+        self.latest = frame
+
+    def flush(self):
+        """Send what the socket takes without blocking; False once the viewer is gone."""
+        try:
+            while True:
+                if self.sending is None:
+                    if self.events:
+                        self.sending = memoryview(self.events.popleft())
+                    elif self.latest is not None:
+                        self.sending, self.latest = memoryview(self.latest), None
+                    else:
+                        return True
+                sent = self.conn.send(self.sending)
+                self.sending = self.sending[sent:] if sent < len(self.sending) else None
+                if self.sending is not None:
+                    return True  # Socket buffer full
+        except BlockingIOError:
+            return True
+        except OSError:
+            self.open = False
+            return False
+
+    def pending(self):
+        return self.sending is not None or bool(self.events) or self.latest is not None
+
+
+class SpectatorRelay:
+    def __init__(self, port, welcome, tick_rate=TICK_RATE, delay=SPECTATOR_DELAY, rate=SPECTATOR_RATE,
+                 max_viewers=MAX_SPECTATORS):
+        """`welcome` is the start event every viewer gets on connecting."""
+        self.port = port
+        self.welcome = encode_frame(dict(welcome, delay=delay), event=True)
+        self.delay = delay
+        self.every = max(1, round(tick_rate / rate))  # Ticks between spectator snapshots
+        self.max_viewers = max_viewers
+        self.encoder = SnapshotEncoder(tick_rate)
+        self.delayed = deque()  # (due time, state dict or None, event dict or None), oldest first
+        self.next_tick = 0
+        self.viewers = []
+        self.socket = None
+
+    def listen(self):
+        """Start accepting spectators; False (and no relay) if the port is taken."""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            sock.bind(("0.0.0.0", self.port))
+        except OSError as e:
+            print(f"Spectators disabled, port {self.port}: {e}")
+            sock.close()
+            return False
+        sock.listen(self.max_viewers)
+        sock.setblocking(False)
+        self.socket = sock
+        print(f"Spectators can watch on port {self.port}")
+        return True
+
+    def stop_listening(self):
+        """Free the port for the next match; viewers already connected keep their stream."""
+        if self.socket:
+            self.socket.close()
+            self.socket = None
+
+    def sockets(self):
+        return ([self.socket] if self.socket else []) + [viewer.conn for viewer in self.viewers]
+
+    def backlog(self):
+        return any(viewer.pending() for viewer in self.viewers)
+
+    def publish(self, state, now=None):
+        """Offer a tick's `GameState.to_dict()`; kept only at the spectator rate."""
+        if state["tick"] < self.next_tick:
+            return
+        self.next_tick = state["tick"] + self.every
+        now = time.monotonic() if now is None else now
+        self.delayed.append((now + self.delay, state, None))
+
+    def send_event(self, data, now=None):
+        """Queue an event for every viewer, in step with the delayed snapshots."""
+        now = time.monotonic() if now is None else now
+        self.delayed.append((now + self.delay, None, data))
+
+    def pump(self, now=None):
+        """Accept and read viewers, release what is due, and send."""
+        now = time.monotonic() if now is None else now
+        self._accept()
+        for viewer in self.viewers:
+            try:
+                while viewer.conn.recv(4096):
+                    pass  # Read-only: whatever a viewer sends is dropped
+                viewer.open = False  # Orderly close
+            except BlockingIOError:
+                pass
+            except OSError:
+                viewer.open = False
+
+        # Newest due snapshot only; due events all, in order
+        frame = None
+        while self.delayed and self.delayed[0][0] <= now:
+            _, state, event = self.delayed.popleft()
+            if state is not None:
+                frame = state
+                continue
+            if frame is not None:
+                self._push(self._encode(frame))
+                frame = None
+            event_frame = encode_frame(event, event=True)
+            for viewer in self.viewers:
+                viewer.events.append(event_frame)
+        if frame is not None:
+            self._push(self._encode(frame))
+
+        for viewer in self.viewers:
+            if not viewer.flush():
+                viewer.open = False
+        closed = [viewer for viewer in self.viewers if not viewer.open]
+        for viewer in closed:
+            viewer.conn.close()
+            print(f"Spectator {viewer.addr} left")
+        if closed:
+            self.viewers = [viewer for viewer in self.viewers if viewer.open]
+
+    def _accept(self):
+        if not self.socket:
+            return
+        while True:
+            try:
+                conn, addr = self.socket.accept()
+            except (BlockingIOError, OSError):
+                return
+            if len(self.viewers) >= self.max_viewers:
+                conn.close()
+                continue
+            conn.setblocking(False)
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            viewer = Viewer(conn, addr)
+            viewer.events.append(self.welcome)
+            self.viewers.append(viewer)
+            print(f"Spectator connected from {addr}")
+
+    def _encode(self, state):
+        """One framed full snapshot, shared by every viewer."""
+        self.encoder.add(state)
+        return encode_frame(self.encoder.pack())
+
+    def _push(self, frame):
+        for viewer in self.viewers:
+            viewer.push(frame)
+
+    def finished(self):
+        """True once everything queued has been released and sent."""
+        return not self.delayed and not self.backlog()
+
+    def close(self):
+        for viewer in self.viewers:
+            viewer.conn.close()
+        self.viewers = []
+        self.stop_listening()
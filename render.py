@@ -0,0 +1,140 @@
+"""Cached drawing for the match screen.
+
+The arena barely changes between frames: obstacles never move, HUD text
+only changes when someone loses a life and every bullet looks the same.
+So the obstacle layer is drawn once per map (and again only when the
+camera moves), text and sprites are rendered once and blitted, and only
+the rectangles that changed are pushed to the display. In a world bigger
+than the window, only what is inside the camera's view is drawn.
+"""
+import pygame
+
+from spatial import SpatialGrid
+
+MAX_TEXT_CACHE = 256  # Rendered strings kept before the cache is reset
+MAX_DIRTY_RECTS = 400  # Beyond this a full flip is cheaper than many small updates
+COLORKEY = (255, 0, 255)
+
+
+class TextCache:
+    """Rendered text surfaces keyed by font, string and colour."""
+
+    def __init__(self, max_entries=MAX_TEXT_CACHE):
+        self.max_entries = max_entries
+        self.surfaces = {}
+
+    def render(self, font, text, color):
+        key = (font, text, color)
+        surface = self.surfaces.get(key)
+        if surface is None:
+            if len(self.surfaces) >= self.max_entries:
+                self.surfaces.clear()  # Old HUD values are never needed again
+            surface = self.surfaces[key] = font.render(text, True, color)
+        return surface
+
+
+def circle_sprite(color, radius):
+    """A colour-keyed surface holding one filled circle centred at (radius, radius)."""
+    size = radius * 2 + 1
+    sprite = pygame.Surface((size, size))
+    sprite.fill(COLORKEY)
+    pygame.draw.circle(sprite, color, (radius, radius), radius)
+    sprite.set_colorkey(COLORKEY, pygame.RLEACCEL)
+    return sprite.convert()
+
+
+class Renderer:
+    """Draws a GameState onto `screen` and updates only what changed."""
+
+    def __init__(self, screen, background, obstacle_color, outline_color, bullet_color):
+        self.screen = screen
+        self.background_color = background
+        self.obstacle_color = obstacle_color
+        self.outline_color = outline_color
+        self.bullet_color = bullet_color
+        self.background = None  # Visible part of the arena with obstacles, rebuilt per map and camera move
+        self.obstacles = None  # Obstacle list the background was built from
+        self.obstacle_grid = None
+        self.camera = None  # World position of the screen's top-left corner
+        self.sprites = {}  # (color, radius) -> circle sprite
+        self.drawn = []  # Rects covered by sprites and HUD last frame
+        self.full_redraw = True
+
+    def invalidate(self):
+        """Push the whole screen next frame (after a menu or a window expose)."""
+        self.full_redraw = True
+
+    def set_obstacles(self, obstacles):
+        self.obstacles = obstacles
+        self.obstacle_grid = SpatialGrid(obstacles)
+        self.background = pygame.Surface(self.screen.get_size()).convert()
+        self.camera = None
+
+    def paint_background(self, camera):
+        """Draw the obstacles in view of `camera` onto the background."""
+        left, top = camera
+        width, height = self.background.get_size()
+        self.background.fill(self.background_color)
+        for obstacle in self.obstacle_grid.query_rect(left, top, left + width, top + height):
+            rect = (obstacle.x - left, obstacle.y - top, obstacle.width, obstacle.height)
+            pygame.draw.rect(self.background, self.obstacle_color, rect)
+            pygame.draw.rect(self.background, self.outline_color, rect, 2)
+        self.camera = camera
+        self.full_redraw = True
+
+    def sprite(self, color, radius):
+        key = (color, radius)
+        if key not in self.sprites:
+            self.sprites[key] = circle_sprite(color, radius)
+        return self.sprites[key]
+
+    def draw(self, state, colors, hud=(), alpha=1.0, camera=(0, 0)):
+        """Draw players, bullets and `hud` (surface, position) pairs, then present.
+
+        `alpha` is how far (0-1) the frame is between the state's previous
+        tick and its current one; moving things are drawn that far along.
+        `camera` is the world position shown at the screen's top-left; the
+        HUD stays in screen coordinates.
+        """
+        if state.obstacles is not self.obstacles:
+            self.set_obstacles(state.obstacles)
+        camera = (int(camera[0]), int(camera[1]))
+        if camera != self.camera:
+            self.paint_background(camera)
+        left, top = camera
+        width, height = self.background.get_size()
+        screen = self.screen
+        if self.full_redraw:
+            screen.blit(self.background, (0, 0))
+        else:
+            for rect in self.drawn:
+                screen.blit(self.background, rect, rect)
+
+        drawn = []
+        for player, color in zip(state.players, colors):
+            if player.alive:
+                r = player.radius
+                x = player.prev_x + (player.x - player.prev_x) * alpha - left
+                y = player.prev_y + (player.y - player.prev_y) * alpha - top
+                if -r < x < width + r and -r < y < height + r:
+                    drawn.append(screen.blit(self.sprite(color, r), (int(x) - r, int(y) - r)))
+        bullets = state.bullets
+        slots = bullets.live_slots()
+        back = (1.0 - alpha) * state.dt  # Bullets fly straight, so step back along their velocity
+        xs = bullets.x[slots] - bullets.vx[slots] * back - left
+        ys = bullets.y[slots] - bullets.vy[slots] * back - top
+        radius = bullets.radius[slots]
+        visible = (xs > -radius) & (xs < width + radius) & (ys > -radius) & (ys < height + radius)
+        xs, ys, radius = xs[visible], ys[visible], radius[visible]
+        for x, y, r in zip(xs.tolist(), ys.tolist(), radius.astype(int).tolist()):
+            drawn.append(screen.blit(self.sprite(self.bullet_color, r), (int(x) - r, int(y) - r)))
+        for surface, position in hud:
+            drawn.append(screen.blit(surface, position))
+
+        dirty = self.drawn + drawn
+        if self.full_redraw or len(dirty) > MAX_DIRTY_RECTS:
+            pygame.display.flip()
+        else:
+            pygame.display.update(dirty)
+        self.drawn = drawn
+        self.full_redraw = False
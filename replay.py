@@ -0,0 +1,209 @@
+"""Record matches and replay them headless, as fast as the CPU allows.
+
+A recording is the map seed and obstacles plus the inputs `step` got on
+every tick, so replaying it rebuilds the exact match:
+
+    python game.py --record recordings    # host or single player
+    python server.py --record recordings  # one file per match
+
+    python replay.py match.rec            # run to the end, list every hit
+    python replay.py match.rec --tick 900 # state at tick 900
+
+File layout: a MAGIC line, one JSON header line, then one record per
+tick. A record holds a flag byte per player (FLAG_* below), followed by
+the shot target as two doubles when FLAG_SHOOT is set and the tick the
+shooter saw (for lag compensation) when FLAG_VIEW is set. FLAG_FORFEIT
+marks a player who disconnected and is out of the match.
+"""
+import json
+import os
+import struct
+import sys
+import time
+
+from sim import WIDTH, HEIGHT, GameState, Obstacle, make_input, step
+
+MAGIC = b"DOTREC 5\n"  # Version 5: players who disconnect forfeit
+CHECKPOINT_INTERVAL = 300  # Ticks between checkpoints kept for seeking (5 s at 60 Hz)
+
+FLAG_INPUT = 1  # An input was applied (otherwise the player sent nothing)
+FLAG_SHOOT = 2
+KEY_FLAGS = {"left": 4, "right": 8, "up": 16, "down": 32}
+FLAG_VIEW = 64
+FLAG_FORFEIT = 128
+TARGET = struct.Struct("<dd")
+VIEW = struct.Struct("<I")
+
+
+def encode_inputs(inputs, out):
+    """Append one tick's inputs to the bytearray `out`."""
+    for input_data in inputs:
+        if not input_data:
+            out.append(0)
+            continue
+        if input_data.get("forfeit"):
+            out.append(FLAG_INPUT | FLAG_FORFEIT)
+            continue
+        flags = FLAG_INPUT
+        keys = input_data.get("keys", {})
+        for key, bit in KEY_FLAGS.items():
+            if keys.get(key):
+                flags |= bit
+        shoot = input_data.get("shoot")
+        view = input_data.get("view") if shoot else None
+        if shoot:
+            out.append(flags | FLAG_SHOOT | (FLAG_VIEW if view is not None else 0))
+            out += TARGET.pack(*shoot)
+            if view is not None:
+                out += VIEW.pack(view)
+        else:
+            out.append(flags)
+
+
+def decode_inputs(data, offset, num_players):
+    """One tick's inputs starting at `offset`; returns (inputs, new offset)."""
+    inputs = []
+    for _ in range(num_players):
+        flags = data[offset]
+        offset += 1
+        if not flags & FLAG_INPUT:
+            inputs.append(None)
+            continue
+        if flags & FLAG_FORFEIT:
+            inputs.append(make_input(forfeit=True))
+            continue
+        shoot = view = None
+        if flags & FLAG_SHOOT:
+            shoot = TARGET.unpack_from(data, offset)
+            offset += TARGET.size
+        if flags & FLAG_VIEW:
+            (view,) = VIEW.unpack_from(data, offset)
+            offset += VIEW.size
+        keys = {key: bool(flags & bit) for key, bit in KEY_FLAGS.items()}
+        inputs.append(make_input(shoot=shoot, view=view, **keys))
+    return inputs, offset
+
+
+def recording_path(directory, state):
+    """A new file name in `directory` for the match `state`, unique per start time and seed."""
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, time.strftime("match-%Y%m%d-%H%M%S") + f"-{state.seed}.rec")
+
+
+class Recorder:
+    """Writes the inputs of one match as it is played."""
+
+    def __init__(self, path, state, num_lives):
+        self.file = open(path, "wb")  # Buffered; flushed on close or at exit
+        self.record_buffer = bytearray()
+        header = {
+            "seed": state.seed,
+            "lives": num_lives,
+            "players": len(state.players),
+            "bots": state.bots,
+            "tick_rate": state.tick_rate,
+            "world": [state.width, state.height],
+            "max_rewind": state.max_rewind,
+            "obstacles": [o.to_dict() for o in state.obstacles],
+        }
+        self.file.write(MAGIC + json.dumps(header).encode() + b"\n")
+
+    def record(self, inputs):
+        """Log the inputs about to be passed to `step` for this tick."""
+        encode_inputs(inputs, self.record_buffer)
+        self.file.write(self.record_buffer)
+        self.record_buffer.clear()
+
+    def close(self):
+        self.file.close()
+
+
+class Replay:
+    """A loaded recording that can jump to any tick."""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        if not data.startswith(MAGIC):
+            raise ValueError(f"{path} is not a recording, or is from an older version")
+        end = data.index(b"\n", len(MAGIC))
+        self.header = json.loads(data[len(MAGIC):end])
+        num_players = self.header["players"]
+        self.inputs = []  # Per tick, the input list given to step
+        offset = end + 1
+        while offset < len(data):
+            try:
+                inputs, offset = decode_inputs(data, offset, num_players)
+            except (IndexError, struct.error):
+                break  # Truncated last tick: the game was killed mid-write
+            self.inputs.append(inputs)
+        self.checkpoints = {}  # tick -> GameState.checkpoint()
+
+    def new_state(self):
+        header = self.header
+        obstacles = [Obstacle.from_dict(o) for o in header["obstacles"]]
+        bots = header["bots"]
+        if isinstance(bots, dict):
+            bots = {int(i): name for i, name in bots.items()}  # JSON keys are strings
+        width, height = header.get("world", (WIDTH, HEIGHT))
+        return GameState(header["lives"], obstacles=obstacles, bots=bots, num_players=header["players"],
+                         seed=header["seed"], tick_rate=header["tick_rate"], width=width, height=height,
+                         max_rewind=header["max_rewind"])
+
+    def run(self, until=None, on_events=None):
+        """Step from the nearest checkpoint to tick `until` (default: the end).
+
+        Checkpoints are saved along the way, so seeking again is cheap.
+        `on_events(tick, events)` sees each tick's hit events.
+        """
+        until = len(self.inputs) if until is None else min(until, len(self.inputs))
+        state = self.new_state()
+        start = max([t for t in self.checkpoints if t <= until], default=0)
+        if start:
+            state.restore(self.checkpoints[start])
+        for tick in range(start, until):
+            if tick % CHECKPOINT_INTERVAL == 0:
+                self.checkpoints[tick] = state.checkpoint()
+            events = step(state, self.inputs[tick])
+            if events and on_events:
+                on_events(tick, events)
+        return state
+
+
+def describe(state):
+    lines = [f"tick {state.tick} ({state.time:.2f} s at {state.tick_rate} Hz), {len(state.bullets)} bullets"]
+    for i, player in enumerate(state.players):
+        status = "alive" if player.alive else "dead"
+        lines.append(f"  P{i + 1}: ({player.x:.1f}, {player.y:.1f}) {status}, {player.lives} lives")
+    return "\n".join(lines)
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("usage: python replay.py FILE [--tick N]")
+        return 1
+    replay = Replay(sys.argv[1])
+    header = replay.header
+    print(f"seed {header['seed']}, {header['players']} players, {len(replay.inputs)} ticks at {header['tick_rate']} Hz")
+
+    if "--tick" in sys.argv:
+        tick = int(sys.argv[sys.argv.index("--tick") + 1])
+        print(describe(replay.run(tick)))
+        return 0
+
+    def print_hits(tick, events):
+        for event in events:
+            print(f"  tick {tick}: P{event['owner'] + 1} hit P{event['player'] + 1}")
+
+    start = time.perf_counter()
+    state = replay.run(on_events=print_hits)
+    elapsed = time.perf_counter() - start
+    print(describe(state))
+    winner = state.winner()
+    print("winner:", "none" if winner is None else f"P{winner + 1}")
+    print(f"replayed at {len(replay.inputs) / max(elapsed, 1e-9):.0f} ticks/s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,9 +9,9 @@ if [ ! -d "venv" ]; then
     python3 -m venv venv
 fi
 
-# Activate venv and install pygame if needed
+# Activate venv and install dependencies if needed
 source venv/bin/activate
-pip install pygame --quiet
+pip install pygame numpy --quiet
 
 # Run the game
 python game.py
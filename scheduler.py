@@ -0,0 +1,73 @@
+"""Tick-driven timers for the simulation.
+
+Anything that happens later in a match (a respawn, a power-up despawning,
+the next power-up spawn) is scheduled for a tick number instead of being
+polled on every entity every tick. Timers sit in a heap ordered by
+(tick, order), so scheduling and firing are O(log n) and a tick with
+nothing due costs one comparison.
+
+A timer names its action and carries plain arguments instead of holding
+a callback, so the whole schedule is JSON data: it goes into
+`GameState.checkpoint()` and comes back out exactly, and the handler is
+looked up by name when the timer fires.
+"""
+import heapq
+
+
+class Scheduler:
+    def __init__(self):
+        self.heap = []  # [tick, order, action, args, interval]; order breaks ties first-scheduled-first
+        self.pending = {}  # order -> heap entry, for cancelling
+        self.next_order = 0
+
+    def __len__(self):
+        return len(self.pending)
+
+    def schedule(self, tick, action, *args, interval=None):
+        """Fire `action(*args)` at the start of `tick`, then every `interval` ticks if given.
+
+        Returns a timer id for `cancel`.
+        """
+        if interval is not None and interval < 1:
+            raise ValueError("interval must be at least one tick")
+        entry = [tick, self.next_order, action, list(args), interval]
+        self.next_order += 1
+        heapq.heappush(self.heap, entry)
+        self.pending[entry[1]] = entry
+        return entry[1]
+
+    def cancel(self, timer_id):
+        """Stop a timer. It stays in the heap, inert, until it comes due."""
+        entry = self.pending.pop(timer_id, None)
+        if entry is not None:
+            entry[2] = None
+
+    def pop_due(self, tick):
+        """(action, args) of every timer due at or before `tick`, in firing order.
+
+        Recurring timers are put back for their next tick.
+        """
+        heap = self.heap
+        fired = []
+        while heap and heap[0][0] <= tick:
+            entry = heapq.heappop(heap)
+            if entry[2] is None:
+                continue  # Cancelled
+            fired.append((entry[2], entry[3]))
+            if entry[4] is None:
+                del self.pending[entry[1]]
+            else:
+                entry[0] += entry[4]
+                heapq.heappush(heap, entry)
+        return fired
+
+    def to_dict(self):
+        timers = [[tick, order, action, list(args), interval]
+                  for tick, order, action, args, interval in sorted(self.pending.values())]
+        return {"next_order": self.next_order, "timers": timers}
+
+    def from_dict(self, data):
+        self.heap = [[tick, order, action, list(args), interval]  # Sorted, so already a heap
+                     for tick, order, action, args, interval in data["timers"]]
+        self.pending = {entry[1]: entry for entry in self.heap}
+        self.next_order = data["next_order"]
@@ -0,0 +1,305 @@
+"""Headless dedicated server: many matches in one process.
+
+    python server.py --port 5555 --lives 3 --players 2 --tick-rate 30
+    python server.py --players 8 --world 2400x1800   # bigger arena for bigger rooms
+
+Players join with the normal game's JOIN mode. Connections are grouped
+into rooms of --players as they arrive and every room is stepped from one fixed-rate
+tick loop, so nobody has to host a match on their own desktop. Clients
+render at their own frame rate whatever --tick-rate is.
+
+Every STATUS_INTERVAL the log gets a line of tick timings and one of
+connection health across all players: round trip, jitter, bandwidth and
+skipped snapshots (see telemetry.py).
+"""
+import argparse
+import asyncio
+import time
+
+from mapgen import MAP_POOL_SIZE, MapCache
+from network import FRAME, MAX_FRAME_SIZE, SnapshotFanout, decode_input_packet, decode_payload, encode_frame
+from prediction import InputQueue
+from replay import Recorder, recording_path
+from sim import (WIDTH, HEIGHT, FORFEIT, MAX_PLAYERS, MAX_REWIND, TICK_RATE, GameState, Obstacle, obstacle_count,
+                 parse_world, start_positions, step)
+from telemetry import LinkStats, ping_message, pong_message
+
+MAX_WRITE_BUFFER = 0  # Bytes asyncio may still be holding before a snapshot is skipped
+MAX_EVENT_BUFFER = 1 << 18  # Bytes held for a peer that stopped reading before it is dropped
+STATUS_INTERVAL = 10.0  # Seconds between status log lines
+
+
+class Connection:
+    """One connected player."""
+
+    def __init__(self, reader, writer, tick_rate=TICK_RATE):
+        self.reader = reader
+        self.writer = writer
+        self.addr = writer.get_extra_info("peername")
+        self.inputs = InputQueue(tick_rate)
+        self.room = None
+        self.index = None  # Player index inside the room
+        self.skipped = 0  # Snapshots dropped because the peer was behind
+        self.open = True
+        self.dt = 1.0 / tick_rate
+        self.stats = LinkStats(f"{self.addr[0]}:{self.addr[1]}" if self.addr else "")
+
+    def write(self, data, event=False):
+        frame = encode_frame(data, event)
+        self.writer.write(frame)
+        self.stats.sent(len(frame))
+
+    def send(self, data, event=False):
+        """Send an event or reply; events can't be skipped, so a peer too far behind is dropped."""
+        if not self.open:
+            return
+        if self.writer.transport.get_write_buffer_size() > MAX_EVENT_BUFFER:
+            print(f"Dropping {self.addr}: stopped reading")
+            self.open = False
+            self.writer.transport.abort()  # close() would keep the backlog until it drains
+            return
+        self.write(data, event)
+
+    def send_snapshot(self, data):
+        """Send an encoded snapshot unless the peer is still draining older ones.
+
+        Never waits: a slow peer simply gets the next, newer snapshot.
+        """
+        if not self.open:
+            return
+        if self.writer.transport.get_write_buffer_size() > MAX_WRITE_BUFFER:
+            self.skipped += 1
+            self.stats.dropped_out += 1
+            return
+        self.write(data)
+
+    def close(self):
+        if self.open:
+            self.open = False
+            self.writer.close()
+
+    async def read_messages(self):
+        """Feed input packets into the queue until the peer disconnects; answer pings."""
+        try:
+            while True:
+                length, flags = FRAME.unpack(await self.reader.readexactly(FRAME.size))
+                if length > MAX_FRAME_SIZE:
+                    break
+                message = decode_payload(await self.reader.readexactly(length), flags)
+                self.stats.received(FRAME.size + length)
+                if isinstance(message, bytes):
+                    seq, ack, changes = decode_input_packet(message)
+                    self.stats.on_arrival(seq * self.dt)  # Input seqs count the client's ticks
+                    self.inputs.add(seq, changes)
+                    if ack is not None and self.room:
+                        self.room.fanout.ack(self.index, ack)
+                elif isinstance(message, dict) and message.get("type") == "ping":
+                    self.send(pong_message(message), event=True)
+                elif isinstance(message, dict) and message.get("type") == "pong":
+                    self.stats.on_pong(message)
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        self.open = False
+
+
+class Room:
+    """One match between a full room of connections."""
+
+    def __init__(self, connections, num_lives, record_dir=None, game_map=None, tick_rate=TICK_RATE,
+                 world=(WIDTH, HEIGHT), max_rewind=MAX_REWIND):
+        self.connections = connections
+        width, height = world
+        if game_map:
+            seed, rects = game_map
+            self.state = GameState(num_lives, obstacles=[Obstacle(*rect) for rect in rects],
+                                   num_players=len(connections), seed=seed, tick_rate=tick_rate,
+                                   width=width, height=height, max_rewind=max_rewind)
+        else:
+            self.state = GameState(num_lives, num_players=len(connections), tick_rate=tick_rate,
+                                   width=width, height=height, max_rewind=max_rewind)
+        self.recorder = None
+        if record_dir:
+            self.recorder = Recorder(recording_path(record_dir, self.state), self.state, num_lives)
+        # Client index is player index; in a big world each client only gets what is near it
+        self.fanout = SnapshotFanout(tick_rate, world, {i: i for i in range(len(connections))})
+        self.departed = set()  # Player indices whose connection closed; they forfeit
+        self.finished = False
+        obstacles = [o.to_dict() for o in self.state.obstacles]
+        for i, conn in enumerate(connections):
+            conn.room = self
+            conn.index = i
+            conn.send({"type": "start", "player": i, "players": len(connections), "lives": num_lives,
+                       "tick_rate": tick_rate, "world": list(world), "obstacles": obstacles}, event=True)
+
+    def tick(self):
+        state = self.state
+        for conn in self.connections:
+            if not conn.open and conn.index not in self.departed:
+                self.departed.add(conn.index)
+                self.fanout.remove(conn.index)
+        # A player who left forfeits (recorded, so replays agree); when one is left they win
+        inputs = [FORFEIT if conn.index in self.departed else conn.inputs.pop() for conn in self.connections]
+        if self.recorder:
+            self.recorder.record(inputs)
+        step(state, inputs)
+
+        # Encoded once for the whole room (once per client in a big world)
+        connected = [conn for conn in self.connections if conn.open]
+        snapshots = self.fanout.encode(state.to_dict(),
+                                       {conn.index: conn.inputs.last_applied for conn in connected})
+        for conn in connected:
+            conn.send_snapshot(snapshots[conn.index])
+
+        if state.is_over():
+            self.finish(state.winner())
+
+    def finish(self, winner):
+        for conn in self.connections:
+            conn.send({"type": "game_over", "winner": winner}, event=True)
+            conn.close()
+        if self.recorder:
+            self.recorder.close()
+        self.finished = True
+
+
+class MatchServer:
+    def __init__(self, num_lives=3, room_size=2, tick_rate=TICK_RATE, record_dir=None, map_dir=None,
+                 world=(WIDTH, HEIGHT), max_rewind=MAX_REWIND):
+        self.num_lives = num_lives
+        self.room_size = room_size
+        self.world = world
+        self.max_rewind = max_rewind
+        self.record_dir = record_dir
+        self.maps = []  # (seed, obstacle rects) pool, loaded up front from the map cache
+        self.rooms_started = 0
+        if map_dir:
+            self.load_maps(map_dir)
+        self.tick_rate = tick_rate
+        self.waiting = []
+        self.rooms = []
+        self.connections = set()  # Every open connection, for pings and telemetry
+        self.tick_times = []  # Seconds spent per tick since the last status line
+
+    def load_maps(self, map_dir, count=MAP_POOL_SIZE):
+        """Fill the map pool from `map_dir`, generating (and caching) any missing map."""
+        start = time.perf_counter()
+        cache = MapCache(map_dir)
+        width, height = self.world
+        spawns = start_positions(self.room_size, width, height)
+        count_per_map = obstacle_count(width, height)
+        self.maps = []
+        for seed in range(count):
+            try:
+                self.maps.append((seed, cache.get(seed, count_per_map, width, height, spawns)))
+            except ValueError as e:
+                print(f"Skipping map {seed}: {e}")
+        print(f"Loaded {len(self.maps)} maps from {map_dir} in {time.perf_counter() - start:.2f} s")
+
+    def next_map(self):
+        if not self.maps:
+            return None
+        return self.maps[self.rooms_started % len(self.maps)]
+
+    async def handle(self, reader, writer):
+        conn = Connection(reader, writer, self.tick_rate)
+        print(f"Player connected from {conn.addr}")
+        self.connections.add(conn)
+        self.waiting.append(conn)
+        if len(self.waiting) >= self.room_size:
+            players, self.waiting = self.waiting[:self.room_size], self.waiting[self.room_size:]
+            self.rooms.append(Room(players, self.num_lives, self.record_dir, self.next_map(), self.tick_rate,
+                                   self.world, self.max_rewind))
+            self.rooms_started += 1
+        await conn.read_messages()
+        if conn in self.waiting:
+            self.waiting.remove(conn)
+        self.connections.discard(conn)
+        conn.close()
+
+    def tick(self):
+        for room in self.rooms:
+            room.tick()
+        self.rooms = [room for room in self.rooms if not room.finished]
+        now = time.monotonic()
+        for conn in self.connections:
+            if conn.open and conn.stats.ping_due(now):
+                conn.send(ping_message(now), event=True)
+
+    async def run_ticks(self):
+        """Step every room at a fixed rate from a single scheduler."""
+        loop = asyncio.get_running_loop()
+        interval = 1.0 / self.tick_rate
+        next_tick = loop.time()
+        last_status = time.monotonic()
+        while True:
+            start = time.perf_counter()
+            self.tick()
+            self.tick_times.append(time.perf_counter() - start)
+
+            next_tick += interval
+            delay = next_tick - loop.time()
+            if delay < -interval:
+                next_tick = loop.time()  # Too far behind: drop ticks rather than spiral
+            await asyncio.sleep(max(delay, 0))
+
+            if time.monotonic() - last_status >= STATUS_INTERVAL:
+                last_status = time.monotonic()
+                self.log_status()
+
+    def log_status(self):
+        times = self.tick_times or [0.0]
+        average = sum(times) / len(times) * 1000
+        print(f"{len(self.rooms)} matches, {len(self.waiting)} waiting, "
+              f"tick avg {average:.2f} ms / max {max(times) * 1000:.2f} ms")
+        self.tick_times = []
+
+        links = [conn.stats for conn in self.connections]
+        if not links:
+            return
+        rates = [stats.sample() for stats in links]
+        rtts = sorted(stats.rtt for stats in links if stats.rtt is not None)
+        rtt = f"{rtts[len(rtts) // 2] * 1000:.1f} / {rtts[-1] * 1000:.1f} ms" if rtts else "--"
+        print(f"{len(links)} links: rtt median / max {rtt}, "
+              f"jitter max {max(stats.jitter for stats in links) * 1000:.1f} ms, "
+              f"in {sum(r.get('bytes_in', 0) for r in rates) / 1024:.1f} KB/s "
+              f"({sum(r.get('messages_in', 0) for r in rates):.0f} msg/s), "
+              f"out {sum(r.get('bytes_out', 0) for r in rates) / 1024:.1f} KB/s "
+              f"({sum(r.get('messages_out', 0) for r in rates):.0f} msg/s), "
+              f"{sum(stats.dropped_out for stats in links)} snapshots skipped")
+
+    async def serve(self, host, port, ready=None):
+        """Listen and run ticks until cancelled; `ready` is called once the port is open."""
+        server = await asyncio.start_server(self.handle, host, port)
+        print(f"Dedicated server listening on {host}:{port} at {self.tick_rate} Hz")
+        if ready:
+            ready()
+        async with server:
+            await self.run_ticks()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dot Dodger dedicated server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5555)
+    parser.add_argument("--lives", type=int, default=3)
+    parser.add_argument("--players", type=int, default=2, choices=range(2, MAX_PLAYERS + 1),
+                        metavar="N", help=f"players per match, 2-{MAX_PLAYERS}")
+    parser.add_argument("--record", metavar="DIR", help="write a replay file per match into DIR")
+    parser.add_argument("--maps", metavar="DIR", help="map cache; maps are loaded at startup, not per match")
+    parser.add_argument("--tick-rate", type=int, default=TICK_RATE, metavar="HZ",
+                        help="simulation ticks per second (lower saves CPU)")
+    parser.add_argument("--world", type=parse_world, default=(WIDTH, HEIGHT), metavar="WxH",
+                        help=f"arena size in pixels (default {WIDTH}x{HEIGHT}, the window size)")
+    parser.add_argument("--max-rewind", type=float, default=MAX_REWIND, metavar="SECONDS",
+                        help=f"longest lag compensation for a player's shots (default {MAX_REWIND}, 0 = off)")
+    args = parser.parse_args()
+    server = MatchServer(args.lives, args.players, args.tick_rate, record_dir=args.record, map_dir=args.maps,
+                         world=args.world, max_rewind=args.max_rewind)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,506 @@
+"""Headless game simulation.
+
+Everything needed to run a match without a display: the entities, the
+collision helpers, map generation and a single `step()` tick. Nothing in
+here may import pygame so servers and batch jobs can use it directly.
+"""
+import functools
+import math
+import random
+
+import mapgen
+from bullet_pool import BULLET_SPEED, BulletPool
+from history import PositionHistory
+from navigation import NavGrid
+from scheduler import Scheduler
+from spatial import SpatialGrid
+
+WIDTH, HEIGHT = 800, 600  # Default world size
+VIEW_WIDTH, VIEW_HEIGHT = 800, 600  # The part of the world a player sees (the window)
+MAX_WORLD_SIZE = 16000  # Input packets carry shot targets in 16 bits of quarter pixels
+OBSTACLE_COUNT = 8  # Obstacles in a default-sized world; bigger worlds get more by area
+TICK_RATE = 60  # Default simulation ticks per second; speeds below are per second
+RESPAWN_DELAY = 1.0  # Seconds before a hit player comes back
+MAX_REWIND = 0.25  # Longest a remote player's shots are lag compensated, in seconds (0 = never)
+MAX_PLAYERS = 16
+PLAYER_SPEED = 300
+BOT_SPEED = 120
+BOT_FIRE_INTERVAL = 1.5
+DEFAULT_BOT = "hunter"
+
+
+class Obstacle:
+    def __init__(self, x, y, width, height):
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+
+    def to_dict(self):
+        return {"x": self.x, "y": self.y, "width": self.width, "height": self.height}
+
+    @staticmethod
+    def from_dict(data):
+        return Obstacle(data["x"], data["y"], data["width"], data["height"])
+
+
+class Player:
+    def __init__(self, x, y, color=None, start_x=None, start_y=None):
+        self.x = x
+        self.y = y
+        self.start_x = start_x if start_x else x
+        self.start_y = start_y if start_y else y
+        self.color = color
+        self.prev_x = x  # Position at the start of the last tick, for drawing between ticks
+        self.prev_y = y
+        self.radius = 15
+        self.speed = PLAYER_SPEED
+        self.alive = True
+        self.lives = 3  # Default, will be set by game
+        self.last_shot = 0  # Tick of the last shot; only used by bots
+
+    def respawn(self):
+        """Reset position after being hit."""
+        self.x = self.prev_x = self.start_x
+        self.y = self.prev_y = self.start_y
+        self.alive = True
+
+    def move_with_input(self, input_data, obstacles=None, dt=1.0 / TICK_RATE, width=WIDTH, height=HEIGHT):
+        """Move for one `dt`-second tick based on an input dict (see `make_input`),
+        staying inside a `width` x `height` world."""
+        if not self.alive or not input_data:
+            return
+
+        old_x, old_y = self.x, self.y
+        distance = self.speed * dt
+        keys = input_data.get("keys", {})
+        if keys.get("left"):
+            self.x -= distance
+        if keys.get("right"):
+            self.x += distance
+        if keys.get("up"):
+            self.y -= distance
+        if keys.get("down"):
+            self.y += distance
+
+        # Check boundaries
+        self.x = max(self.radius, min(width - self.radius, self.x))
+        self.y = max(self.radius, min(height - self.radius, self.y))
+
+        # Check obstacle collisions
+        if obstacles:
+            for obstacle in nearby(obstacles, self.x, self.y, self.radius):
+                if check_circle_rect_collision(self, obstacle):
+                    self.x, self.y = old_x, old_y
+                    break
+
+    def to_dict(self):
+        return {"x": self.x, "y": self.y, "alive": self.alive, "lives": self.lives}
+
+    def from_dict(self, data):
+        self.x = data["x"]
+        self.y = data["y"]
+        self.alive = data["alive"]
+        self.lives = data.get("lives", self.lives)
+
+
+class Bullet:
+    def __init__(self, x, y, target_x, target_y, owner):
+        self.x = x
+        self.y = y
+        self.radius = 5
+        self.speed = BULLET_SPEED
+        self.owner = owner  # Index of the player who fired
+        self.id = 0  # Assigned by GameState.spawn_bullet
+        dx = target_x - x
+        dy = target_y - y
+        dist = max((dx**2 + dy**2) ** 0.5, 1)
+        self.vx = (dx / dist) * self.speed
+        self.vy = (dy / dist) * self.speed
+
+    def update(self, dt=1.0 / TICK_RATE):
+        self.x += self.vx * dt
+        self.y += self.vy * dt
+
+    def off_screen(self, width=WIDTH, height=HEIGHT):
+        return self.x < 0 or self.x > width or self.y < 0 or self.y > height
+
+    def hits_obstacle(self, obstacles):
+        if obstacles:
+            for obstacle in nearby(obstacles, self.x, self.y, self.radius):
+                if check_circle_rect_collision(self, obstacle):
+                    return True
+        return False
+
+    def to_dict(self):
+        return {"id": self.id, "x": self.x, "y": self.y, "vx": self.vx, "vy": self.vy, "owner": self.owner}
+
+    @staticmethod
+    def from_dict(data):
+        b = Bullet(data["x"], data["y"], data["x"] + data["vx"], data["y"] + data["vy"], data["owner"])
+        b.vx = data["vx"]
+        b.vy = data["vy"]
+        b.id = data.get("id", 0)
+        return b
+
+
+class Circle:
+    """Bare position + radius, for collision checks against a spot on the map."""
+
+    def __init__(self, x, y, radius):
+        self.x = x
+        self.y = y
+        self.radius = radius
+
+
+def nearby(obstacles, x, y, radius):
+    """Obstacles that might touch a circle. A SpatialGrid narrows the search."""
+    if isinstance(obstacles, SpatialGrid):
+        return obstacles.query(x, y, radius)
+    return obstacles
+
+
+def check_collision(obj1, obj2):
+    dx = obj1.x - obj2.x
+    dy = obj1.y - obj2.y
+    dist = (dx**2 + dy**2) ** 0.5
+    return dist < obj1.radius + obj2.radius
+
+
+def check_circle_rect_collision(circle, rect):
+    closest_x = max(rect.x, min(circle.x, rect.x + rect.width))
+    closest_y = max(rect.y, min(circle.y, rect.y + rect.height))
+    dx = circle.x - closest_x
+    dy = circle.y - closest_y
+    return (dx * dx + dy * dy) < (circle.radius * circle.radius)
+
+
+def start_positions(count=2, width=WIDTH, height=HEIGHT):
+    """Spawn points for `count` players, spread on an ellipse around the centre.
+
+    Two players get the classic left/right spots.
+    """
+    radius_x, radius_y = width // 2 - 200, height // 2 - 150
+    positions = []
+    for i in range(count):
+        angle = math.pi + 2 * math.pi * i / count
+        positions.append((round(width // 2 + radius_x * math.cos(angle)),
+                          round(height // 2 + radius_y * math.sin(angle))))
+    return positions
+
+
+def obstacle_count(width=WIDTH, height=HEIGHT):
+    """Obstacles for a world this size: OBSTACLE_COUNT per default-sized area."""
+    return max(OBSTACLE_COUNT, round(OBSTACLE_COUNT * width * height / (WIDTH * HEIGHT)))
+
+
+def generate_obstacles(num_obstacles=OBSTACLE_COUNT, spawns=None, rng=random, width=WIDTH, height=HEIGHT):
+    """Non-overlapping obstacles that leave every spawn clear and reachable (see mapgen)."""
+    rects = mapgen.generate(num_obstacles, width, height, spawns or start_positions(2, width, height), rng)
+    return [Obstacle(*rect) for rect in rects]
+
+
+def view_origin(x, y, width=WIDTH, height=HEIGHT):
+    """Top-left corner of the view centred on (x, y), kept inside the world."""
+    left = min(max(x - VIEW_WIDTH / 2, 0), max(width - VIEW_WIDTH, 0))
+    top = min(max(y - VIEW_HEIGHT / 2, 0), max(height - VIEW_HEIGHT, 0))
+    return left, top
+
+
+def parse_world(text):
+    """(width, height) from "WIDTHxHEIGHT", for the --world flags."""
+    width, _, height = text.lower().partition("x")
+    width, height = int(width), int(height)
+    if not (VIEW_WIDTH <= width <= MAX_WORLD_SIZE and VIEW_HEIGHT <= height <= MAX_WORLD_SIZE):
+        raise ValueError(f"world size must be between {VIEW_WIDTH}x{VIEW_HEIGHT} and "
+                         f"{MAX_WORLD_SIZE}x{MAX_WORLD_SIZE}")
+    return width, height
+
+
+def make_input(left=False, right=False, up=False, down=False, shoot=None, view=None, forfeit=False):
+    """Build an input dict in the format `step` and the network layer use.
+
+    `view` is the snapshot tick a remote player was looking at when they
+    fired, so the shot can be lag compensated (see history.py). `forfeit`
+    takes a player who left out of the match for good.
+    """
+    input_data = {
+        "keys": {"left": left, "right": right, "up": up, "down": down},
+        "shoot": shoot,
+    }
+    if view is not None:
+        input_data["view"] = view
+    if forfeit:
+        input_data["forfeit"] = True
+    return input_data
+
+
+FORFEIT = make_input(forfeit=True)  # Input for a player whose connection closed
+
+
+class GameState:
+    """Everything that changes during a match."""
+
+    def __init__(self, num_lives=3, obstacles=None, bots=(), num_players=2, seed=None, tick_rate=TICK_RATE,
+                 width=WIDTH, height=HEIGHT, max_rewind=MAX_REWIND):
+        self.width = width
+        self.height = height
+        spawns = start_positions(num_players, width, height)
+        # The map comes from its own seeded RNG so a recording can rebuild it
+        self.seed = random.randrange(2**32) if seed is None else seed
+        self.players = [Player(x, y) for x, y in spawns]
+        for player in self.players:
+            player.lives = num_lives
+        self.bullets = BulletPool()
+        self.next_bullet_id = 0
+        count = obstacle_count(width, height)
+        while obstacles is None:
+            try:
+                obstacles = generate_obstacles(count, spawns, random.Random(self.seed), width, height)
+            except ValueError as e:
+                # Too many spawns for the world to fit them all: a sparser map rather than no match
+                print(f"Map {self.seed}: {e}, using {count // 2} obstacles")
+                count //= 2
+        self.obstacles = obstacles
+        self.obstacle_grid = SpatialGrid(self.obstacles)  # Built once per map
+        self.bullets.set_obstacles(self.obstacles, width, height, travel=BULLET_SPEED / tick_rate)
+        # Player index -> BOT_POLICIES name; a plain list of indices means the default bot
+        self.bots = dict(bots) if isinstance(bots, dict) else {i: DEFAULT_BOT for i in bots}
+        self.nav = None  # NavGrid for this map, built the first time a bot needs it
+        self.tick_rate = tick_rate
+        self.dt = 1.0 / tick_rate  # Seconds per step
+        self.tick = 0
+        self.time = 0.0  # Simulation seconds, advances dt per step
+        self.timers = Scheduler()  # Fires TIMER_ACTIONS at the start of a tick
+        self.max_rewind = max_rewind
+        # Player positions of recent snapshot ticks, for lag compensation
+        self.history = PositionHistory(self.ticks(max_rewind) if max_rewind > 0 else 0, num_players)
+
+    def ticks(self, seconds):
+        """Whole ticks that cover `seconds`, at least one."""
+        return max(1, math.ceil(round(seconds * self.tick_rate, 6)))
+
+    def after(self, seconds, action, *args):
+        """Schedule a TIMER_ACTIONS entry `seconds` from now; returns its timer id."""
+        return self.timers.schedule(self.tick + self.ticks(seconds), action, *args)
+
+    def navigation(self):
+        if self.nav is None:
+            self.nav = NavGrid(self.obstacles, self.width, self.height)
+        return self.nav
+
+    def spawn_bullet(self, x, y, target_x, target_y, owner, view=None):
+        """Fire a bullet and return its id; `view` is the snapshot tick the shooter saw."""
+        bullet_id = self.next_bullet_id
+        self.next_bullet_id += 1
+        # This tick's positions go out in snapshot tick + 1
+        rewind = self.history.rewind(self.tick + 1, view)
+        self.bullets.spawn(x, y, target_x, target_y, owner, bullet_id, rewind=rewind)
+        return bullet_id
+
+    def remaining(self):
+        """Indices of players who are still in the match."""
+        return [i for i, p in enumerate(self.players) if p.lives > 0 or p.alive]
+
+    def is_over(self):
+        return len(self.remaining()) <= 1
+
+    def winner(self):
+        """Index of the winning player, or None while playing / on a draw."""
+        remaining = self.remaining()
+        return remaining[0] if len(remaining) == 1 else None
+
+    def to_dict(self):
+        return {
+            "tick": self.tick,
+            "time": self.time,
+            "players": [p.to_dict() for p in self.players],
+            "bullets": self.bullets.to_dicts(),
+        }
+
+    def from_dict(self, data):
+        self.tick = data.get("tick", self.tick)
+        self.time = data.get("time", self.time)
+        for player, player_data in zip(self.players, data["players"]):
+            player.from_dict(player_data)
+        self.bullets.from_dicts(data["bullets"])
+
+    def checkpoint(self):
+        """`to_dict` plus the hidden timers and history, enough to resume stepping exactly."""
+        data = self.to_dict()
+        data["bullets"] = self.bullets.to_dicts(rewind=True)
+        data["next_bullet_id"] = self.next_bullet_id
+        data["timers"] = self.timers.to_dict()
+        data["history"] = self.history.to_dict()
+        for player, player_data in zip(self.players, data["players"]):
+            player_data["last_shot"] = player.last_shot
+        return data
+
+    def restore(self, data):
+        """Undo to a `checkpoint()` of this match."""
+        self.from_dict(data)
+        self.next_bullet_id = data["next_bullet_id"]
+        self.timers.from_dict(data["timers"])
+        self.history.from_dict(data["history"])
+        for player, player_data in zip(self.players, data["players"]):
+            player.last_shot = player_data["last_shot"]
+
+
+def nearest_opponent(state, index):
+    """Closest living player other than `index`, or None."""
+    me = state.players[index]
+    others = [p for i, p in enumerate(state.players) if i != index and p.alive]
+    if not others:
+        return None
+    return min(others, key=lambda p: (p.x - me.x) ** 2 + (p.y - me.y) ** 2)
+
+
+def bot_think(state, bot, target, speed=BOT_SPEED, fire_interval=BOT_FIRE_INTERVAL):
+    """Simple bot: move toward the target, shoot periodically.
+
+    Returns a shoot target when the bot fires this tick, otherwise None.
+    """
+    if not (bot.alive and target and target.alive):
+        return None
+    dx = target.x - bot.x
+    dy = target.y - bot.y
+    dist = max((dx**2 + dy**2) ** 0.5, 1)
+    bot.x += (dx / dist) * speed * state.dt  # Slower than player by default
+    bot.y += (dy / dist) * speed * state.dt
+    bot.x = max(bot.radius, min(state.width - bot.radius, bot.x))
+    bot.y = max(bot.radius, min(state.height - bot.radius, bot.y))
+
+    if state.tick - bot.last_shot >= state.ticks(fire_interval):
+        bot.last_shot = state.tick
+        return (target.x, target.y)
+    return None
+
+
+def strafe_think(state, bot, target, distance=200, speed=180, fire_interval=1.0):
+    """Bot that circles the target at `distance`, switching direction every 2 s."""
+    if not (bot.alive and target and target.alive):
+        return None
+    dx = target.x - bot.x
+    dy = target.y - bot.y
+    dist = max((dx**2 + dy**2) ** 0.5, 1)
+    ux, uy = dx / dist, dy / dist
+    side = 1 if int(state.time / 2) % 2 == 0 else -1
+    approach = max(-1.0, min(1.0, (dist - distance) / distance))
+    bot.x += (ux * approach - uy * side) * speed * state.dt
+    bot.y += (uy * approach + ux * side) * speed * state.dt
+    bot.x = max(bot.radius, min(state.width - bot.radius, bot.x))
+    bot.y = max(bot.radius, min(state.height - bot.radius, bot.y))
+
+    if state.tick - bot.last_shot >= state.ticks(fire_interval):
+        bot.last_shot = state.tick
+        return (target.x, target.y)
+    return None
+
+
+def hunt_think(state, bot, target, speed=BOT_SPEED, fire_interval=BOT_FIRE_INTERVAL):
+    """Bot that walks around obstacles to the target and only fires with a clear shot."""
+    if not (bot.alive and target and target.alive):
+        return None
+    nav = state.navigation()
+    goal_x, goal_y = nav.step_toward(bot.x, bot.y, target.x, target.y)
+    dx = goal_x - bot.x
+    dy = goal_y - bot.y
+    scale = speed * state.dt / max((dx**2 + dy**2) ** 0.5, 1)
+    # Slide along an obstacle rather than stopping dead: try both axes, then each alone
+    old_x, old_y = bot.x, bot.y
+    for move_x, move_y in ((dx, dy), (dx, 0), (0, dy)):
+        bot.x = max(bot.radius, min(state.width - bot.radius, old_x + move_x * scale))
+        bot.y = max(bot.radius, min(state.height - bot.radius, old_y + move_y * scale))
+        if not any(check_circle_rect_collision(bot, o)
+                   for o in nearby(state.obstacle_grid, bot.x, bot.y, bot.radius)):
+            break
+    else:
+        bot.x, bot.y = old_x, old_y
+
+    reloaded = state.tick - bot.last_shot >= state.ticks(fire_interval)
+    if reloaded and nav.can_see(bot.x, bot.y, target.x, target.y):
+        bot.last_shot = state.tick
+        return (target.x, target.y)
+    return None
+
+
+# Bot behaviours by name, for GameState(bots={index: name}) and tournament.py
+BOT_POLICIES = {
+    "hunter": hunt_think,
+    "chaser": bot_think,
+    "rusher": functools.partial(bot_think, speed=210, fire_interval=2.0),
+    "sniper": functools.partial(bot_think, speed=60, fire_interval=0.75),
+    "strafer": strafe_think,
+}
+
+
+def respawn(state, index):
+    """Timer action: bring a hit player back (unless they left the match meanwhile)."""
+    if state.players[index].lives <= 0:
+        return
+    state.players[index].respawn()
+    if len(state.players) == 2:
+        state.bullets.clear()  # Duels restart clean; free-for-all keeps going
+
+
+# Scheduler actions by name, so timers stay plain data (see scheduler.py)
+TIMER_ACTIONS = {
+    "respawn": respawn,
+}
+
+
+def step(state, inputs, profiler=None):
+    """Advance the match by one tick of `state.dt` seconds.
+
+    `inputs` holds one input dict (or None) per player; entries for bot
+    players are ignored. Returns a list of event dicts for hits this tick.
+    An optional `profiler.Profiler` gets a mark after each phase.
+    """
+    players = state.players
+    obstacles = state.obstacle_grid
+    events = []
+
+    # Timers due this tick (respawns), then note where everyone starts the tick for drawing
+    for action, args in state.timers.pop_due(state.tick):
+        TIMER_ACTIONS[action](state, *args)
+    for player in players:
+        player.prev_x, player.prev_y = player.x, player.y
+
+    for i, player in enumerate(players):
+        if i in state.bots:
+            shoot_target = BOT_POLICIES[state.bots[i]](state, player, nearest_opponent(state, i))
+            view = None
+        else:
+            input_data = inputs[i] if i < len(inputs) else None
+            if input_data and input_data.get("forfeit"):
+                player.lives = 0  # Left the match: out for good
+                player.alive = False
+            player.move_with_input(input_data, obstacles, state.dt, state.width, state.height)
+            shoot_target = input_data.get("shoot") if input_data else None
+            view = input_data.get("view") if input_data else None
+        if shoot_target and player.alive:
+            state.spawn_bullet(player.x, player.y, shoot_target[0], shoot_target[1], i, view)
+    state.history.record(state.tick + 1, players)
+    if profiler:
+        profiler.mark("players")  # Movement, obstacle collision, bot AI, firing
+
+    # Update bullets (lag-compensated ones against rewound players), then apply hits in the order fired
+    hits = sorted(state.bullets.update(state.width, state.height, players, state.dt, state.history))
+    if profiler:
+        profiler.mark("bullets")
+    for bullet_id, owner, victim_index, slot in hits:
+        victim = players[victim_index]
+        if not victim.alive:
+            continue  # Already hit by an earlier bullet this tick
+        victim.lives -= 1
+        victim.alive = False
+        state.bullets.remove([slot])
+        events.append({"type": "hit", "player": victim_index, "owner": owner})
+        if victim.lives > 0:
+            state.after(RESPAWN_DELAY, "respawn", victim_index)
+
+    state.tick += 1
+    state.time += state.dt
+    if profiler:
+        profiler.mark("hits")
+    return events
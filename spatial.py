@@ -0,0 +1,57 @@
+"""Uniform grid broad phase for static rectangles.
+
+Obstacles never move during a match, so the grid is built once per map and
+collision checks only look at obstacles in the cells a circle overlaps
+instead of every obstacle on the map.
+"""
+CELL_SIZE = 64
+
+
+class SpatialGrid:
+    """Buckets rectangles (anything with x, y, width, height) by grid cell.
+
+    Iterating the grid yields every rectangle, so it can stand in for the
+    plain obstacle list.
+    """
+
+    def __init__(self, items=(), cell_size=CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}  # (cx, cy) -> rectangles overlapping that cell
+        self.items = []
+        for item in items:
+            self.insert(item)
+
+    def insert(self, item):
+        self.items.append(item)
+        for key in self._cells_for(item.x, item.y, item.x + item.width, item.y + item.height):
+            self.cells.setdefault(key, []).append(item)
+
+    def _cells_for(self, left, top, right, bottom):
+        size = self.cell_size
+        for cx in range(int(left // size), int(right // size) + 1):
+            for cy in range(int(top // size), int(bottom // size) + 1):
+                yield cx, cy
+
+    def query_rect(self, left, top, right, bottom):
+        """Rectangles whose cells overlap the given box (may include near misses)."""
+        size = self.cell_size
+        x0, x1 = int(left // size), int(right // size)
+        y0, y1 = int(top // size), int(bottom // size)
+        if x0 == x1 and y0 == y1:
+            return self.cells.get((x0, y0), ())
+        found = {}
+        for cx in range(x0, x1 + 1):
+            for cy in range(y0, y1 + 1):
+                for item in self.cells.get((cx, cy), ()):
+                    found[id(item)] = item
+        return found.values()
+
+    def query(self, x, y, radius):
+        """Rectangles that might touch the circle at (x, y)."""
+        return self.query_rect(x - radius, y - radius, x + radius, y + radius)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
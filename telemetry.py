@@ -0,0 +1,158 @@
+"""Connection health for one link: round trips, clock offset, jitter, loss, bandwidth.
+
+Every endpoint in network.py (and every server.py connection) keeps a
+LinkStats per remote end and counts the bytes and messages it moves.
+On top of that the two ends exchange ping/pong events:
+
+    {"type": "ping", "sent": <sender clock>}
+    {"type": "pong", "sent": <echoed>, "time": <responder clock>}
+
+answered as soon as they are read, which gives the round-trip time and,
+NTP style, the offset between the two clocks. Clocks are
+`time.monotonic()`, so only differences mean anything.
+
+`sample()` turns the counters into per-second rates; call it about once
+a second. `to_dict()` is the API, `lines()` feeds the F3 overlay and
+`summary()` the periodic log line.
+"""
+import time
+from collections import deque
+
+PING_INTERVAL = 0.5  # Seconds between pings from each end
+LOG_INTERVAL = 10.0  # Seconds between telemetry log lines
+OFFSET_SAMPLES = 8  # Recent pings searched for the best clock offset estimate
+
+
+def ping_message(now=None):
+    return {"type": "ping", "sent": time.monotonic() if now is None else now}
+
+
+def pong_message(ping, now=None):
+    return {"type": "pong", "sent": ping.get("sent"), "time": time.monotonic() if now is None else now}
+
+
+class LinkStats:
+    def __init__(self, name=""):
+        self.name = name
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.messages_in = 0  # Frames on TCP, datagrams on UDP
+        self.messages_out = 0
+        self.dropped_in = 0  # Received state superseded, stale or undecodable
+        self.dropped_out = 0  # State replaced before it could be sent
+        self.packets_expected = 0  # UDP: sequence numbers the peer used, from the first one seen
+        self.packets_received = 0
+        self.first_seq = None
+        self.rtt = None  # Smoothed round trip in seconds (RFC 6298)
+        self.rtt_var = 0.0  # Mean deviation of the round trip
+        self.min_rtt = None
+        self.offset = None  # Remote clock minus ours, from the fastest recent ping
+        self.offset_samples = deque(maxlen=OFFSET_SAMPLES)  # (rtt, offset)
+        self.jitter = 0.0  # Interarrival jitter of the state stream in seconds (RFC 3550)
+        self.last_transit = None
+        self.rates = {}  # Per-second rates over the last sample() interval
+        self.sampled = None  # (time, counters) at the last sample()
+        self.last_ping = 0.0
+
+    def received(self, nbytes, messages=1):
+        self.bytes_in += nbytes
+        self.messages_in += messages
+
+    def sent(self, nbytes, messages=1):
+        self.bytes_out += nbytes
+        self.messages_out += messages
+
+    def on_packet(self, seq):
+        """Count a datagram sequence number; gaps are loss."""
+        if self.first_seq is None:
+            self.first_seq = seq
+        self.packets_received += 1
+        self.packets_expected = max(self.packets_expected, seq - self.first_seq + 1)
+
+    def on_arrival(self, remote_time, now=None):
+        """A state message stamped `remote_time` (sender's tick time) arrived."""
+        now = time.monotonic() if now is None else now
+        transit = now - remote_time
+        if self.last_transit is not None:
+            self.jitter += (abs(transit - self.last_transit) - self.jitter) / 16
+        self.last_transit = transit
+
+    def ping_due(self, now):
+        if now - self.last_ping < PING_INTERVAL:
+            return False
+        self.last_ping = now
+        return True
+
+    def on_pong(self, pong, now=None):
+        now = time.monotonic() if now is None else now
+        sent, remote = pong.get("sent"), pong.get("time")
+        if not isinstance(sent, (int, float)) or not isinstance(remote, (int, float)) or sent > now:
+            return
+        rtt = now - sent
+        if self.rtt is None:
+            self.rtt, self.rtt_var = rtt, rtt / 2
+        else:
+            self.rtt_var += (abs(self.rtt - rtt) - self.rtt_var) / 4
+            self.rtt += (rtt - self.rtt) / 8
+        self.min_rtt = rtt if self.min_rtt is None else min(self.min_rtt, rtt)
+        self.offset_samples.append((rtt, remote - (sent + now) / 2))
+        self.offset = min(self.offset_samples)[1]
+
+    @property
+    def loss(self):
+        """Fraction of the peer's datagrams that never arrived (0 on TCP)."""
+        if not self.packets_expected:
+            return 0.0
+        return max(0.0, 1.0 - self.packets_received / self.packets_expected)
+
+    def sample(self, now=None):
+        """Update `rates` with the counters' change per second since the last call."""
+        now = time.monotonic() if now is None else now
+        counters = (self.bytes_in, self.bytes_out, self.messages_in, self.messages_out,
+                    self.dropped_in, self.dropped_out)
+        if self.sampled is not None:
+            elapsed = now - self.sampled[0]
+            if elapsed > 0:
+                names = ("bytes_in", "bytes_out", "messages_in", "messages_out", "dropped_in", "dropped_out")
+                self.rates = {name: (new - old) / elapsed
+                              for name, new, old in zip(names, counters, self.sampled[1])}
+        self.sampled = (now, counters)
+        return self.rates
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "rtt": self.rtt,
+            "rtt_var": self.rtt_var,
+            "min_rtt": self.min_rtt,
+            "offset": self.offset,
+            "jitter": self.jitter,
+            "loss": self.loss,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "messages_in": self.messages_in,
+            "messages_out": self.messages_out,
+            "dropped_in": self.dropped_in,
+            "dropped_out": self.dropped_out,
+            "rates": dict(self.rates),
+        }
+
+    def summary(self):
+        """One line: round trip, jitter, loss, drops and bandwidth each way."""
+        rates = self.rates
+        rtt = "--" if self.rtt is None else f"{self.rtt * 1e3:.1f}"
+        return (f"{self.name or 'link'}: rtt {rtt} ms +/- {self.rtt_var * 1e3:.1f}, "
+                f"jitter {self.jitter * 1e3:.1f} ms, loss {self.loss:.1%}, "
+                f"dropped {self.dropped_in} in / {self.dropped_out} out, "
+                f"in {rates.get('bytes_in', 0) / 1024:.1f} KB/s ({rates.get('messages_in', 0):.0f} msg/s), "
+                f"out {rates.get('bytes_out', 0) / 1024:.1f} KB/s ({rates.get('messages_out', 0):.0f} msg/s)")
+
+    def lines(self):
+        """Overlay text for this link."""
+        rates = self.rates
+        rtt = "  --" if self.rtt is None else f"{self.rtt * 1e3:4.0f}"
+        return [
+            f"{self.name or 'link':<10} rtt {rtt} ms  jit {self.jitter * 1e3:4.1f}  loss {self.loss:4.1%}",
+            f"{'':<10} in {rates.get('bytes_in', 0) / 1024:5.1f} KB/s  out {rates.get('bytes_out', 0) / 1024:5.1f} KB/s"
+            f"  drop {self.dropped_in}/{self.dropped_out}",
+        ]
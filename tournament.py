@@ -0,0 +1,121 @@
+"""Headless bot-vs-bot tournaments across every CPU core.
+
+    python tournament.py                                  # every policy pairing, 200 matches each
+    python tournament.py --policies chaser,strafer --matches 5000 --lives 1,3
+    python tournament.py --json results.json              # also save per-match results
+
+Every match gets its own map seed and one of the --lives settings; each
+pairing plays both sides of the map equally often. Policies are the
+`sim.BOT_POLICIES` names.
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import time
+from multiprocessing import Pool
+
+from sim import BOT_POLICIES, TICK_RATE, GameState, step
+
+MAX_MATCH_SECONDS = 300  # Matches still running after this are draws
+
+
+def play_match(job):
+    """Run one match in a worker process and return its result dict."""
+    match_id, first, second, lives, seed, max_ticks = job
+    state = GameState(lives, bots={0: first, 1: second}, seed=seed)
+    start = time.perf_counter()
+    while not state.is_over() and state.tick < max_ticks:
+        step(state, [None, None])
+    elapsed = time.perf_counter() - start
+    winner = state.winner()
+    return {
+        "match": match_id,
+        "policies": [first, second],
+        "lives": lives,
+        "seed": seed,
+        "winner": None if winner is None else (first, second)[winner],
+        "ticks": state.tick,
+        "seconds": elapsed,
+        "worker": os.getpid(),
+    }
+
+
+def make_jobs(policies, matches, lives_options, seed, max_ticks):
+    """`matches` jobs per pairing, alternating sides, each on its own map."""
+    rng = random.Random(seed)
+    jobs = []
+    for a, b in itertools.combinations(policies, 2):
+        for n in range(matches):
+            first, second = (a, b) if n % 2 == 0 else (b, a)
+            jobs.append((len(jobs), first, second, rng.choice(lives_options), rng.randrange(2**32), max_ticks))
+    return jobs
+
+
+def summarize(results, policies):
+    """Print win rates per pairing and policy, match lengths and worker speed."""
+    print(f"\n{'pairing':<24} {'matches':>7} {'wins':>13} {'draws':>6} {'avg len s':>10}")
+    for a, b in itertools.combinations(policies, 2):
+        games = [r for r in results if set(r["policies"]) == {a, b}]
+        if not games:
+            continue
+        wins_a = sum(r["winner"] == a for r in games)
+        wins_b = sum(r["winner"] == b for r in games)
+        length = sum(r["ticks"] for r in games) / len(games) / TICK_RATE
+        print(f"{a + ' vs ' + b:<24} {len(games):>7} {wins_a:>6}-{wins_b:<6} "
+              f"{len(games) - wins_a - wins_b:>6} {length:>10.1f}")
+
+    print(f"\n{'policy':<10} {'matches':>7} {'win rate':>9}")
+    for policy in sorted(policies, key=lambda p: -sum(r["winner"] == p for r in results)):
+        games = [r for r in results if policy in r["policies"]]
+        wins = sum(r["winner"] == policy for r in games)
+        print(f"{policy:<10} {len(games):>7} {wins / max(len(games), 1):>9.1%}")
+
+    print(f"\n{'worker':>8} {'matches':>7} {'ticks/s':>9}")
+    for worker in sorted({r["worker"] for r in results}):
+        games = [r for r in results if r["worker"] == worker]
+        rate = sum(r["ticks"] for r in games) / max(sum(r["seconds"] for r in games), 1e-9)
+        print(f"{worker:>8} {len(games):>7} {rate:>9.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bot-vs-bot tournament")
+    parser.add_argument("--policies", default=",".join(BOT_POLICIES),
+                        help=f"comma-separated, from: {', '.join(BOT_POLICIES)}")
+    parser.add_argument("--matches", type=int, default=200, help="matches per pairing")
+    parser.add_argument("--lives", default="1,3,5", help="comma-separated lives settings to draw from")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--seed", type=int, default=1, help="seed for the match seeds")
+    parser.add_argument("--json", metavar="PATH", help="write every match result to PATH")
+    args = parser.parse_args()
+
+    policies = args.policies.split(",")
+    unknown = [p for p in policies if p not in BOT_POLICIES]
+    if unknown or len(policies) < 2:
+        parser.error(f"need two or more policies from: {', '.join(BOT_POLICIES)}")
+    lives_options = [int(n) for n in args.lives.split(",")]
+
+    jobs = make_jobs(policies, args.matches, lives_options, args.seed, MAX_MATCH_SECONDS * TICK_RATE)
+    print(f"{len(jobs)} matches on {args.workers} workers")
+    start = time.perf_counter()
+    results = []
+    with Pool(args.workers) as pool:
+        for result in pool.imap_unordered(play_match, jobs, chunksize=4):
+            results.append(result)
+            if len(results) % 500 == 0:
+                print(f"  {len(results)}/{len(jobs)} done")
+    elapsed = time.perf_counter() - start
+    total_ticks = sum(r["ticks"] for r in results)
+    print(f"Finished in {elapsed:.1f} s, {total_ticks / elapsed:.0f} ticks/s overall")
+
+    summarize(results, policies)
+    if args.json:
+        results.sort(key=lambda r: r["match"])
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=1)
+        print(f"\nWrote {len(results)} results to {args.json}")
+
+
+if __name__ == "__main__":
+    main()